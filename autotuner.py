@@ -0,0 +1,216 @@
+# autotuner.py
+
+import os
+import json
+import time
+import asyncio
+from pathlib import Path
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+MAX_DECISOES = 100
+
+def autotune_habilitado():
+    """Ajuste automático da concorrência de FTP e Drive (AUTOTUNE); requer ASYNC_TRANSFERS"""
+    return os.getenv('AUTOTUNE', 'false').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+# Teto da concorrência explorada por etapa (limite de conexões do eCarta / cota do Drive)
+_MAXIMOS = {"ftp": ('AUTOTUNE_MAX_FTP', 8), "drive": ('AUTOTUNE_MAX_DRIVE', 32)}
+
+def get_maximo(nome):
+    variavel, padrao = _MAXIMOS[nome]
+    try:
+        return max(1, int(os.getenv(variavel, padrao)))
+    except ValueError:
+        return padrao
+
+class ControladorConcorrencia:
+    """
+    Limite de concorrência ajustável de uma etapa (FTP ou Drive), usado como
+    portão assíncrono (async with controlador: ...). A cada janela de
+    AUTOTUNE_INTERVAL segundos compara a vazão (bytes/s) com a da janela
+    anterior e sobe a colina: se melhorou, dá mais um passo na mesma
+    direção; se piorou, inverte; dentro do ruído, mantém. Respostas de
+    sobrecarga (429, 5xx, 421 do FTP, conexão recusada) acima de
+    AUTOTUNE_THROTTLE_RATE derrubam o limite em 25%. Uma janela precisa de
+    pelo menos AUTOTUNE_MIN_SAMPLES transferências concluídas.
+    Só é usado dentro do event loop das transferências (sem lock).
+    """
+
+    def __init__(self, nome, inicial, minimo=1, maximo=16, intervalo=None, limiar_melhora=None, limiar_throttle=None):
+        self.nome = nome
+        self.minimo = max(1, int(minimo))
+        self.maximo = max(self.minimo, int(maximo))
+        self.limite = self._limitar(inicial)
+        self.inicial = self.limite
+        self.intervalo = float(intervalo or os.getenv('AUTOTUNE_INTERVAL', 2.0))
+        self.limiar_melhora = float(limiar_melhora or os.getenv('AUTOTUNE_MIN_GAIN', 0.05))
+        self.limiar_throttle = float(limiar_throttle or os.getenv('AUTOTUNE_THROTTLE_RATE', 0.02))
+        self.amostras_min = int(os.getenv('AUTOTUNE_MIN_SAMPLES', 10))
+        self.direcao = 1
+        self.decisoes = []
+        self.melhor = None  # (vazao, limite) da melhor janela sem sobrecarga
+        self._vazao_anterior = None
+        self._em_uso = 0
+        self._condicao = None
+        self._loop = None
+        self._inicio = time.monotonic()
+        self._nova_janela()
+
+    def _limitar(self, valor):
+        return max(self.minimo, min(self.maximo, int(valor)))
+
+    def _nova_janela(self):
+        self._janela = {"inicio": time.monotonic(), "bytes": 0, "concluidos": 0, "erros": 0, "throttles": 0}
+
+    def _cond(self):
+        # Uma Condition por loop: no CLI cada fase roda no seu próprio asyncio.run
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._condicao, self._em_uso = loop, asyncio.Condition(), 0
+        return self._condicao
+
+    async def __aenter__(self):
+        condicao = self._cond()
+        async with condicao:
+            await condicao.wait_for(lambda: self._em_uso < self.limite)
+            self._em_uso += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        condicao = self._cond()
+        async with condicao:
+            self._em_uso -= 1
+            condicao.notify_all()
+
+    def observar_status(self, status):
+        """Status HTTP de cada resposta do Drive: 429, 5xx e falha de conexão (None) contam como sobrecarga"""
+        if status is None or status == 429 or status >= 500:
+            self._janela["throttles"] += 1
+
+    def registrar(self, bytes_transferidos=0, erro=False, throttle=False):
+        """Resultado de uma transferência; fecha a janela e decide quando o intervalo vence"""
+        self._janela["bytes"] += bytes_transferidos
+        self._janela["concluidos" if not erro else "erros"] += 1
+        if throttle:
+            self._janela["throttles"] += 1
+        duracao = time.monotonic() - self._janela["inicio"]
+        amostras = self._janela["concluidos"] + self._janela["erros"]
+        # Janela curta demais ou com poucas transferências (menos de uma "rodada"): ainda não decide
+        if duracao >= self.intervalo and amostras >= max(self.limite, self.amostras_min):
+            self._decidir(duracao, amostras)
+
+    def _decidir(self, duracao, amostras):
+        janela = self._janela
+        vazao = janela["bytes"] / duracao
+        taxa_throttle = janela["throttles"] / amostras
+        anterior = self.limite
+
+        # Um 429 isolado é ruído; sobrecarga são dois ou mais acima da taxa limite
+        if janela["throttles"] >= 2 and taxa_throttle > self.limiar_throttle:
+            self.limite = self._limitar(min(self.limite - 1, self.limite * 0.75))
+            self.direcao = -1
+            motivo = "sobrecarga"
+        else:
+            if self.melhor is None or vazao > self.melhor[0]:
+                self.melhor = (vazao, self.limite)
+            if self._vazao_anterior is None or vazao >= self._vazao_anterior * (1 + self.limiar_melhora):
+                motivo = "melhorou"
+            elif vazao <= self._vazao_anterior * (1 - self.limiar_melhora):
+                self.direcao = -self.direcao
+                motivo = "piorou"
+            else:
+                motivo = "estavel"
+            if motivo != "estavel":
+                passo = max(1, round(self.limite * 0.25))
+                self.limite = self._limitar(self.limite + self.direcao * passo)
+                if self.limite == anterior:
+                    # Encostou no mínimo/máximo: a próxima tentativa vai na direção oposta
+                    self.direcao = -self.direcao
+
+        self._vazao_anterior = vazao if motivo != "sobrecarga" else None
+        if len(self.decisoes) < MAX_DECISOES:
+            self.decisoes.append({
+                "t": round(time.monotonic() - self._inicio, 2),
+                "de": anterior,
+                "para": self.limite,
+                "motivo": motivo,
+                "vazao_bytes_s": round(vazao),
+                "transferencias": amostras,
+                "erros": janela["erros"],
+                "throttles": janela["throttles"],
+            })
+        if self.limite != anterior:
+            logger.info(f"🎛️  Autotune {self.nome}: {anterior} -> {self.limite} ({motivo}, {vazao / 1e6:.2f} MB/s)")
+        # Um limite maior vale a partir da próxima liberação (__aexit__ acorda quem espera)
+        self._nova_janela()
+
+    def limite_aprendido(self):
+        """Ponto de partida para a próxima execução: o limite da melhor janela (ou o atual)"""
+        return self.melhor[1] if self.melhor else self.limite
+
+    def resumo(self):
+        return {
+            "inicial": self.inicial,
+            "final": self.limite,
+            "aprendido": self.limite_aprendido(),
+            "melhor_vazao_bytes_s": round(self.melhor[0]) if self.melhor else None,
+            "limites": [self.minimo, self.maximo],
+            "decisoes": self.decisoes,
+        }
+
+class AutoAjuste:
+    """
+    Controladores da execução ("ftp" e "drive") com ponto de partida lido
+    do arquivo de estado (autotune.json) e gravado de volta ao final.
+
+    Formato em disco (JSON):
+        {"ftp": {"limite": 6, "vazao_bytes_s": ..., "ts": ...}, "drive": {...}}
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.estado = {}
+        self.controladores = {}
+
+    def carregar(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                self.estado = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.estado = {}
+        except Exception as e:
+            logger.warning(f"Erro ao ler estado do autotune: {e}")
+            self.estado = {}
+        return self
+
+    def controlador(self, nome, padrao):
+        """Cria (uma vez por execução) o controlador 'nome', partindo do limite aprendido ou de 'padrao'"""
+        if nome not in self.controladores:
+            inicial = (self.estado.get(nome) or {}).get("limite") or padrao
+            self.controladores[nome] = ControladorConcorrencia(nome, inicial, maximo=get_maximo(nome))
+        return self.controladores[nome]
+
+    def salvar(self):
+        """Grava os limites aprendidos de forma atômica"""
+        for nome, controlador in self.controladores.items():
+            if not controlador.decisoes:
+                continue  # Execução curta demais para aprender algo
+            self.estado[nome] = {
+                "limite": controlador.limite_aprendido(),
+                "vazao_bytes_s": round(controlador.melhor[0]) if controlador.melhor else None,
+                "ts": time.time(),
+            }
+        try:
+            Path(os.path.dirname(self.caminho)).mkdir(parents=True, exist_ok=True)
+            caminho_tmp = self.caminho + ".tmp"
+            with open(caminho_tmp, "w", encoding="utf-8") as f:
+                json.dump(self.estado, f, ensure_ascii=False)
+            os.replace(caminho_tmp, self.caminho)
+        except Exception as e:
+            logger.warning(f"Erro ao salvar estado do autotune: {e}")
+
+    def resumo(self):
+        return {nome: controlador.resumo() for nome, controlador in self.controladores.items()}
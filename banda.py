@@ -0,0 +1,148 @@
+# banda.py
+
+import os
+import time
+import asyncio
+import threading
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+_SUFIXOS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_taxa(valor):
+    """Converte '512K', '5M', '1.5G' ou um número em bytes/s (0 = sem limite)"""
+    if valor is None or valor == "":
+        return 0
+    if isinstance(valor, (int, float)):
+        return max(0, int(valor))
+    texto = str(valor).strip().upper().removesuffix("/S").removesuffix("B")
+    multiplicador = _SUFIXOS.get(texto[-1:], 1)
+    if texto[-1:] in _SUFIXOS:
+        texto = texto[:-1]
+    return max(0, int(float(texto) * multiplicador))
+
+class LimitadorBanda:
+    """
+    Token bucket thread-safe: 'taxa' bytes/s com rajada de até 'rajada'
+    bytes. consumir() reserva os bytes e dorme o necessário fora do lock,
+    então várias threads dividem a mesma taxa; consumir_async() faz o mesmo
+    em corrotinas sem bloquear o event loop. Com taxa 0 só contabiliza.
+    """
+
+    def __init__(self, nome, taxa=0, rajada=None):
+        self.nome = nome
+        self._lock = threading.Lock()
+        self.bytes_total = 0
+        self.espera_total = 0.0
+        self._primeiro = None
+        self._ultimo = None
+        self.taxa = 0
+        self._definir(taxa, rajada)
+
+    def _definir(self, taxa, rajada):
+        with self._lock:
+            if taxa is not None:
+                self.taxa = parse_taxa(taxa)
+            # Rajada padrão: 1 segundo de taxa (mínimo 64 KB)
+            self.rajada = parse_taxa(rajada) if rajada is not None else max(64 * 1024, self.taxa)
+            self._tokens = self.rajada
+            self._atualizado = time.monotonic()
+
+    def ajustar(self, taxa=None, rajada=None):
+        """Altera taxa/rajada em tempo de execução"""
+        self._definir(taxa, rajada)
+        logger.info(f"Limite de banda '{self.nome}': {self.taxa or 'sem limite'} bytes/s (rajada {self.rajada})")
+
+    def reservar(self, quantidade):
+        """Contabiliza 'quantidade' bytes e devolve os segundos a esperar (sem dormir)"""
+        agora = time.monotonic()
+        with self._lock:
+            self.bytes_total += quantidade
+            if self._primeiro is None:
+                self._primeiro = agora
+            if not self.taxa:
+                self._ultimo = agora
+                return 0.0
+            self._tokens = min(self.rajada, self._tokens + (agora - self._atualizado) * self.taxa)
+            self._atualizado = agora
+            self._tokens -= quantidade
+            espera = -self._tokens / self.taxa if self._tokens < 0 else 0.0
+            self.espera_total += espera
+            self._ultimo = agora + espera
+        return espera
+
+    def consumir(self, quantidade):
+        espera = self.reservar(quantidade)
+        if espera > 0:
+            time.sleep(espera)
+
+    async def consumir_async(self, quantidade):
+        espera = self.reservar(quantidade)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    def marcar(self):
+        """Instantâneo dos contadores (para relatório por execução); não altera o limitador"""
+        with self._lock:
+            return {"bytes": self.bytes_total, "espera": self.espera_total, "ts": time.monotonic()}
+
+    def relatorio(self, marca):
+        """Bytes, espera e taxa obtida desde 'marca'"""
+        with self._lock:
+            bytes_periodo = self.bytes_total - marca["bytes"]
+            espera = self.espera_total - marca["espera"]
+            # Do instante da marca até o último envio (incluindo a espera agendada)
+            duracao = (self._ultimo - marca["ts"]) if bytes_periodo and self._ultimo else 0
+        return {
+            "limite_bytes_s": self.taxa,
+            "bytes": bytes_periodo,
+            "segundos_em_espera": round(espera, 3),
+            "taxa_obtida_bytes_s": round(bytes_periodo / duracao) if duracao > 0 else None
+        }
+
+    def status(self):
+        with self._lock:
+            duracao = (self._ultimo - self._primeiro) if self._primeiro is not None and self._ultimo else 0
+            return {
+                "limite_bytes_s": self.taxa,
+                "rajada_bytes": self.rajada,
+                "bytes_total": self.bytes_total,
+                "segundos_em_espera": round(self.espera_total, 3),
+                "taxa_media_bytes_s": round(self.bytes_total / duracao) if duracao > 0 else None
+            }
+
+class LeitorLimitado:
+    """Arquivo de leitura cujo read() passa pelo limitador (corpo de upload)"""
+
+    def __init__(self, arquivo, limitador):
+        self._arquivo = arquivo
+        self._limitador = limitador
+
+    def read(self, tamanho=-1):
+        dados = self._arquivo.read(tamanho)
+        if dados:
+            self._limitador.consumir(len(dados))
+        return dados
+
+    def __getattr__(self, nome):
+        return getattr(self._arquivo, nome)
+
+# ✅ Limitadores do processo (ajustáveis em tempo de execução via /admin/bandwidth)
+LIMITADORES = {
+    "ftp": LimitadorBanda("ftp", os.getenv('FTP_RATE_LIMIT'), os.getenv('FTP_RATE_BURST') or None),
+    "drive": LimitadorBanda("drive", os.getenv('DRIVE_RATE_LIMIT'), os.getenv('DRIVE_RATE_BURST') or None),
+}
+
+def limitador(nome):
+    return LIMITADORES[nome]
+
+def marcar():
+    return {nome: lim.marcar() for nome, lim in LIMITADORES.items()}
+
+def relatorio(marcas):
+    return {nome: lim.relatorio(marcas[nome]) for nome, lim in LIMITADORES.items()}
+
+def status():
+    return {nome: lim.status() for nome, lim in LIMITADORES.items()}
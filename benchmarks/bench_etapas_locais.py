@@ -0,0 +1,300 @@
+# benchmarks/bench_etapas_locais.py
+"""
+Micro-benchmarks das etapas locais do processamento (sem rede):
+
+    descompactar_zip.muitos_pequenos      muitos ZIPs pequenos
+    descompactar_zip.poucos_grandes       poucos ZIPs com muitos membros grandes
+    renomear_devolucaoar.manifesto        manifesto DevolucaoAR com 100k linhas
+    limpar_residuos_tmp.arvore_profunda   limpeza da TMP com árvore profunda
+    listar_arquivos_para_upload.arvore    os.walk da pasta de PDFs finais
+
+Os fixtures são gerados uma vez por caso; só a chamada medida entra no
+tempo. O resultado é gravado em JSON e comparado com um baseline: uma
+mediana acima de (1 + tolerância) x baseline conta como regressão e o
+script sai com código 1.
+
+Uso:
+    python benchmarks/bench_etapas_locais.py                       # compara com o baseline
+    python benchmarks/bench_etapas_locais.py --escala 0.1 --casos renomear
+    python benchmarks/bench_etapas_locais.py --gravar-baseline     # atualiza o baseline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import zipfile
+import argparse
+import platform
+import statistics
+import tempfile
+
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ_REPO)
+
+import dados_sinteticos  # noqa: E402
+import ecarta_processor  # noqa: E402
+
+BASELINE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_etapas_locais.json")
+
+def _escalar(valor, escala, minimo=1):
+    return max(minimo, int(valor * escala))
+
+def _gerar_zip(caminho, membros, tamanho, prefixo, aleatorio):
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(membros):
+            zf.writestr(f"{prefixo}_{i:06d}.pdf", dados_sinteticos.conteudo_pdf(i, tamanho, aleatorio))
+
+def _gerar_arvore(raiz, profundidade, ramificacao, arquivos_por_pasta, tamanho=256):
+    """Árvore com 'ramificacao' subpastas por nível e arquivos pequenos em cada pasta"""
+    total = 0
+    conteudo = b"%PDF-1.4 " + b"\x00" * tamanho
+    pendentes = [(raiz, 0)]
+    while pendentes:
+        pasta, nivel = pendentes.pop()
+        os.makedirs(pasta, exist_ok=True)
+        for i in range(arquivos_por_pasta):
+            with open(os.path.join(pasta, f"AR{nivel:02d}{i:05d}.pdf"), "wb") as f:
+                f.write(conteudo)
+            total += 1
+        if nivel < profundidade:
+            pendentes.extend((os.path.join(pasta, f"n{nivel}_{r}"), nivel + 1) for r in range(ramificacao))
+    return total
+
+# --- Casos -------------------------------------------------------------------
+# Cada caso gera seus fixtures em 'pasta' e retorna (parametros, itens,
+# executar, restaurar): executar() é medido; restaurar() roda antes de cada
+# repetição, fora da medição.
+
+def caso_descompactar_muitos_pequenos(pasta, escala):
+    quantidade, membros, tamanho = _escalar(400, escala), 10, 4 * 1024
+    aleatorio = random.Random(1)
+    origem = os.path.join(pasta, "zips")
+    os.makedirs(origem)
+    zips = []
+    for z in range(quantidade):
+        caminho = os.path.join(origem, f"ECARTA_{z:05d}.zip")
+        _gerar_zip(caminho, membros, tamanho, f"z{z:05d}", aleatorio)
+        zips.append(caminho)
+    destino = os.path.join(pasta, "destino")
+
+    def executar():
+        for caminho in zips:
+            if not ecarta_processor.descompactar_zip(caminho, destino):
+                raise RuntimeError(f"Falha ao descompactar {caminho}")
+
+    def restaurar():
+        shutil.rmtree(destino, ignore_errors=True)
+
+    return {"zips": quantidade, "membros_por_zip": membros, "bytes_por_membro": tamanho}, quantidade * membros, executar, restaurar
+
+def caso_descompactar_poucos_grandes(pasta, escala):
+    quantidade, membros, tamanho = 2, _escalar(800, escala), 64 * 1024
+    aleatorio = random.Random(2)
+    zips = []
+    for z in range(quantidade):
+        caminho = os.path.join(pasta, f"DevolucaoAR_{z}.zip")
+        _gerar_zip(caminho, membros, tamanho, f"g{z}", aleatorio)
+        zips.append(caminho)
+    destino = os.path.join(pasta, "destino")
+
+    def executar():
+        for caminho in zips:
+            if not ecarta_processor.descompactar_zip(caminho, destino):
+                raise RuntimeError(f"Falha ao descompactar {caminho}")
+
+    def restaurar():
+        shutil.rmtree(destino, ignore_errors=True)
+
+    return {"zips": quantidade, "membros_por_zip": membros, "bytes_por_membro": tamanho}, quantidade * membros, executar, restaurar
+
+def caso_renomear_manifesto(pasta, escala):
+    linhas_total = _escalar(100_000, escala)
+    origem = os.path.join(pasta, "tmp")
+    destino = os.path.join(pasta, "unzip")
+    os.makedirs(origem)
+    os.makedirs(destino)
+    linhas, pares = [], []
+    for i in range(linhas_total):
+        original = f"{i:07d}.pdf"
+        novo = f"AR{i:09d}BR"
+        linhas.append(f"{i}|1|ENTREGUE|{novo}|20240101|DESTINATARIO {i}|{original}")
+        pares.append((os.path.join(origem, original), os.path.join(destino, novo + ".pdf")))
+        with open(pares[-1][0], "wb") as f:
+            f.write(b"%PDF-1.4")
+
+    def executar():
+        renomeados = ecarta_processor.renomear_pdfs_devolucaoar(linhas, origem, destino)
+        if len(renomeados) != linhas_total:
+            raise RuntimeError(f"{len(renomeados)} de {linhas_total} PDFs renomeados")
+
+    def restaurar():
+        for original, novo in pares:
+            if os.path.exists(novo):
+                os.rename(novo, original)
+
+    return {"linhas": linhas_total}, linhas_total, executar, restaurar
+
+def caso_limpar_tmp_arvore(pasta, escala):
+    profundidade, ramificacao, por_pasta = 5, 3, _escalar(40, escala)
+    tmp = os.path.join(pasta, "tmp")
+    pendentes = [f"ECARTA_{z:05d}.zip" for z in range(200)]
+    itens = {"total": 0}
+
+    def restaurar():
+        shutil.rmtree(tmp, ignore_errors=True)
+        itens["total"] = _gerar_arvore(os.path.join(tmp, "extraido"), profundidade, ramificacao, por_pasta)
+        # ZIPs ainda aguardando (preservados) e resíduos soltos na raiz da TMP
+        for nome in pendentes + [f"residuo_{i:05d}.zip" for i in range(200)]:
+            open(os.path.join(tmp, nome), "wb").close()
+
+    def executar():
+        ecarta_processor.limpar_residuos_tmp(tmp, preservar=pendentes)
+
+    restaurar()
+    return ({"profundidade": profundidade, "ramificacao": ramificacao, "arquivos_por_pasta": por_pasta,
+             "zips_preservados": len(pendentes)}, itens["total"], executar, restaurar)
+
+def caso_listar_arvore(pasta, escala):
+    import files_to_drive  # importa o cliente do Drive: só quando o caso roda
+
+    profundidade, ramificacao, por_pasta = 6, 3, _escalar(30, escala)
+    raiz = os.path.join(pasta, "unzip")
+    total = _gerar_arvore(raiz, profundidade, ramificacao, por_pasta)
+
+    def executar():
+        if len(files_to_drive.listar_arquivos_para_upload(raiz)) != total:
+            raise RuntimeError("Listagem incompleta")
+
+    return ({"profundidade": profundidade, "ramificacao": ramificacao, "arquivos_por_pasta": por_pasta},
+            total, executar, lambda: None)
+
+CASOS = {
+    "descompactar_zip.muitos_pequenos": caso_descompactar_muitos_pequenos,
+    "descompactar_zip.poucos_grandes": caso_descompactar_poucos_grandes,
+    "renomear_devolucaoar.manifesto": caso_renomear_manifesto,
+    "limpar_residuos_tmp.arvore_profunda": caso_limpar_tmp_arvore,
+    "listar_arquivos_para_upload.arvore": caso_listar_arvore,
+}
+
+# --- Execução e comparação ---------------------------------------------------
+
+def medir_caso(nome, base, escala, repeticoes):
+    pasta = os.path.join(base, nome)
+    os.makedirs(pasta)
+    try:
+        parametros, itens, executar, restaurar = CASOS[nome](pasta, escala)
+        tempos = []
+        for _ in range(repeticoes):
+            restaurar()
+            inicio = time.perf_counter()
+            executar()
+            tempos.append(time.perf_counter() - inicio)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    mediana = statistics.median(tempos)
+    return {
+        "parametros": parametros,
+        "itens": itens,
+        "repeticoes": repeticoes,
+        "min_s": round(min(tempos), 5),
+        "mediana_s": round(mediana, 5),
+        "max_s": round(max(tempos), 5),
+        "itens_por_s": round(itens / mediana) if mediana else None,
+    }
+
+def comparar(atual, baseline, tolerancia):
+    """Razão mediana atual / baseline por caso; casos com parâmetros diferentes não são comparados"""
+    comparacao = {}
+    for nome, resultado in atual["casos"].items():
+        referencia = (baseline or {}).get("casos", {}).get(nome)
+        if referencia is None:
+            comparacao[nome] = {"status": "sem_baseline"}
+        elif referencia.get("parametros") != resultado["parametros"]:
+            comparacao[nome] = {"status": "parametros_diferentes"}
+        else:
+            razao = resultado["mediana_s"] / referencia["mediana_s"] if referencia["mediana_s"] else None
+            if razao is None:
+                status = "sem_baseline"
+            elif razao > 1 + tolerancia:
+                status = "regressao"
+            elif razao < 1 - tolerancia:
+                status = "melhora"
+            else:
+                status = "estavel"
+            comparacao[nome] = {"status": status, "razao": round(razao, 3) if razao else None,
+                                "baseline_mediana_s": referencia["mediana_s"]}
+    return comparacao
+
+def descrever_ambiente():
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--casos", nargs="*", help="filtra casos por substring do nome")
+    parser.add_argument("--escala", type=float, default=1.0, help="multiplica o tamanho dos fixtures")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--pasta", help="onde gerar os fixtures (o sistema de arquivos importa)")
+    parser.add_argument("--saida", help="grava o resultado (JSON) neste arquivo")
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="variação aceita sobre o baseline")
+    parser.add_argument("--gravar-baseline", action="store_true", help="grava o resultado como novo baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    nomes = [n for n in CASOS if not args.casos or any(f in n for f in args.casos)]
+    base = tempfile.mkdtemp(prefix="bench_etapas_", dir=args.pasta)
+    try:
+        resultado = {"ambiente": descrever_ambiente(), "escala": args.escala, "casos": {}}
+        for nome in nomes:
+            resultado["casos"][nome] = medir_caso(nome, base, args.escala, args.repeticoes)
+            r = resultado["casos"][nome]
+            print(f"{nome:<40} mediana {r['mediana_s']:>9.4f}s  min {r['min_s']:>9.4f}s  "
+                  f"{r['itens_por_s'] or 0:>10} itens/s")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("ambiente") != resultado["ambiente"]:
+            print(f"\n⚠️  Baseline gerado em outro ambiente ({baseline.get('ambiente')}): compare com cautela")
+    resultado["comparacao"] = comparar(resultado, baseline, args.tolerancia)
+
+    print()
+    for nome, c in resultado["comparacao"].items():
+        detalhe = f"x{c['razao']} do baseline ({c['baseline_mediana_s']}s)" if c.get("razao") else ""
+        print(f"{nome:<40} {c['status']:<22} {detalhe}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=1)
+        print(f"\nResultado gravado em {args.saida}")
+
+    if args.gravar_baseline:
+        novo_baseline = {"ambiente": resultado["ambiente"], "escala": args.escala, "casos": resultado["casos"]}
+        if baseline and args.casos:
+            # Gravação parcial: mantém os casos que não foram medidos agora
+            novo_baseline["casos"] = {**baseline.get("casos", {}), **resultado["casos"]}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(novo_baseline, f, ensure_ascii=False, indent=1)
+        print(f"Baseline gravado em {args.baseline}")
+        return 0
+
+    regressoes = [n for n, c in resultado["comparacao"].items() if c["status"] == "regressao"]
+    if regressoes:
+        print(f"\n❌ Regressão em: {', '.join(regressoes)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# benchmarks/bench_inicializacao.py
+"""
+Mede o cold start da API (main.py), cada medição num processo novo:
+- tempo de "import main" e, em seguida, da carga dos módulos do fluxo
+  (files_to_drive/ecarta_processor, que trazem googleapiclient/google-auth),
+  com os módulos mais pesados segundo python -X importtime;
+- tempo até a primeira resposta: do disparo do uvicorn até o primeiro
+  GET /health com 200 (inclui o interpretador) e, com --prewarm, até o
+  pré-aquecimento em segundo plano terminar (fluxo_carregado).
+
+Uso:
+    python benchmarks/bench_inicializacao.py --repeticoes 5
+    python benchmarks/bench_inicializacao.py --prewarm --json saida.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Roda no processo filho: import main e depois a carga do fluxo, em segundos
+SCRIPT_IMPORTS = """
+import json, sys, time
+inicio = time.perf_counter()
+import main
+t_main = time.perf_counter() - inicio
+carregados = [m for m in main.MODULOS_FLUXO + ("googleapiclient", "google.auth") if m in sys.modules]
+inicio = time.perf_counter()
+import files_to_drive, ecarta_processor
+t_fluxo = time.perf_counter() - inicio
+print(json.dumps({"import_main_s": t_main, "carga_fluxo_s": t_fluxo, "carregados_no_import": carregados}))
+"""
+
+def ambiente(base, prewarm=False):
+    """Ambiente isolado do processo filho (sem agendador, estado em pasta temporária)"""
+    env = dict(os.environ)
+    env.update({
+        "TMPDIR": os.path.join(base, "tmp"),
+        "STATE_DIR": os.path.join(base, "estado"),
+        "TRACES_DIR": os.path.join(base, "traces"),
+        "SCHEDULER_ENABLED": "false",
+        "PREWARM": "true" if prewarm else "false",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    os.makedirs(env["TMPDIR"], exist_ok=True)
+    return env
+
+def medir_imports(env):
+    saida = subprocess.run([sys.executable, "-c", SCRIPT_IMPORTS], cwd=RAIZ_REPO, env=env,
+                           capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def modulos_pesados(env, quantidade):
+    """Módulos de nível mais alto com maior tempo acumulado (python -X importtime)"""
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main; import files_to_drive"],
+                           cwd=RAIZ_REPO, env=env, capture_output=True, text=True, check=True)
+    linhas = []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha.split("|")
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        if profundidade <= 1:
+            linhas.append((int(acumulado) / 1e6, nome.strip()))
+    return [{"modulo": nome, "segundos": round(s, 3)} for s, nome in sorted(linhas, reverse=True)[:quantidade]]
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def obter_health(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as resposta:
+            return json.loads(resposta.read())
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None
+
+def medir_primeira_resposta(env, prewarm, limite_s=30.0):
+    porta = porta_livre()
+    url = f"http://127.0.0.1:{porta}/health"
+    inicio = time.perf_counter()
+    processo = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                 "--port", str(porta), "--log-level", "warning"],
+                                cwd=RAIZ_REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        resultado = {"primeira_resposta_s": None, "fluxo_carregado_na_primeira": None, "pre_aquecido_s": None}
+        while time.perf_counter() - inicio < limite_s:
+            if processo.poll() is not None:
+                raise RuntimeError(f"uvicorn encerrou com código {processo.returncode}")
+            health = obter_health(url)
+            if health is not None:
+                decorrido = time.perf_counter() - inicio
+                if resultado["primeira_resposta_s"] is None:
+                    resultado["primeira_resposta_s"] = decorrido
+                    resultado["fluxo_carregado_na_primeira"] = health.get("fluxo_carregado")
+                if not prewarm or health.get("fluxo_carregado"):
+                    resultado["pre_aquecido_s"] = decorrido if prewarm else None
+                    return resultado
+            time.sleep(0.005)
+        raise RuntimeError(f"sem resposta de {url} em {limite_s}s")
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+def mediana(valores):
+    valores = [v for v in valores if v is not None]
+    return round(statistics.median(valores), 3) if valores else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--prewarm", action="store_true", help="liga PREWARM no servidor medido")
+    parser.add_argument("--modulos", type=int, default=8, help="quantos módulos pesados listar")
+    parser.add_argument("--json", help="grava o relatório completo neste arquivo")
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="bench_inicio_")
+    try:
+        env = ambiente(base, prewarm=args.prewarm)
+        imports = [medir_imports(env) for _ in range(args.repeticoes)]
+        respostas = [medir_primeira_resposta(env, args.prewarm) for _ in range(args.repeticoes)]
+        pesados = modulos_pesados(env, args.modulos)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    relatorio = {
+        "repeticoes": args.repeticoes,
+        "prewarm": args.prewarm,
+        "import_main_s": mediana(r["import_main_s"] for r in imports),
+        "carga_fluxo_s": mediana(r["carga_fluxo_s"] for r in imports),
+        "carregados_no_import": imports[0]["carregados_no_import"],
+        "primeira_resposta_s": mediana(r["primeira_resposta_s"] for r in respostas),
+        "pre_aquecido_s": mediana(r["pre_aquecido_s"] for r in respostas),
+        "modulos_pesados": pesados,
+        "medicoes": {"imports": imports, "respostas": respostas},
+    }
+
+    print(f"Mediana de {args.repeticoes} processo(s) novo(s){' com PREWARM' if args.prewarm else ''}:")
+    print(f"   import main                 {relatorio['import_main_s']:.3f}s")
+    print(f"   carga do fluxo (1ª execução) {relatorio['carga_fluxo_s']:.3f}s")
+    print(f"   módulos do fluxo já carregados pelo import main: {relatorio['carregados_no_import'] or 'nenhum'}")
+    print(f"   primeira resposta (/health) {relatorio['primeira_resposta_s']:.3f}s desde o disparo do uvicorn")
+    if args.prewarm:
+        print(f"   pré-aquecimento concluído   {relatorio['pre_aquecido_s']:.3f}s desde o disparo do uvicorn")
+    print("   mais pesados (import main + files_to_drive, acumulado):")
+    for modulo in pesados:
+        print(f"      {modulo['modulo']:<32} {modulo['segundos']:.3f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=1)
+        print(f"\nRelatório gravado em {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# benchmarks/bench_ponta_a_ponta.py
+"""
+Mede processar_files_to_drive de ponta a ponta contra um FTP em processo
+e um Drive v3 emulado por HTTP local (benchmarks/servidores_locais.py),
+com lotes sintéticos do eCarta. Nenhum serviço real é acessado.
+
+Relata arquivos/s, bytes/s (entrada FTP e saída Drive), tempo por etapa
+(a partir dos spans do tracing), chamadas ao Drive e 429 injetados.
+
+Uso:
+    python benchmarks/bench_ponta_a_ponta.py --zips 20 --pdfs 100 --tamanho 65536
+    python benchmarks/bench_ponta_a_ponta.py --latencia-drive 0.05 --taxa-429 0.02 --json saida.json
+
+Variáveis de ajuste do fluxo (FTP_POOL_SIZE, DRIVE_RATE_LIMIT,
+ASYNC_TRANSFERS, ...) são lidas do ambiente normalmente.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import logging
+import argparse
+import tempfile
+import multiprocessing.util
+
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ_REPO)
+
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+
+import dados_sinteticos  # noqa: E402
+from servidores_locais import ServidorFTPLocal, DriveLocal, servico_drive  # noqa: E402
+
+PASTA_PRINCIPAL = "pasta_principal"
+PASTA_DEVOLUCAOAR = "pasta_devolucaoar"
+DIRETORIO_FTP = "entrada"
+
+def preparar_ambiente(base, porta_ftp, dono):
+    """Aponta o fluxo para os servidores locais (antes de importar os módulos)"""
+    tempfile.tempdir = os.path.join(base, "tmp")
+    os.makedirs(tempfile.tempdir, exist_ok=True)
+    os.environ.update({
+        "TMPDIR": tempfile.tempdir,
+        "STATE_DIR": os.path.join(base, "estado"),
+        "TRACES_DIR": os.path.join(base, "traces"),
+        "HOST": "127.0.0.1",
+        "PORT": str(porta_ftp),
+        "USER_ECARTA": "bench",
+        "PASSWORD": "bench",
+        "DIRECTORY": DIRETORIO_FTP,
+        "TARGET_FOLDER_ID": PASTA_PRINCIPAL,
+        "TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE": PASTA_DEVOLUCAOAR,
+        # Cada repetição gera um lote novo: a pré-verificação só atrapalharia
+        "FTP_FAST_PATH": "false",
+    })
+    if dono:
+        os.environ["NEW_OWNER_EMAIL_ENV_VAR_NAME"] = dono
+    else:
+        os.environ.pop("NEW_OWNER_EMAIL_ENV_VAR_NAME", None)
+
+def resumir_etapas(spans):
+    """Soma a duração dos spans por nome; 'etapas' são os filhos diretos da raiz"""
+    raiz = next((s for s in spans if s.get("parent_id") is None), None)
+    etapas, por_nome = {}, {}
+    for s in spans:
+        if s is raiz or s.get("duracao") is None:
+            continue
+        destino = etapas if raiz and s.get("parent_id") == raiz["span_id"] else por_nome
+        acumulado = destino.setdefault(s["nome"], {"segundos": 0.0, "quantidade": 0})
+        acumulado["segundos"] += s["duracao"]
+        acumulado["quantidade"] += 1
+    for tabela in (etapas, por_nome):
+        for valores in tabela.values():
+            valores["segundos"] = round(valores["segundos"], 3)
+    return etapas, por_nome
+
+def executar_rodada(args, rodada, servidor_ftp, modulos):
+    files_to_drive, upload_gdrive, tracing, bundle_devolucaoar = modulos
+    pasta_ftp = os.path.join(servidor_ftp.raiz, DIRETORIO_FTP)
+    lote = dados_sinteticos.gerar_lote(
+        pasta_ftp, zips=args.zips, pdfs_por_zip=args.pdfs, tamanho_pdf=args.tamanho,
+        fracao_devolucao=args.fracao_devolucao, semente=args.semente + rodada,
+        variacao_tamanho=args.variacao_tamanho
+    )
+    if bundle_devolucaoar.bundle_habilitado() and lote["zips_devolucao"]:
+        # O bundle e o índice dele em JSON
+        lote["envios_esperados"] = lote["pdfs"] + 2
+
+    drive = DriveLocal(pastas=(PASTA_PRINCIPAL, PASTA_DEVOLUCAOAR), latencia=args.latencia_drive,
+                       taxa_429=args.taxa_429, semente=args.semente + rodada).iniciar()
+    upload_gdrive.get_drive_service = lambda: (servico_drive(drive.url), AnonymousCredentials())
+    # Cliente assíncrono (ASYNC_TRANSFERS=true) fala HTTP direto com o Drive local
+    os.environ["DRIVE_API_URL"] = drive.url
+    # Drive novo a cada rodada: IDs de subpastas (DRIVE_SUBFOLDERS) da rodada anterior não existem nele
+    mapa_pastas = os.path.join(os.environ["STATE_DIR"], "pastas_drive.json")
+    if os.path.exists(mapa_pastas):
+        os.remove(mapa_pastas)
+    servidor_ftp.zerar_contadores()
+
+    trace_id = uuid.uuid4().hex
+    try:
+        inicio = time.perf_counter()
+        with tracing.trace(trace_id, "bench.files_to_drive", rodada=rodada):
+            resultado = files_to_drive.processar_files_to_drive()
+        duracao = time.perf_counter() - inicio
+    finally:
+        drive.parar()
+
+    resumo_drive = drive.resumo()
+    resumo_ftp = servidor_ftp.resumo()
+    etapas, spans = resumir_etapas(tracing.carregar_spans(trace_id))
+    enviados = resumo_drive["arquivos"]
+    return {
+        "rodada": rodada,
+        "sucesso": resultado.get("sucesso"),
+        "mensagem": resultado.get("mensagem"),
+        "duracao_s": round(duracao, 3),
+        "zips": len(lote["arquivos"]),
+        "bytes_ftp": resumo_ftp["bytes_enviados"],
+        "bytes_drive": resumo_drive["bytes_recebidos"],
+        "arquivos_enviados": enviados,
+        "envios_esperados": lote["envios_esperados"],
+        "arquivos_por_s": round(enviados / duracao, 2) if duracao else None,
+        "bytes_ftp_por_s": round(resumo_ftp["bytes_enviados"] / duracao) if duracao else None,
+        "bytes_drive_por_s": round(resumo_drive["bytes_recebidos"] / duracao) if duracao else None,
+        "restantes_no_ftp": len(os.listdir(pasta_ftp)),
+        "etapas": etapas,
+        "spans": spans,
+        "chamadas_drive": resumo_drive["chamadas"],
+        "respostas_429": resumo_drive["respostas_429"],
+        "comandos_ftp": resumo_ftp["comandos"],
+        "autotune": resultado.get("detalhes", {}).get("autotune"),
+        "faixas_upload": resultado.get("detalhes", {}).get("faixas_upload"),
+        "cota_drive": resultado.get("detalhes", {}).get("cota_drive"),
+    }
+
+def imprimir_rodada(r):
+    print(f"\n== Rodada {r['rodada']}: {'ok' if r['sucesso'] else 'FALHA'} ({r['mensagem']})")
+    print(f"   {r['duracao_s']:.2f}s | {r['arquivos_enviados']}/{r['envios_esperados']} arquivos no Drive | "
+          f"{r['arquivos_por_s']} arquivos/s")
+    print(f"   FTP: {r['bytes_ftp'] / 1e6:.1f} MB ({(r['bytes_ftp_por_s'] or 0) / 1e6:.1f} MB/s) | "
+          f"Drive: {r['bytes_drive'] / 1e6:.1f} MB ({(r['bytes_drive_por_s'] or 0) / 1e6:.1f} MB/s) | "
+          f"restantes no FTP: {r['restantes_no_ftp']}")
+    for nome, valores in sorted(r["etapas"].items(), key=lambda e: -e[1]["segundos"]):
+        print(f"   {nome:<28} {valores['segundos']:>8.3f}s  x{valores['quantidade']}")
+    print(f"   chamadas Drive: {r['chamadas_drive']}")
+    if r["cota_drive"]:
+        cota = r["cota_drive"]
+        estimadas = (cota["estimativa"] or {}).get("chamadas")
+        print(f"   contabilizadas pelo fluxo: {cota['chamadas']} (estimativa de upload: {estimadas}, "
+              f"adiados: {cota['arquivos_adiados']}, espera: {cota['segundos_em_espera']}s)")
+    if r["respostas_429"]:
+        print(f"   429 injetados: {r['respostas_429']}")
+    for faixa, f in (r["faixas_upload"] or {}).items():
+        print(f"   faixa {faixa:<12} {f['concluidos']}/{f['arquivos']} arquivos | primeiro {f['tempo_primeiro_arquivo_s']}s, "
+              f"último {f['tempo_ultimo_arquivo_s']}s")
+    for etapa, ajuste in (r["autotune"] or {}).items():
+        trajetoria = " ".join(str(d["para"]) for d in ajuste["decisoes"])
+        print(f"   autotune {etapa}: {ajuste['inicial']} -> {ajuste['final']} (aprendido {ajuste['aprendido']}) "
+              f"[{trajetoria}]")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zips", type=int, default=10)
+    parser.add_argument("--pdfs", type=int, default=50, help="PDFs por ZIP")
+    parser.add_argument("--tamanho", type=int, default=64 * 1024, help="bytes por PDF")
+    parser.add_argument("--variacao-tamanho", type=float, default=0.0, help="ex.: 0.5 = tamanho ±50%%")
+    parser.add_argument("--fracao-devolucao", type=float, default=0.5, help="fração de ZIPs DevolucaoAR")
+    parser.add_argument("--latencia-ftp", type=float, default=0.0, help="segundos por comando FTP")
+    parser.add_argument("--latencia-drive", type=float, default=0.0, help="segundos por requisição ao Drive")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="probabilidade de 429 por chamada ao Drive")
+    parser.add_argument("--dono", default="bench@example.com",
+                        help="e-mail para transferência de propriedade ('' desativa)")
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--json", help="grava o relatório completo neste arquivo")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # Pasta do multiprocessing (socket do forkserver da extração) criada fora de
+    # 'base': ela é apagada antes do fim do processo, quando o forkserver encerra
+    multiprocessing.util.get_temp_dir()
+    base = tempfile.mkdtemp(prefix="bench_e2e_")
+    servidor_ftp = ServidorFTPLocal(os.path.join(base, "ftp"), latencia=args.latencia_ftp)
+    os.makedirs(os.path.join(servidor_ftp.raiz, DIRETORIO_FTP))
+    servidor_ftp.iniciar()
+    try:
+        preparar_ambiente(base, servidor_ftp.porta, args.dono)
+        # Importados só agora: os módulos leem a configuração na importação
+        import files_to_drive
+        import upload_gdrive
+        import tracing
+        import bundle_devolucaoar
+        modulos = (files_to_drive, upload_gdrive, tracing, bundle_devolucaoar)
+
+        print(f"Lote: {args.zips} ZIPs x {args.pdfs} PDFs de {args.tamanho} bytes "
+              f"({args.fracao_devolucao:.0%} DevolucaoAR) | latência FTP {args.latencia_ftp}s, "
+              f"Drive {args.latencia_drive}s | 429 {args.taxa_429:.1%}")
+        rodadas = []
+        for rodada in range(args.repeticoes):
+            rodadas.append(executar_rodada(args, rodada, servidor_ftp, modulos))
+            imprimir_rodada(rodadas[-1])
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"parametros": vars(args), "rodadas": rodadas}, f, ensure_ascii=False, indent=1)
+            print(f"\nRelatório gravado em {args.json}")
+    finally:
+        servidor_ftp.parar()
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_zip_extraction.py
+"""
+Compara zipfile.extractall (uma thread) com zip_extractor.extrair
+(pool de processos) em ZIPs sintéticos com milhares de membros.
+
+Uso:
+    python benchmarks/bench_zip_extraction.py --membros 3000 --tamanho 65536
+"""
+
+import os
+import sys
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import zip_extractor  # noqa: E402
+
+def gerar_zip(caminho, membros, tamanho):
+    """Gera um ZIP deflate com 'membros' PDFs sintéticos parcialmente compressíveis"""
+    aleatorio = os.urandom(tamanho // 2)
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(membros):
+            cabecalho = f"%PDF-1.4 AR{i:08d} ".encode() * 64
+            conteudo = (cabecalho + aleatorio + b"\x00" * tamanho)[:tamanho]
+            zf.writestr(f"AR{i:08d}.pdf", conteudo)
+        zf.writestr("DevolucaoAR_sintetico.txt", "\n".join(f"AR{i:08d};ENTREGUE" for i in range(membros)))
+
+def medir(funcao, repeticoes, pasta):
+    tempos = []
+    for _ in range(repeticoes):
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.makedirs(pasta)
+        inicio = time.perf_counter()
+        funcao(pasta)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--membros", type=int, default=3000)
+    parser.add_argument("--tamanho", type=int, default=64 * 1024, help="bytes por membro")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_zip_") as base:
+        caminho_zip = os.path.join(base, "sintetico.zip")
+        gerar_zip(caminho_zip, args.membros, args.tamanho)
+        total = args.membros * args.tamanho
+        print(f"ZIP: {args.membros} membros, {total / 1e6:.1f} MB descompactados, "
+              f"{os.path.getsize(caminho_zip) / 1e6:.1f} MB no arquivo")
+
+        def serial(pasta):
+            with zipfile.ZipFile(caminho_zip) as zf:
+                zf.extractall(pasta)
+
+        def paralelo(pasta):
+            zip_extractor.extrair(caminho_zip, pasta, max_workers=args.workers)
+
+        pasta = os.path.join(base, "saida")
+        t_serial = medir(serial, args.repeticoes, pasta)
+        t_paralelo = medir(paralelo, args.repeticoes, pasta)
+        workers = args.workers or zip_extractor.get_max_workers()
+        print(f"extractall:         {t_serial:.3f}s  ({total / t_serial / 1e6:.0f} MB/s)")
+        print(f"extrair ({workers} proc.): {t_paralelo:.3f}s  ({total / t_paralelo / 1e6:.0f} MB/s)")
+        print(f"speedup: {t_serial / t_paralelo:.2f}x")
+
+if __name__ == "__main__":
+    main()
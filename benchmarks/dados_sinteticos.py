@@ -0,0 +1,54 @@
+# benchmarks/dados_sinteticos.py
+"""
+Gera lotes sintéticos no formato do eCarta: ZIPs 'DevolucaoAR_*.zip' com
+PDFs e o manifesto DevolucaoAR_*.txt (campos separados por '|', código AR
+no 4º campo e nome do PDF original no 7º) e ZIPs comuns só com PDFs.
+"""
+
+import os
+import random
+import zipfile
+
+def conteudo_pdf(indice, tamanho, aleatorio):
+    """PDF sintético parcialmente compressível (cabeçalho repetido + ruído + zeros)"""
+    cabecalho = f"%PDF-1.4 AR{indice:08d} ".encode() * 32
+    ruido = aleatorio.randbytes(tamanho // 2)
+    return (cabecalho + ruido + b"\x00" * tamanho)[:tamanho]
+
+def gerar_lote(pasta, zips=10, pdfs_por_zip=50, tamanho_pdf=64 * 1024, fracao_devolucao=0.5, semente=0,
+               variacao_tamanho=0.0):
+    """
+    Cria 'zips' arquivos em 'pasta'. Uma fração 'fracao_devolucao' deles é
+    DevolucaoAR (com manifesto). Com 'variacao_tamanho' > 0 cada PDF tem
+    tamanho sorteado em tamanho_pdf * (1 ± variacao_tamanho).
+    Retorna a descrição do lote (arquivos, bytes, PDFs e envios esperados no Drive).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    aleatorio = random.Random(semente)
+    quantidade_devolucao = round(zips * fracao_devolucao)
+    lote = {"arquivos": [], "bytes_ftp": 0, "pdfs": 0, "bytes_pdfs": 0, "zips_devolucao": quantidade_devolucao}
+    indice_ar = 0
+    for z in range(zips):
+        eh_devolucao = z < quantidade_devolucao
+        nome_zip = f"DevolucaoAR_{semente:04d}_{z:05d}.zip" if eh_devolucao else f"ECARTA_{semente:04d}_{z:05d}.zip"
+        caminho_zip = os.path.join(pasta, nome_zip)
+        linhas = []
+        with zipfile.ZipFile(caminho_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+            for p in range(pdfs_por_zip):
+                indice_ar += 1
+                tamanho = tamanho_pdf
+                if variacao_tamanho:
+                    tamanho = max(1, int(tamanho_pdf * (1 + aleatorio.uniform(-variacao_tamanho, variacao_tamanho))))
+                nome_original = f"{z:05d}_{p:05d}.pdf"
+                zf.writestr(nome_original, conteudo_pdf(indice_ar, tamanho, aleatorio))
+                lote["pdfs"] += 1
+                lote["bytes_pdfs"] += tamanho
+                codigo_ar = f"AR{semente:04d}{indice_ar:08d}BR"
+                linhas.append(f"{z}|{p}|ENTREGUE|{codigo_ar}|20240101|DESTINATARIO {indice_ar}|{nome_original}")
+            if eh_devolucao:
+                zf.writestr(nome_zip[:-4] + ".txt", "\n".join(linhas).encode("latin-1"))
+        lote["arquivos"].append(nome_zip)
+        lote["bytes_ftp"] += os.path.getsize(caminho_zip)
+    # No Drive: um PDF por membro + o original de cada ZIP DevolucaoAR
+    lote["envios_esperados"] = lote["pdfs"] + quantidade_devolucao
+    return lote
@@ -0,0 +1,568 @@
+# benchmarks/servidores_locais.py
+"""
+Servidores locais para medir o fluxo completo sem tocar no FTP do eCarta
+nem no Google Drive reais:
+
+- ServidorFTPLocal: FTP mínimo em processo (USER/PASS, CWD, PASV/EPSV,
+  MLSD/NLST/LIST, SIZE, RETR, DELE, NOOP) servindo uma pasta local.
+- DriveLocal: HTTP que emula os endpoints do Drive v3 usados aqui
+  (files create/list/get/copy/delete, upload resumable/multipart e
+  permissions create), com latência configurável e injeção de 429.
+
+servico_drive(url) monta um cliente googleapiclient apontando para o
+DriveLocal, a partir do documento de discovery embarcado na biblioteca.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import socket
+import hashlib
+import threading
+import socketserver
+import urllib.parse
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PASTA_MIME = "application/vnd.google-apps.folder"
+
+# --- FTP -------------------------------------------------------------------
+
+class _SessaoFTP(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.cwd = "/"
+        self.escuta_dados = None
+
+    def responder(self, linha):
+        self.wfile.write((linha + "\r\n").encode("utf-8"))
+
+    def caminho(self, nome=""):
+        relativo = os.path.normpath(os.path.join(self.cwd, nome)).lstrip("/")
+        caminho = os.path.abspath(os.path.join(self.server.raiz, relativo))
+        if not caminho.startswith(os.path.abspath(self.server.raiz)):
+            raise PermissionError(nome)
+        return caminho
+
+    def handle(self):
+        self.responder("220 FTP local de benchmark")
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando, _, argumento = linha.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            comando = comando.upper()
+            if self.server.latencia:
+                time.sleep(self.server.latencia)
+            with self.server.lock:
+                self.server.comandos[comando] = self.server.comandos.get(comando, 0) + 1
+            metodo = getattr(self, "ftp_" + comando, None)
+            if metodo is None:
+                self.responder("502 Comando não implementado")
+                continue
+            try:
+                if metodo(argumento) is False:
+                    return
+            except FileNotFoundError:
+                self.responder("550 Arquivo não encontrado")
+            except Exception as e:
+                self.responder(f"550 {e}")
+
+    def ftp_USER(self, argumento):
+        self.responder("331 Senha")
+
+    def ftp_PASS(self, argumento):
+        self.responder("230 Autenticado")
+
+    def ftp_TYPE(self, argumento):
+        self.responder("200 ok")
+
+    def ftp_NOOP(self, argumento):
+        self.responder("200 ok")
+
+    def ftp_OPTS(self, argumento):
+        self.responder("200 ok")
+
+    def ftp_FEAT(self, argumento):
+        self.wfile.write(b"211-Recursos\r\n MLSD\r\n SIZE\r\n211 Fim\r\n")
+
+    def ftp_PWD(self, argumento):
+        self.responder(f'257 "{self.cwd}"')
+
+    def ftp_CWD(self, argumento):
+        if not os.path.isdir(self.caminho(argumento)):
+            raise FileNotFoundError(argumento)
+        self.cwd = os.path.normpath(os.path.join(self.cwd, argumento))
+        self.responder("250 ok")
+
+    def ftp_QUIT(self, argumento):
+        self.responder("221 Até logo")
+        return False
+
+    def _passivo(self):
+        escuta = socket.socket()
+        escuta.bind(("127.0.0.1", 0))
+        escuta.listen(1)
+        self.escuta_dados = escuta
+        return escuta.getsockname()[1]
+
+    def ftp_PASV(self, argumento):
+        porta = self._passivo()
+        self.responder(f"227 Modo passivo (127,0,0,1,{porta >> 8},{porta & 255})")
+
+    def ftp_EPSV(self, argumento):
+        self.responder(f"229 Modo passivo estendido (|||{self._passivo()}|)")
+
+    def _transferir(self, blocos):
+        if self.escuta_dados is None:
+            self.responder("425 Use PASV primeiro")
+            return
+        self.responder("150 Abrindo conexão de dados")
+        self.escuta_dados.settimeout(10)
+        conexao, _ = self.escuta_dados.accept()
+        self.escuta_dados.close()
+        self.escuta_dados = None
+        try:
+            for bloco in blocos:
+                conexao.sendall(bloco)
+        finally:
+            conexao.close()
+        self.responder("226 Transferência concluída")
+
+    def _arquivos(self):
+        pasta = self.caminho()
+        return sorted(n for n in os.listdir(pasta) if os.path.isfile(os.path.join(pasta, n)))
+
+    def ftp_NLST(self, argumento):
+        self._transferir([(n + "\r\n").encode() for n in self._arquivos()])
+
+    def ftp_LIST(self, argumento):
+        linhas = []
+        for nome in self._arquivos():
+            st = os.stat(self.caminho(nome))
+            data = time.strftime("%b %d %H:%M", time.gmtime(st.st_mtime))
+            linhas.append(f"-rw-r--r-- 1 ftp ftp {st.st_size} {data} {nome}\r\n".encode())
+        self._transferir(linhas)
+
+    def ftp_MLSD(self, argumento):
+        linhas = []
+        for nome in self._arquivos():
+            st = os.stat(self.caminho(nome))
+            modificacao = time.strftime("%Y%m%d%H%M%S", time.gmtime(st.st_mtime))
+            linhas.append(f"type=file;size={st.st_size};modify={modificacao}; {nome}\r\n".encode())
+        self._transferir(linhas)
+
+    def ftp_SIZE(self, argumento):
+        self.responder(f"213 {os.path.getsize(self.caminho(argumento))}")
+
+    def ftp_RETR(self, argumento):
+        caminho = self.caminho(argumento)
+        if not os.path.isfile(caminho):
+            raise FileNotFoundError(argumento)
+
+        def blocos():
+            with open(caminho, "rb") as f:
+                while True:
+                    bloco = f.read(64 * 1024)
+                    if not bloco:
+                        return
+                    with self.server.lock:
+                        self.server.bytes_enviados += len(bloco)
+                    yield bloco
+        self._transferir(blocos())
+
+    def ftp_DELE(self, argumento):
+        os.remove(self.caminho(argumento))
+        self.responder("250 Excluído")
+
+class ServidorFTPLocal(socketserver.ThreadingTCPServer):
+    """FTP em processo servindo 'raiz'; 'latencia' é aplicada a cada comando"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+    def __init__(self, raiz, latencia=0.0):
+        self.raiz = raiz
+        self.latencia = latencia
+        self.lock = threading.Lock()
+        self.comandos = {}
+        self.bytes_enviados = 0
+        super().__init__(("127.0.0.1", 0), _SessaoFTP)
+
+    @property
+    def porta(self):
+        return self.server_address[1]
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True, name="ftp-local").start()
+        return self
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+    def resumo(self):
+        with self.lock:
+            return {"comandos": dict(self.comandos), "bytes_enviados": self.bytes_enviados}
+
+    def zerar_contadores(self):
+        with self.lock:
+            self.comandos = {}
+            self.bytes_enviados = 0
+
+# --- Drive -----------------------------------------------------------------
+
+_CLAUSULA_PARENTS = re.compile(r"^'((?:[^'\\]|\\.)*)'\s+in\s+parents$")
+_CLAUSULA_CAMPO = re.compile(r"^(name|mimeType|trashed)\s*(=|!=)\s*(?:'((?:[^'\\]|\\.)*)'|(true|false))$")
+
+def _dividir_consulta(q):
+    """Separa as cláusulas de um 'q' do Drive unidas por 'and' (fora de aspas)"""
+    partes, atual, em_aspas, i = [], [], False, 0
+    while i < len(q):
+        c = q[i]
+        if c == "\\" and em_aspas:
+            atual.append(q[i:i + 2])
+            i += 2
+            continue
+        if c == "'":
+            em_aspas = not em_aspas
+        if not em_aspas and q[i:i + 5].lower() == " and ":
+            partes.append("".join(atual).strip())
+            atual = []
+            i += 5
+            continue
+        atual.append(c)
+        i += 1
+    partes.append("".join(atual).strip())
+    return [p for p in partes if p]
+
+def _desescapar(valor):
+    return re.sub(r"\\(.)", r"\1", valor)
+
+def filtro_consulta(q):
+    """
+    Converte o subconjunto de 'q' usado pelo projeto ('<id>' in parents,
+    name/mimeType = '...', trashed = true|false) num predicado sobre o
+    recurso. Cláusulas desconhecidas levantam ValueError (vira 400).
+    """
+    predicados = []
+    for clausula in _dividir_consulta(q or ""):
+        m = _CLAUSULA_PARENTS.match(clausula)
+        if m:
+            pai = _desescapar(m.group(1))
+            predicados.append(lambda r, pai=pai: pai in r.get("parents", []))
+            continue
+        m = _CLAUSULA_CAMPO.match(clausula)
+        if not m:
+            raise ValueError(f"Cláusula não suportada: {clausula}")
+        campo, operador, texto, booleano = m.groups()
+        valor = (booleano == "true") if booleano else _desescapar(texto)
+        if operador == "=":
+            predicados.append(lambda r, c=campo, v=valor: r.get(c, False if c == "trashed" else None) == v)
+        else:
+            predicados.append(lambda r, c=campo, v=valor: r.get(c, False if c == "trashed" else None) != v)
+    return lambda recurso: all(p(recurso) for p in predicados)
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    # Backlog padrão (5) derruba conexões quando o cliente assíncrono abre dezenas de uma vez
+    request_queue_size = 128
+
+class _RequisicaoDrive(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeçalhos e corpo num único envio: sem isso Nagle + ACK atrasado
+    # somam ~40 ms por resposta e o benchmark mediria o servidor falso
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _corpo(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(tamanho) if tamanho else b""
+
+    def _json(self, status, dados=None, cabecalhos=None):
+        corpo = json.dumps(dados).encode("utf-8") if dados is not None else b""
+        self.send_response(status)
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        if corpo:
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        if corpo:
+            self.wfile.write(corpo)
+
+    def _erro(self, status, mensagem, motivo="badRequest"):
+        self._json(status, {"error": {"code": status, "message": mensagem,
+                                      "errors": [{"reason": motivo, "message": mensagem}]}})
+
+    def _despachar(self, metodo):
+        url = urllib.parse.urlsplit(self.path)
+        caminho = url.path
+        parametros = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        corpo = self._corpo()
+        drive = self.server.drive
+        rota = drive.rota(metodo, caminho, parametros)
+        if drive.latencia:
+            time.sleep(drive.latencia)
+        if drive.injetar_429(rota):
+            self._erro(429, "Rate Limit Exceeded", "rateLimitExceeded")
+            return
+        try:
+            drive.atender(self, rota, metodo, caminho, parametros, corpo)
+        except KeyError as e:
+            self._erro(404, f"File not found: {e}", "notFound")
+        except ValueError as e:
+            self._erro(400, str(e))
+
+    def do_GET(self):
+        self._despachar("GET")
+
+    def do_POST(self):
+        self._despachar("POST")
+
+    def do_PUT(self):
+        self._despachar("PUT")
+
+    def do_PATCH(self):
+        self._despachar("PATCH")
+
+    def do_DELETE(self):
+        self._despachar("DELETE")
+
+def _agora_rfc3339():
+    """Instante atual como o Drive informa (UTC, milissegundos)"""
+    agora = time.time()
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(agora)) + f".{int(agora * 1000) % 1000:03d}Z"
+
+class DriveLocal:
+    """
+    Estado e servidor HTTP do Drive emulado. Arquivos guardam só metadados,
+    tamanho e MD5 (o conteúdo é descartado após o hash).
+
+    latencia: segundos acrescentados a cada requisição
+    taxa_429: probabilidade de responder 429 (rateLimitExceeded)
+    rotas_429: limita a injeção a estas rotas (ex.: {"files.create"})
+    """
+
+    def __init__(self, pastas=(), latencia=0.0, taxa_429=0.0, rotas_429=None, semente=None):
+        self.latencia = latencia
+        self.taxa_429 = taxa_429
+        self.rotas_429 = set(rotas_429 or ())
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.arquivos = {}
+        self.sessoes = {}
+        self.chamadas = {}
+        self.respostas_429 = {}
+        self.bytes_recebidos = 0
+        for pasta_id in pastas:
+            self.arquivos[pasta_id] = {"id": pasta_id, "name": pasta_id, "mimeType": PASTA_MIME,
+                                       "parents": [], "trashed": False}
+        self._http = None
+
+    # --- Servidor ---
+
+    def iniciar(self):
+        self._http = _ServidorHTTP(("127.0.0.1", 0), _RequisicaoDrive)
+        self._http.daemon_threads = True
+        self._http.drive = self
+        threading.Thread(target=self._http.serve_forever, daemon=True, name="drive-local").start()
+        return self
+
+    def parar(self):
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+
+    @property
+    def url(self):
+        host, porta = self._http.server_address[:2]
+        return f"http://{host}:{porta}/"
+
+    # --- Contabilidade ---
+
+    def rota(self, metodo, caminho, parametros):
+        partes = [p for p in caminho.split("/") if p]
+        if partes[:1] == ["upload"]:
+            # Blocos de uma sessão resumable não contam como chamada de API
+            nome = "upload.bloco" if "upload_id" in parametros else "files.create"
+        elif partes[-1:] == ["permissions"]:
+            nome = "permissions.create"
+        elif partes[-1:] == ["copy"]:
+            nome = "files.copy"
+        elif partes[-1:] == ["files"]:
+            nome = "files.list" if metodo == "GET" else "files.create"
+        else:
+            nome = {"GET": "files.get", "DELETE": "files.delete", "PATCH": "files.update"}.get(metodo, metodo)
+        with self._lock:
+            self.chamadas[nome] = self.chamadas.get(nome, 0) + 1
+        return nome
+
+    def injetar_429(self, rota):
+        # Só a abertura da sessão de upload é rejeitada; os blocos de uma
+        # sessão já aberta seguem, como no Drive real
+        if not self.taxa_429 or rota == "upload.bloco" or (self.rotas_429 and rota not in self.rotas_429):
+            return False
+        with self._lock:
+            if self._aleatorio.random() >= self.taxa_429:
+                return False
+            self.respostas_429[rota] = self.respostas_429.get(rota, 0) + 1
+            return True
+
+    def resumo(self):
+        with self._lock:
+            arquivos = [a for a in self.arquivos.values() if a["mimeType"] != PASTA_MIME]
+            return {
+                "chamadas": dict(self.chamadas),
+                "respostas_429": dict(self.respostas_429),
+                "arquivos": len(arquivos),
+                "bytes_recebidos": self.bytes_recebidos,
+            }
+
+    def arquivos_em(self, pasta_id):
+        with self._lock:
+            return [dict(a) for a in self.arquivos.values() if pasta_id in a.get("parents", [])]
+
+    # --- Operações ---
+
+    def _novo_recurso(self, metadados, conteudo_md5=None, tamanho=None):
+        recurso = {
+            "id": uuid.uuid4().hex,
+            "name": metadados.get("name", "Untitled"),
+            "mimeType": metadados.get("mimeType") or "application/octet-stream",
+            "parents": list(metadados.get("parents") or []),
+            "trashed": False,
+            "createdTime": _agora_rfc3339(),
+        }
+        for campo in ("appProperties", "properties", "description"):
+            if campo in metadados:
+                recurso[campo] = metadados[campo]
+        if conteudo_md5 is not None:
+            recurso["md5Checksum"] = conteudo_md5
+            recurso["size"] = str(tamanho)
+        with self._lock:
+            for pai in recurso["parents"]:
+                if pai not in self.arquivos:
+                    raise KeyError(pai)
+            self.arquivos[recurso["id"]] = recurso
+        return recurso
+
+    def _recurso(self, arquivo_id):
+        with self._lock:
+            recurso = self.arquivos[arquivo_id]
+            if recurso.get("trashed"):
+                raise KeyError(arquivo_id)
+            return recurso
+
+    def atender(self, req, rota, metodo, caminho, parametros, corpo):
+        partes = [p for p in caminho.split("/") if p]
+        if partes[:1] == ["upload"]:
+            self._upload(req, metodo, parametros, corpo)
+        elif rota == "files.create":
+            req._json(200, self._novo_recurso(json.loads(corpo or b"{}")))
+        elif rota == "files.list":
+            self._listar(req, parametros)
+        elif rota == "files.get":
+            req._json(200, self._recurso(partes[-1]))
+        elif rota == "files.delete":
+            with self._lock:
+                self.arquivos.pop(partes[-1])
+            req._json(204)
+        elif rota == "files.copy":
+            origem = self._recurso(partes[-2])
+            metadados = json.loads(corpo or b"{}")
+            metadados.setdefault("name", origem["name"])
+            metadados.setdefault("mimeType", origem["mimeType"])
+            req._json(200, self._novo_recurso(metadados, origem.get("md5Checksum"), origem.get("size")))
+        elif rota == "permissions.create":
+            self._recurso(partes[-2])
+            permissao = json.loads(corpo or b"{}")
+            req._json(200, {"kind": "drive#permission", "id": uuid.uuid4().hex[:12], **permissao})
+        else:
+            req._erro(404, f"Rota não emulada: {metodo} {caminho}", "notFound")
+
+    def _listar(self, req, parametros):
+        predicado = filtro_consulta(parametros.get("q"))
+        tamanho_pagina = max(1, min(1000, int(parametros.get("pageSize", 100))))
+        inicio = int(parametros.get("pageToken") or 0)
+        with self._lock:
+            encontrados = [dict(a) for a in self.arquivos.values() if predicado(a)]
+        pagina = encontrados[inicio:inicio + tamanho_pagina]
+        resposta = {"kind": "drive#fileList", "files": pagina}
+        if inicio + tamanho_pagina < len(encontrados):
+            resposta["nextPageToken"] = str(inicio + tamanho_pagina)
+        req._json(200, resposta)
+
+    def _upload(self, req, metodo, parametros, corpo):
+        tipo = parametros.get("uploadType", "media")
+        if metodo == "POST" and tipo == "resumable":
+            sessao_id = uuid.uuid4().hex
+            metadados = json.loads(corpo or b"{}")
+            metadados.setdefault("mimeType", req.headers.get("X-Upload-Content-Type"))
+            with self._lock:
+                self.sessoes[sessao_id] = {"metadados": metadados, "md5": hashlib.md5(), "recebidos": 0}
+            local = f"{self.url}upload/drive/v3/files?uploadType=resumable&upload_id={sessao_id}"
+            req._json(200, cabecalhos={"Location": local})
+        elif metodo == "PUT" and "upload_id" in parametros:
+            self._continuar_sessao(req, parametros["upload_id"], corpo)
+        elif metodo == "POST" and tipo == "multipart":
+            mensagem = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {req.headers.get('Content-Type')}\r\n\r\n".encode() + corpo)
+            partes = list(mensagem.iter_parts())
+            metadados = json.loads(partes[0].get_payload(decode=True) or b"{}")
+            conteudo = partes[1].get_payload(decode=True) if len(partes) > 1 else b""
+            if len(partes) > 1:
+                metadados.setdefault("mimeType", partes[1].get_content_type())
+            self._contar_bytes(len(conteudo))
+            req._json(200, self._novo_recurso(metadados, hashlib.md5(conteudo).hexdigest(), len(conteudo)))
+        elif metodo == "POST":
+            self._contar_bytes(len(corpo))
+            req._json(200, self._novo_recurso({}, hashlib.md5(corpo).hexdigest(), len(corpo)))
+        else:
+            raise ValueError(f"uploadType não suportado: {tipo}")
+
+    def _contar_bytes(self, quantidade):
+        with self._lock:
+            self.bytes_recebidos += quantidade
+
+    def _continuar_sessao(self, req, sessao_id, corpo):
+        with self._lock:
+            sessao = self.sessoes[sessao_id]
+        # Content-Range: "bytes 0-99/1000" ou "bytes */1000" (consulta); sem o
+        # cabeçalho o corpo é o arquivo inteiro (o cliente omite para arquivo vazio)
+        intervalo = req.headers.get("Content-Range") or f"bytes 0-{len(corpo) - 1}/{len(corpo)}"
+        m = re.match(r"bytes (\*|(\d+)-(-?\d+))/(\d+|\*)", intervalo)
+        if not m:
+            raise ValueError(f"Content-Range inválido: {intervalo!r}")
+        total = int(m.group(4)) if m.group(4) != "*" else None
+        if m.group(2) is not None:
+            if int(m.group(2)) != sessao["recebidos"]:
+                raise ValueError("Bloco fora de ordem")
+            sessao["md5"].update(corpo)
+            sessao["recebidos"] += len(corpo)
+            self._contar_bytes(len(corpo))
+        if total is None or sessao["recebidos"] < total:
+            cabecalhos = {"Range": f"bytes=0-{sessao['recebidos'] - 1}"} if sessao["recebidos"] else {}
+            req._json(308, cabecalhos=cabecalhos)
+            return
+        with self._lock:
+            self.sessoes.pop(sessao_id, None)
+        req._json(200, self._novo_recurso(sessao["metadados"], sessao["md5"].hexdigest(), sessao["recebidos"]))
+
+def servico_drive(url):
+    """Cliente googleapiclient do Drive v3 apontando para 'url' (DriveLocal)"""
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+
+    documento = json.loads(discovery_cache.get_static_doc("drive", "v3"))
+    documento["rootUrl"] = url
+    # build_http() não trata 308 como redirecionamento (usado no upload resumable)
+    return build_from_document(documento, http=build_http())
@@ -0,0 +1,83 @@
+# bundle_devolucaoar.py
+
+import os
+import io
+import json
+import time
+import tarfile
+import hashlib
+import logging
+import integridade
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+NOME_INDICE = "indice.json"
+TAMANHO_BLOCO = 1024 * 1024
+
+def bundle_habilitado():
+    """DEVOLUCAOAR_BUNDLE=true: originais DevolucaoAR vão num único .tar.gz por execução"""
+    return os.getenv('DEVOLUCAOAR_BUNDLE', 'false').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+def nome_bundle(run_id):
+    return f"DevolucaoAR_{run_id}.tar.gz"
+
+def nome_indice(run_id):
+    """Cópia do índice enviada ao lado do bundle (consultável sem baixar o .tar.gz)"""
+    return f"DevolucaoAR_{run_id}.indice.json"
+
+def _serializar_indice(indice):
+    return json.dumps(indice, ensure_ascii=False, indent=1).encode("utf-8")
+
+def gravar_indice(indice, caminho):
+    """Grava o índice (o mesmo 'indice.json' do bundle) em 'caminho'; retorna o MD5"""
+    dados = _serializar_indice(indice)
+    with open(caminho, "wb") as f:
+        f.write(dados)
+    return hashlib.md5(dados).hexdigest()
+
+class _LeitorComHash:
+    """Arquivo de leitura que calcula o MD5 do que o tarfile consome"""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.md5 = hashlib.md5()
+
+    def read(self, tamanho=-1):
+        bloco = self.arquivo.read(tamanho)
+        self.md5.update(bloco)
+        return bloco
+
+def criar_bundle(caminhos, caminho_bundle, run_id=None):
+    """
+    Empacota os arquivos num .tar.gz em modo streaming (memória limitada a
+    um bloco por vez) e acrescenta 'indice.json' ao final, com nome, tamanho
+    e MD5 de cada original.
+    Retorna (indice, md5_bundle), com o MD5 do bundle calculado na escrita.
+    """
+    entradas = []
+    with open(caminho_bundle, "wb") as saida:
+        hash_bundle = integridade.HashEmFluxo(saida)
+        with tarfile.open(fileobj=hash_bundle, mode="w|gz", bufsize=TAMANHO_BLOCO) as tar:
+            for caminho in caminhos:
+                info = tar.gettarinfo(caminho, arcname=os.path.basename(caminho))
+                with open(caminho, "rb") as f:
+                    leitor = _LeitorComHash(f)
+                    tar.addfile(info, leitor)
+                entradas.append({
+                    "nome": info.name,
+                    "tamanho": info.size,
+                    "md5": leitor.md5.hexdigest(),
+                    "mtime": info.mtime
+                })
+
+            indice = {"run_id": run_id, "criado_em": time.time(), "arquivos": entradas}
+            dados_indice = _serializar_indice(indice)
+            info_indice = tarfile.TarInfo(NOME_INDICE)
+            info_indice.size = len(dados_indice)
+            info_indice.mtime = int(time.time())
+            tar.addfile(info_indice, io.BytesIO(dados_indice))
+
+    logger.info(f"✓ Bundle '{os.path.basename(caminho_bundle)}' criado: {len(entradas)} arquivo(s), "
+                f"{hash_bundle.tamanho} bytes")
+    return indice, hash_bundle.hexdigest()
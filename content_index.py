@@ -0,0 +1,217 @@
+# content_index.py
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def dedup_habilitado():
+    """Deduplicação por conteúdo (CONTENT_DEDUP, padrão desligado)"""
+    return os.getenv('CONTENT_DEDUP', 'false').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+class IndiceConteudo:
+    """
+    Índice persistente de conteúdo já enviado ao Drive: MD5 -> arquivos
+    (pasta, drive_id, nome). Permite pular conteúdo que já está na pasta de
+    destino ou copiá-lo no servidor quando só o nome difere.
+
+    Formato em disco (JSON):
+        {"arquivos": {md5: [{"pasta": ..., "drive_id": ..., "nome": ..., "ts": ...}]}}
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.arquivos = {}
+        self._alterado = False
+        self._lock = threading.Lock()
+
+    def carregar(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                self.arquivos = json.load(f).get("arquivos", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.arquivos = {}
+        except Exception as e:
+            logger.warning(f"Erro ao ler índice de conteúdo: {e}")
+            self.arquivos = {}
+        return self
+
+    def salvar(self):
+        """Grava o índice de forma atômica (só se houve alteração)"""
+        with self._lock:
+            if not self._alterado:
+                return
+            try:
+                Path(os.path.dirname(self.caminho)).mkdir(parents=True, exist_ok=True)
+                caminho_tmp = self.caminho + ".tmp"
+                with open(caminho_tmp, "w", encoding="utf-8") as f:
+                    json.dump({"arquivos": self.arquivos}, f, ensure_ascii=False)
+                os.replace(caminho_tmp, self.caminho)
+                self._alterado = False
+            except Exception as e:
+                logger.warning(f"Erro ao salvar índice de conteúdo: {e}")
+
+    def localizar(self, md5, pasta):
+        """Entradas com este conteúdo na pasta informada"""
+        with self._lock:
+            return [dict(e) for e in self.arquivos.get(md5, []) if e["pasta"] == pasta]
+
+    def qualquer(self, md5):
+        """Qualquer entrada com este conteúdo (em qualquer pasta), ou None"""
+        with self._lock:
+            entradas = self.arquivos.get(md5)
+            return dict(entradas[0]) if entradas else None
+
+    def registrar(self, md5, pasta, drive_id, nome):
+        if not md5 or not drive_id:
+            return
+        with self._lock:
+            entradas = self.arquivos.setdefault(md5, [])
+            entradas[:] = [e for e in entradas if e["drive_id"] != drive_id]
+            entradas.append({"pasta": pasta, "drive_id": drive_id, "nome": nome, "ts": time.time()})
+            self._alterado = True
+
+    def esquecer(self, md5, drive_id):
+        """Remove uma entrada que não existe mais no Drive"""
+        with self._lock:
+            entradas = [e for e in self.arquivos.get(md5, []) if e["drive_id"] != drive_id]
+            if entradas:
+                self.arquivos[md5] = entradas
+            else:
+                self.arquivos.pop(md5, None)
+            self._alterado = True
+
+    def esquecer_pasta(self, pasta):
+        """Remove todas as entradas de uma pasta (ex.: após limpá-la no Drive)"""
+        with self._lock:
+            for md5 in list(self.arquivos):
+                entradas = [e for e in self.arquivos[md5] if e["pasta"] != pasta]
+                if entradas:
+                    self.arquivos[md5] = entradas
+                else:
+                    del self.arquivos[md5]
+            self._alterado = True
+
+class EnvioDeduplicado:
+    """
+    Decide, para cada arquivo, entre pular (conteúdo e nome já na pasta,
+    conferidos no Drive), copiar no servidor (conteúdo já no Drive com outro
+    nome/pasta) ou enviar. Contabiliza os bytes de upload economizados.
+    """
+
+    def __init__(self, indice, uploader):
+        self.indice = indice
+        self.uploader = uploader  # módulo upload_gdrive (upload_file_to_folder / copy_file_to_folder / get_file_metadata)
+        self.contagem = {"enviados": 0, "existentes": 0, "copiados": 0}
+        self.bytes_economizados = 0
+        self._lock = threading.Lock()
+
+    def _contar(self, acao, tamanho=0):
+        with self._lock:
+            self.contagem[acao] += 1
+            if acao != "enviados":
+                self.bytes_economizados += tamanho
+
+    def _planejar(self, caminho_local, pasta_id, md5, metadados):
+        """
+        Decide a ação para o arquivo: ("existente", drive_id), ("copiar", origem)
+        ou ("enviar", None). Não acessa o Drive: "existente" ainda é conferido
+        com files.get antes de ser aceito.
+        """
+        if not md5 or self.indice is None:
+            return "enviar", None
+        nome = os.path.basename(caminho_local)
+        na_pasta = self.indice.localizar(md5, pasta_id)
+        for entrada in na_pasta:
+            if entrada["nome"] == nome:
+                metadados.update({"id": entrada["drive_id"], "name": nome, "md5Checksum": md5})
+                return "existente", entrada["drive_id"]
+        origem = na_pasta[0] if na_pasta else self.indice.qualquer(md5)
+        return ("copiar", origem) if origem else ("enviar", None)
+
+    def _conferir_existente(self, md5, drive_id, arquivo, metadados):
+        """
+        Confirma a entrada do índice com a consulta ao Drive ('arquivo', de
+        files.get): o arquivo precisa existir, estar fora da lixeira e ter o
+        mesmo MD5. Caso contrário a entrada é esquecida e retorna False.
+        """
+        if arquivo and not arquivo.get("trashed") and arquivo.get("md5Checksum") == md5:
+            return True
+        logger.info(f"Índice de conteúdo desatualizado: {drive_id} não confere no Drive; enviando novamente")
+        self.indice.esquecer(md5, drive_id)
+        metadados.clear()
+        return False
+
+    def _apos_copia(self, caminho_local, pasta_id, md5, origem, drive_id, tamanho):
+        """Registra a cópia; retorna False se o original sumiu (enviar normalmente)"""
+        if drive_id:
+            self.indice.registrar(md5, pasta_id, drive_id, os.path.basename(caminho_local))
+            self._contar("copiados", tamanho)
+            return True
+        # Original sumiu do Drive: esquecer e enviar normalmente
+        self.indice.esquecer(md5, origem["drive_id"])
+        return False
+
+    def _apos_envio(self, caminho_local, pasta_id, md5, drive_id, metadados):
+        if drive_id:
+            if self.indice is not None:
+                self.indice.registrar(metadados.get("md5Checksum") or md5, pasta_id, drive_id,
+                                      os.path.basename(caminho_local))
+            self._contar("enviados")
+
+    def enviar(self, service, caminho_local, pasta_id, md5, metadados=None):
+        """
+        Garante o conteúdo de 'caminho_local' na pasta com o nome do arquivo.
+        Retorna (drive_id, acao) com acao em "existente", "copiado" ou "enviado";
+        drive_id None em caso de falha.
+        """
+        metadados = metadados if metadados is not None else {}
+        tamanho = os.path.getsize(caminho_local) if os.path.exists(caminho_local) else 0
+
+        acao, alvo = self._planejar(caminho_local, pasta_id, md5, metadados)
+        while acao == "existente":
+            if self._conferir_existente(md5, alvo, self.uploader.get_file_metadata(service, alvo), metadados):
+                self._contar("existentes", tamanho)
+                return alvo, "existente"
+            acao, alvo = self._planejar(caminho_local, pasta_id, md5, metadados)
+        if acao == "copiar":
+            nome = os.path.basename(caminho_local)
+            drive_id = self.uploader.copy_file_to_folder(service, alvo["drive_id"], pasta_id, nome, metadados=metadados)
+            if self._apos_copia(caminho_local, pasta_id, md5, alvo, drive_id, tamanho):
+                return drive_id, "copiado"
+
+        drive_id = self.uploader.upload_file_to_folder(service, caminho_local, pasta_id, metadados=metadados)
+        self._apos_envio(caminho_local, pasta_id, md5, drive_id, metadados)
+        return drive_id, "enviado"
+
+    async def enviar_async(self, cliente, caminho_local, pasta_id, md5, metadados=None):
+        """
+        Versão assíncrona de enviar(): 'cliente' é um drive_async.ClienteDriveAsync
+        (mesma interface do upload_gdrive, sem o service).
+        """
+        metadados = metadados if metadados is not None else {}
+        tamanho = os.path.getsize(caminho_local) if os.path.exists(caminho_local) else 0
+
+        acao, alvo = self._planejar(caminho_local, pasta_id, md5, metadados)
+        while acao == "existente":
+            if self._conferir_existente(md5, alvo, await cliente.get_file_metadata(alvo), metadados):
+                self._contar("existentes", tamanho)
+                return alvo, "existente"
+            acao, alvo = self._planejar(caminho_local, pasta_id, md5, metadados)
+        if acao == "copiar":
+            nome = os.path.basename(caminho_local)
+            drive_id = await cliente.copy_file_to_folder(alvo["drive_id"], pasta_id, nome, metadados=metadados)
+            if self._apos_copia(caminho_local, pasta_id, md5, alvo, drive_id, tamanho):
+                return drive_id, "copiado"
+
+        drive_id = await cliente.upload_file_to_folder(caminho_local, pasta_id, metadados=metadados)
+        self._apos_envio(caminho_local, pasta_id, md5, drive_id, metadados)
+        return drive_id, "enviado"
+
+    def resumo(self):
+        return {**self.contagem, "bytes_upload_economizados": self.bytes_economizados}
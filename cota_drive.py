@@ -0,0 +1,381 @@
+# cota_drive.py
+
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+import urllib.parse
+from pathlib import Path
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+JANELA_HORA_S = 3600
+
+def _inteiro_env(nome, padrao=0):
+    try:
+        return max(0, int(os.getenv(nome, padrao) or 0))
+    except ValueError:
+        return padrao
+
+def get_orcamento_execucao():
+    """Máximo de chamadas à API do Drive por execução (DRIVE_CALL_BUDGET_RUN, 0 = sem limite)"""
+    return _inteiro_env('DRIVE_CALL_BUDGET_RUN')
+
+def get_orcamento_hora():
+    """Máximo de chamadas à API do Drive em qualquer janela de 1 hora (DRIVE_CALL_BUDGET_HOUR, 0 = sem limite)"""
+    return _inteiro_env('DRIVE_CALL_BUDGET_HOUR')
+
+def get_espera_maxima():
+    """Quanto (s) uma chamada pode esperar a janela horária liberar antes de o arquivo ser adiado (DRIVE_BUDGET_MAX_WAIT)"""
+    try:
+        return max(0.0, float(os.getenv('DRIVE_BUDGET_MAX_WAIT', 60)))
+    except ValueError:
+        return 60.0
+
+_ROTA_ID = re.compile(r"^files/[^/]+$")
+
+def nome_chamada(verbo, url):
+    """Método da API a partir do verbo HTTP e da URL (ex.: 'files.list', 'permissions.create')"""
+    caminho = urllib.parse.urlsplit(url).path
+    upload = "/upload/" in caminho
+    caminho = caminho.split("/drive/v3/", 1)[-1].strip("/")
+    if upload:
+        return "upload.bloco" if verbo == "PUT" else "files.create"
+    if caminho == "files":
+        return "files.list" if verbo == "GET" else "files.create"
+    if _ROTA_ID.match(caminho):
+        return {"GET": "files.get", "DELETE": "files.delete", "PATCH": "files.update"}.get(verbo, f"files.{verbo.lower()}")
+    if caminho.endswith("/copy"):
+        return "files.copy"
+    if "/permissions" in caminho:
+        return "permissions.create" if verbo == "POST" else f"permissions.{verbo.lower()}"
+    return f"{verbo} {caminho}"
+
+def classificar(status):
+    """Resultado de uma chamada: ok, 403, 429, 4xx, 5xx ou conexao (sem resposta)"""
+    if status is None:
+        return "conexao"
+    if status < 400:
+        return "ok"
+    if status in (403, 429):
+        return str(status)
+    return "5xx" if status >= 500 else "4xx"
+
+class OrcamentoEsgotado(Exception):
+    """Sem orçamento de chamadas ao Drive para continuar: o trabalho fica para a próxima execução"""
+
+class ContadorChamadas:
+    """Chamadas à API do Drive por método e resultado (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chamadas = {}
+
+    def registrar(self, metodo, status):
+        resultado = classificar(status)
+        with self._lock:
+            por_resultado = self.chamadas.setdefault(metodo, {})
+            por_resultado[resultado] = por_resultado.get(resultado, 0) + 1
+
+    def total(self):
+        with self._lock:
+            return sum(sum(r.values()) for r in self.chamadas.values())
+
+    def resumo(self):
+        with self._lock:
+            return {metodo: dict(r) for metodo, r in sorted(self.chamadas.items())}
+
+class JanelaHora:
+    """
+    Chamadas por minuto da última hora, somando todas as execuções do
+    processo e, via arquivo de estado, as execuções anteriores (CLI/cron).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.minutos = {}
+        self._carregada = False
+
+    def _podar(self, agora):
+        limite = int(agora // 60) - JANELA_HORA_S // 60
+        for minuto in [m for m in self.minutos if m <= limite]:
+            del self.minutos[minuto]
+
+    def carregar(self, caminho):
+        with self._lock:
+            if self._carregada:
+                return
+            self._carregada = True
+            try:
+                with open(caminho, "r", encoding="utf-8") as f:
+                    for minuto, quantidade in json.load(f).get("minutos", {}).items():
+                        self.minutos[int(minuto)] = self.minutos.get(int(minuto), 0) + quantidade
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+            except Exception as e:
+                logger.warning(f"Erro ao ler janela de chamadas ao Drive: {e}")
+            self._podar(time.time())
+
+    def salvar(self, caminho):
+        with self._lock:
+            self._podar(time.time())
+            dados = {"minutos": {str(m): q for m, q in sorted(self.minutos.items())}}
+        try:
+            Path(os.path.dirname(caminho)).mkdir(parents=True, exist_ok=True)
+            caminho_tmp = caminho + ".tmp"
+            with open(caminho_tmp, "w", encoding="utf-8") as f:
+                json.dump(dados, f)
+            os.replace(caminho_tmp, caminho)
+        except Exception as e:
+            logger.warning(f"Erro ao salvar janela de chamadas ao Drive: {e}")
+
+    def _espera(self, limite, quantidade, agora):
+        """Segundos até 'quantidade' chamadas caberem no limite da última hora (0 = cabem já)"""
+        usadas = sum(self.minutos.values())
+        if not limite or usadas + quantidade <= limite:
+            return 0.0
+        # Espera até saírem da janela os minutos mais antigos necessários
+        excesso = usadas + quantidade - limite
+        for minuto in sorted(self.minutos):
+            excesso -= self.minutos[minuto]
+            if excesso <= 0:
+                return max(0.0, minuto * 60 + JANELA_HORA_S - agora)
+        return float(JANELA_HORA_S)
+
+    def espera(self, limite, quantidade=1):
+        """Como reservar(), mas sem contar nada"""
+        agora = time.time()
+        with self._lock:
+            self._podar(agora)
+            return self._espera(limite, quantidade, agora)
+
+    def reservar(self, limite, quantidade=1):
+        """
+        Conta 'quantidade' chamadas se couberem no limite da última hora e
+        devolve 0; senão não conta nada e devolve os segundos até caber.
+        """
+        agora = time.time()
+        with self._lock:
+            self._podar(agora)
+            espera = self._espera(limite, quantidade, agora)
+            if not espera:
+                minuto = int(agora // 60)
+                self.minutos[minuto] = self.minutos.get(minuto, 0) + quantidade
+            return espera
+
+    def usadas(self):
+        with self._lock:
+            self._podar(time.time())
+            return sum(self.minutos.values())
+
+# ✅ Contadores do processo (todas as execuções; expostos em /admin/drive-calls)
+CONTADOR = ContadorChamadas()
+JANELA = JanelaHora()
+_JANELAS_PERFIS = {}
+_lock_janelas = threading.Lock()
+
+def janela(perfil=None):
+    """
+    Janela horária das credenciais de um perfil (perfis.py): a cota do
+    Drive é por conta, então cada perfil nomeado tem a sua; o padrão usa JANELA
+    """
+    if not perfil or perfil == "padrao":
+        return JANELA
+    with _lock_janelas:
+        return _JANELAS_PERFIS.setdefault(perfil, JanelaHora())
+
+class OrcamentoChamadas:
+    """
+    Contabilidade e orçamento das chamadas ao Drive de uma execução.
+    Toda chamada (cliente síncrono via instrumentar(), cliente assíncrono
+    via drive_async) passa por aguardar() antes e registrar() depois:
+    - DRIVE_CALL_BUDGET_HOUR: na janela de 1 hora cheia, a chamada espera
+      a janela liberar (até DRIVE_BUDGET_MAX_WAIT s), reduzindo o ritmo em
+      vez de esbarrar no 403 de cota do Drive;
+    - DRIVE_CALL_BUDGET_RUN: teto da execução.
+    A fila de uploads admite cada arquivo (admitir) antes de enviá-lo: sem
+    orçamento para ele, o arquivo é adiado e fica no FTP para a próxima
+    execução. Fora disso, aguardar() levanta OrcamentoEsgotado no teto.
+    """
+
+    def __init__(self, caminho, por_execucao=None, por_hora=None, espera_maxima=None, janela=None):
+        self.caminho = caminho
+        self.por_execucao = get_orcamento_execucao() if por_execucao is None else por_execucao
+        self.por_hora = get_orcamento_hora() if por_hora is None else por_hora
+        self.espera_maxima = get_espera_maxima() if espera_maxima is None else espera_maxima
+        self.janela = janela or JANELA
+        self.contador = ContadorChamadas()
+        self.usadas = 0        # chamadas feitas (passaram por aguardar)
+        self.comprometidas = 0  # usadas + previstas para os arquivos já admitidos
+        self.espera_total = 0.0
+        self.adiados = 0
+        self.por_arquivo = 2
+        self.extra_arquivo = 0  # chamadas fixas além do upload (ex.: transferência de propriedade)
+        self.bloco = None       # bytes por PUT do upload resumable; None = um único PUT
+        self.estimativa = None
+        self._lock = threading.Lock()
+
+    def carregar(self):
+        self.janela.carregar(self.caminho)
+        return self
+
+    def salvar(self):
+        self.janela.salvar(self.caminho)
+
+    def restante(self):
+        """Chamadas ainda disponíveis (o menor entre execução e janela horária), None sem orçamento"""
+        restantes = []
+        if self.por_execucao:
+            with self._lock:
+                restantes.append(max(0, self.por_execucao - max(self.usadas, self.comprometidas)))
+        if self.por_hora:
+            restantes.append(max(0, self.por_hora - self.janela.usadas()))
+        return min(restantes) if restantes else None
+
+    def _reservar(self, quantidade=1):
+        """Segundos a esperar antes de tentar de novo (0 = reservado); OrcamentoEsgotado se não há como"""
+        with self._lock:
+            if self.por_execucao and self.usadas + quantidade > self.por_execucao:
+                raise OrcamentoEsgotado(f"orçamento da execução ({self.por_execucao} chamadas) esgotado")
+            espera = self.janela.reservar(self.por_hora, quantidade)
+            if espera > self.espera_maxima:
+                raise OrcamentoEsgotado(
+                    f"orçamento horário ({self.por_hora} chamadas) esgotado; libera em {espera:.0f}s")
+            if not espera:
+                self.usadas += quantidade
+            return espera
+
+    def aguardar(self, metodo=None):
+        """Reserva uma chamada, dormindo o necessário para caber na janela horária"""
+        while True:
+            espera = self._reservar()
+            if not espera:
+                return
+            self._esperou(metodo, espera)
+            time.sleep(espera)
+
+    async def aguardar_async(self, metodo=None):
+        while True:
+            espera = self._reservar()
+            if not espera:
+                return
+            self._esperou(metodo, espera)
+            await asyncio.sleep(espera)
+
+    def _esperou(self, metodo, espera):
+        with self._lock:
+            self.espera_total += espera
+        logger.info(f"⏳ Orçamento horário de chamadas ao Drive cheio: {metodo or 'chamada'} aguarda {espera:.1f}s")
+
+    def registrar(self, metodo, status):
+        self.contador.registrar(metodo, status)
+        CONTADOR.registrar(metodo, status)
+
+    def admitir(self, chamadas):
+        """
+        Admite um arquivo que precisa de 'chamadas' chamadas, comprometendo-as
+        no orçamento da execução (um arquivo admitido termina o envio).
+        Devolve None, ou o motivo para adiá-lo.
+        """
+        with self._lock:
+            base = max(self.usadas, self.comprometidas)
+            if self.por_execucao and base + chamadas > self.por_execucao:
+                return f"orçamento da execução ({self.por_execucao} chamadas) esgotado"
+            if self.por_hora and self.janela.espera(self.por_hora, chamadas) > self.espera_maxima:
+                return f"orçamento horário ({self.por_hora} chamadas) esgotado"
+            self.comprometidas = base + chamadas
+            return None
+
+    def adiar(self):
+        with self._lock:
+            self.adiados += 1
+
+    def chamadas_arquivo(self, tamanho):
+        """
+        Chamadas para enviar um arquivo de 'tamanho' bytes: abertura da sessão
+        resumable, um upload.bloco por bloco (um só sem bloco definido) e as
+        chamadas fixas por arquivo
+        """
+        blocos = max(1, -(-int(tamanho or 0) // self.bloco)) if self.bloco else 1
+        return 1 + blocos + self.extra_arquivo
+
+    def estimar(self, tamanhos, dono=False, extras=0, bloco=None):
+        """
+        Chamadas previstas para enviar arquivos com os 'tamanhos' informados
+        (o bundle DevolucaoAR conta como um arquivo): upload resumable em
+        blocos de 'bloco' bytes (ver chamadas_arquivo) e, com dono
+        configurado, a transferência de propriedade. Define também o custo
+        usado em admitir() para cada arquivo.
+        """
+        self.extra_arquivo = 1 if dono else 0
+        self.bloco = bloco
+        chamadas = sum(self.chamadas_arquivo(t) for t in tamanhos)
+        envios = len(tamanhos)
+        self.por_arquivo = -(-chamadas // envios) if envios else 2 + self.extra_arquivo
+        self.estimativa = {"arquivos": envios, "por_arquivo": self.por_arquivo, "bloco": bloco,
+                           "chamadas": chamadas + extras}
+        return self.estimativa
+
+    def resumo(self):
+        return {
+            "chamadas": self.contador.total(),
+            "por_metodo": self.contador.resumo(),
+            "estimativa": self.estimativa,
+            "orcamento_execucao": self.por_execucao or None,
+            "orcamento_hora": self.por_hora or None,
+            "usadas_ultima_hora": self.janela.usadas(),
+            "segundos_em_espera": round(self.espera_total, 3),
+            "arquivos_adiados": self.adiados,
+        }
+
+class HttpContado:
+    """
+    Envolve o objeto http do googleapiclient: cada requisição passa pelo
+    orçamento e é contabilizada por método e resultado. Os demais atributos
+    são delegados ao http original.
+    """
+
+    def __init__(self, http, orcamento):
+        self._http = http
+        self._orcamento = orcamento
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        metodo = nome_chamada(method, uri)
+        self._orcamento.aguardar(metodo)
+        try:
+            resposta, conteudo = self._http.request(uri, method, *args, **kwargs)
+        except Exception:
+            self._orcamento.registrar(metodo, None)
+            raise
+        self._orcamento.registrar(metodo, resposta.status)
+        return resposta, conteudo
+
+    def __getattr__(self, nome):
+        return getattr(self._http, nome)
+
+def instrumentar(service, orcamento):
+    """Passa as chamadas do serviço googleapiclient (e dos recursos criados a partir dele) pelo orçamento"""
+    if service is not None and not isinstance(service._http, HttpContado):
+        service._http = HttpContado(service._http, orcamento)
+    return service
+
+def registrar(metodo, status):
+    """Contabiliza uma chamada feita sem orçamento de execução (só nos contadores do processo)"""
+    CONTADOR.registrar(metodo, status)
+
+def status():
+    """Chamadas do processo por método/resultado e uso da janela horária"""
+    with _lock_janelas:
+        janelas_perfis = dict(_JANELAS_PERFIS)
+    return {
+        "chamadas": CONTADOR.total(),
+        "por_metodo": CONTADOR.resumo(),
+        "usadas_ultima_hora": JANELA.usadas(),
+        "usadas_ultima_hora_perfis": {nome: j.usadas() for nome, j in sorted(janelas_perfis.items())} or None,
+        "orcamento_execucao": get_orcamento_execucao() or None,
+        "orcamento_hora": get_orcamento_hora() or None,
+    }
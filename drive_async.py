@@ -0,0 +1,402 @@
+# drive_async.py
+
+import os
+import ssl
+import json
+import asyncio
+import mimetypes
+import urllib.parse
+from google.auth.transport.requests import Request
+import logging
+import tracing
+import logging_setup
+import banda
+import cota_drive
+import perfis
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 256 * 1024
+CAMPOS_ARQUIVO = 'id, name, md5Checksum'
+
+def _timeout():
+    return float(os.getenv('DRIVE_ASYNC_TIMEOUT', 120))
+
+class ErroDrive(Exception):
+    """Resposta HTTP de erro da API do Drive (equivale ao HttpError do googleapiclient)"""
+
+    def __init__(self, status, conteudo=b""):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.conteudo = conteudo
+
+    def texto(self):
+        return self.conteudo.decode("utf-8", "replace")
+
+class _ConexaoEncerrada(ConnectionError):
+    """O servidor fechou a conexão antes de qualquer byte da resposta"""
+
+class PoolHTTPAsync:
+    """
+    Conexões HTTP/1.1 persistentes (keep-alive) com um único host, sobre
+    asyncio streams. Uma requisição por conexão de cada vez; conexões livres
+    são reaproveitadas (LIFO). Se uma conexão reaproveitada tiver sido
+    fechada pelo servidor enquanto ociosa, a requisição é repetida numa nova.
+    """
+
+    def __init__(self, url_base):
+        partes = urllib.parse.urlsplit(url_base)
+        self.host = partes.hostname
+        self.https = partes.scheme == "https"
+        self.port = partes.port or (443 if self.https else 80)
+        self._cabecalho_host = self.host if partes.port is None else f"{self.host}:{self.port}"
+        self._ssl = ssl.create_default_context() if self.https else None
+        self._livres = []
+        self.conexoes_abertas = 0
+        self.requisicoes = 0
+
+    async def _abrir(self):
+        conexao = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl), _timeout()
+        )
+        self.conexoes_abertas += 1
+        return conexao
+
+    async def requisicao(self, metodo, url, cabecalhos=None, corpo=b""):
+        """
+        Envia a requisição e devolve (status, cabecalhos, conteudo). 'corpo' é
+        bytes ou uma função sem argumentos que devolve um iterador assíncrono
+        de blocos (chamada de novo se a requisição for repetida); nesse caso
+        Content-Length deve vir em 'cabecalhos'.
+        """
+        partes = urllib.parse.urlsplit(url)
+        alvo = (partes.path or "/") + (f"?{partes.query}" if partes.query else "")
+        for tentativa in range(2):
+            reutilizada = bool(self._livres)
+            conexao = self._livres.pop() if reutilizada else await self._abrir()
+            try:
+                status, resposta, conteudo, manter = await self._trocar(conexao, metodo, alvo, cabecalhos or {}, corpo)
+            except (_ConexaoEncerrada, ConnectionResetError, BrokenPipeError):
+                conexao[1].close()
+                if reutilizada and tentativa == 0:
+                    continue
+                raise
+            except BaseException:
+                conexao[1].close()
+                raise
+            self.requisicoes += 1
+            if manter:
+                self._livres.append(conexao)
+            else:
+                conexao[1].close()
+            return status, resposta, conteudo
+
+    async def _linha(self, leitor):
+        return await asyncio.wait_for(leitor.readline(), _timeout())
+
+    async def _trocar(self, conexao, metodo, alvo, cabecalhos, corpo):
+        leitor, escritor = conexao
+        cabecalhos = {"Host": self._cabecalho_host, "Accept-Encoding": "identity", **cabecalhos}
+        if not callable(corpo):
+            cabecalhos["Content-Length"] = str(len(corpo))
+        linhas = [f"{metodo} {alvo} HTTP/1.1"] + [f"{nome}: {valor}" for nome, valor in cabecalhos.items()]
+        escritor.write(("\r\n".join(linhas) + "\r\n\r\n").encode("latin-1"))
+        if callable(corpo):
+            async for bloco in corpo():
+                escritor.write(bloco)
+                await escritor.drain()
+        elif corpo:
+            escritor.write(corpo)
+        await escritor.drain()
+
+        # Linha de status (respostas 1xx são descartadas)
+        while True:
+            linha = await self._linha(leitor)
+            if not linha:
+                raise _ConexaoEncerrada("Conexão encerrada pelo servidor")
+            status = int(linha.split(None, 2)[1])
+            resposta = {}
+            while True:
+                linha = await self._linha(leitor)
+                if linha in (b"\r\n", b"\n", b""):
+                    break
+                nome, _, valor = linha.decode("latin-1").partition(":")
+                resposta[nome.strip().lower()] = valor.strip()
+            if status >= 200:
+                break
+
+        manter = resposta.get("connection", "").lower() != "close"
+        try:
+            if metodo == "HEAD" or status in (204, 304):
+                conteudo = b""
+            elif resposta.get("transfer-encoding", "").lower() == "chunked":
+                partes = []
+                while True:
+                    tamanho = int((await self._linha(leitor)).split(b";")[0], 16)
+                    if tamanho == 0:
+                        while (await self._linha(leitor)) not in (b"\r\n", b"\n", b""):
+                            pass
+                        break
+                    partes.append(await asyncio.wait_for(leitor.readexactly(tamanho + 2), _timeout()))
+                conteudo = b"".join(p[:-2] for p in partes)
+            elif "content-length" in resposta:
+                conteudo = await asyncio.wait_for(leitor.readexactly(int(resposta["content-length"])), _timeout())
+            else:
+                conteudo = await asyncio.wait_for(leitor.read(), _timeout())
+                manter = False
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionResetError("Resposta incompleta do servidor") from e
+        return status, resposta, conteudo, manter
+
+    async def fechar(self):
+        livres, self._livres = self._livres, []
+        for _, escritor in livres:
+            escritor.close()
+        for _, escritor in livres:
+            try:
+                await escritor.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+class ClienteDriveAsync:
+    """
+    Cliente assíncrono da API v3 do Drive para o caminho de upload, com a
+    mesma interface e contrato do upload_gdrive (retorna o ID ou None e
+    registra o erro): upload_file_to_folder, copy_file_to_folder e
+    transferir_propriedade. Usa as credenciais do get_drive_service();
+    a renovação do token roda numa thread (google-auth é síncrono).
+
+    Uso:
+        async with ClienteDriveAsync(credenciais) as cliente:
+            drive_id = await cliente.upload_file_to_folder(caminho, pasta_id)
+    """
+
+    def __init__(self, credenciais, url_base=None, ao_responder=None, orcamento=None):
+        self.credenciais = credenciais
+        self.ao_responder = ao_responder  # recebe o status HTTP de cada resposta, None se a conexão falhou (ex.: autotune)
+        self.orcamento = orcamento  # cota_drive.OrcamentoChamadas: contabiliza e limita as chamadas
+        self.url_base = (url_base or os.getenv('DRIVE_API_URL') or 'https://www.googleapis.com/').rstrip("/") + "/"
+        self._pool = PoolHTTPAsync(self.url_base)
+        self._lock_token = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._pool.fechar()
+
+    async def _autorizar(self, cabecalhos, forcar=False):
+        async with self._lock_token:
+            if forcar or not self.credenciais.valid:
+                await asyncio.to_thread(self.credenciais.refresh, Request())
+        self.credenciais.apply(cabecalhos)
+        return cabecalhos
+
+    async def _chamar(self, metodo, caminho, parametros=None, dados=None, cabecalhos=None, corpo=b""):
+        """Chamada à API; retorna (cabecalhos, json). Levanta ErroDrive para status >= 400"""
+        url = caminho if caminho.startswith(("http://", "https://")) else self.url_base + caminho
+        if parametros:
+            url += ("&" if "?" in url else "?") + urllib.parse.urlencode(parametros)
+        cabecalhos = dict(cabecalhos or {})
+        if dados is not None:
+            corpo = json.dumps(dados).encode("utf-8")
+            cabecalhos["Content-Type"] = "application/json; charset=UTF-8"
+        metodo_api = cota_drive.nome_chamada(metodo, url)
+        registrar = self.orcamento.registrar if self.orcamento else cota_drive.registrar
+        for tentativa in range(2):
+            await self._autorizar(cabecalhos, forcar=tentativa > 0)
+            if self.orcamento:
+                await self.orcamento.aguardar_async(metodo_api)
+            try:
+                status, resposta, conteudo = await self._pool.requisicao(metodo, url, cabecalhos, corpo)
+            except (ConnectionError, asyncio.TimeoutError):
+                registrar(metodo_api, None)
+                if self.ao_responder:
+                    self.ao_responder(None)
+                raise
+            registrar(metodo_api, status)
+            if self.ao_responder:
+                self.ao_responder(status)
+            # Token revogado/expirado antes do previsto: renovar uma vez
+            if status != 401:
+                break
+        if status >= 400:
+            raise ErroDrive(status, conteudo)
+        return resposta, (json.loads(conteudo) if conteudo else {})
+
+    async def transferir_propriedade(self, file_id, file_name_uploaded):
+        """Equivalente a upload_gdrive.transferir_propriedade: owner e, se falhar, writer"""
+        novo_dono = perfis.atual().novo_dono
+        if not novo_dono:
+            logger.debug("NEW_OWNER_EMAIL não definido. Propriedade não será transferida.")
+            return
+        nivel_arquivo = logging_setup.nivel_por_arquivo()
+        caminho = f"drive/v3/files/{urllib.parse.quote(file_id)}/permissions"
+        try:
+            with tracing.span("drive.permissions.create", arquivo=file_name_uploaded, role="owner") as sp_perm:
+                try:
+                    await self._chamar("POST", caminho, {"transferOwnership": "true", "supportsAllDrives": "true"},
+                                       {"role": "owner", "type": "user", "emailAddress": novo_dono})
+                    sp_perm.definir(http_status=200)
+                except ErroDrive as e_perm:
+                    sp_perm.definir(http_status=e_perm.status)
+                    raise
+            logger.log(nivel_arquivo, "✓ Propriedade do arquivo '%s' transferida para %s", file_name_uploaded, novo_dono)
+        except ErroDrive as e_owner:
+            logger.log(nivel_arquivo, "Falha ao transferir propriedade para %s. Erro: %s - %s", novo_dono, e_owner.status, e_owner.texto())
+            try:
+                with tracing.span("drive.permissions.create", arquivo=file_name_uploaded, role="writer") as sp_perm:
+                    try:
+                        await self._chamar("POST", caminho, {"supportsAllDrives": "true"},
+                                           {"role": "writer", "type": "user", "emailAddress": novo_dono})
+                        sp_perm.definir(http_status=200)
+                    except ErroDrive as e_perm:
+                        sp_perm.definir(http_status=e_perm.status)
+                        raise
+                logger.log(nivel_arquivo, "✓ Arquivo '%s' compartilhado com %s como editor.", file_name_uploaded, novo_dono)
+            except ErroDrive as e_writer:
+                logger.error(f"Falha ao compartilhar como editor com {novo_dono}. Erro: {e_writer.status} - {e_writer.texto()}")
+            except Exception as e_writer_generic:
+                logger.error(f"Erro inesperado ao compartilhar como editor com {novo_dono}: {e_writer_generic}")
+        except Exception as e_owner_generic:
+            logger.error(f"Erro inesperado ao tentar transferir propriedade para {novo_dono}: {e_owner_generic}")
+
+    async def upload_file_to_folder(self, local_file_path, folder_id, drive_filename=None, metadados=None):
+        """
+        Upload resumável (sessão + um único PUT com o arquivo em blocos pelo
+        limitador de banda 'drive') seguido da transferência de propriedade.
+
+        Returns:
+            str: ID do arquivo no Drive se sucesso, None se falha
+        """
+        if not os.path.exists(local_file_path):
+            logger.error(f"Arquivo local não encontrado: {local_file_path}")
+            return None
+
+        if drive_filename is None:
+            drive_filename = os.path.basename(local_file_path)
+
+        mimetype, _ = mimetypes.guess_type(local_file_path)
+        if mimetype is None:
+            mimetype = 'application/octet-stream'
+        tamanho = os.path.getsize(local_file_path)
+        limitador = banda.limitador("drive")
+
+        async def blocos():
+            # Abertura e leituras do disco fora do event loop
+            arquivo_local = await asyncio.to_thread(open, local_file_path, "rb")
+            try:
+                while True:
+                    bloco = await asyncio.to_thread(arquivo_local.read, TAMANHO_BLOCO)
+                    if not bloco:
+                        break
+                    await limitador.consumir_async(len(bloco))
+                    yield bloco
+            finally:
+                await asyncio.to_thread(arquivo_local.close)
+
+        try:
+            logger.debug("Iniciando upload: '%s' -> '%s'", os.path.basename(local_file_path), drive_filename)
+            with tracing.span("drive.files.create", arquivo=drive_filename, bytes=tamanho, modo="async") as sp_upload:
+                try:
+                    resposta, _ = await self._chamar(
+                        "POST", "upload/drive/v3/files",
+                        {"uploadType": "resumable", "fields": CAMPOS_ARQUIVO},
+                        {"name": drive_filename, "parents": [folder_id]},
+                        {"X-Upload-Content-Type": mimetype, "X-Upload-Content-Length": str(tamanho)}
+                    )
+                    _, file_obj = await self._chamar(
+                        "PUT", resposta["location"],
+                        cabecalhos={"Content-Type": mimetype, "Content-Length": str(tamanho)}, corpo=blocos
+                    )
+                    sp_upload.definir(http_status=200)
+                except ErroDrive as e_upload:
+                    sp_upload.definir(http_status=e_upload.status)
+                    raise
+
+            file_id = file_obj.get('id')
+            if metadados is not None:
+                metadados.update(file_obj)
+            file_name_uploaded = file_obj.get('name')
+
+            if not file_id:
+                logger.error(f"Falha ao obter ID do arquivo '{file_name_uploaded}' após upload.")
+                return None
+
+            logger.log(logging_setup.nivel_por_arquivo(), "✓ Upload concluído: '%s' (ID: %s)", file_name_uploaded, file_id)
+            await self.transferir_propriedade(file_id, file_name_uploaded)
+            return file_id
+
+        except ErroDrive as e:
+            logger.error(f'Erro HTTP no upload "{drive_filename}": {e.status} - {e.texto()}')
+            return None
+        except Exception as e:
+            logger.error(f'Erro inesperado no upload "{drive_filename}": {e!r}')
+            return None
+
+    async def get_file_metadata(self, file_id):
+        """
+        Consulta de um arquivo (files.get): existência, lixeira e MD5.
+
+        Returns:
+            dict: id, trashed e md5Checksum se sucesso, None se falha (inclusive 404)
+        """
+        try:
+            with tracing.span("drive.files.get", arquivo_id=file_id, modo="async") as sp_get:
+                try:
+                    _, file_obj = await self._chamar(
+                        "GET", f"drive/v3/files/{urllib.parse.quote(file_id)}",
+                        {"fields": "id, trashed, md5Checksum", "supportsAllDrives": "true"}
+                    )
+                    sp_get.definir(http_status=200)
+                except ErroDrive as e_get:
+                    sp_get.definir(http_status=e_get.status)
+                    raise
+            return file_obj
+
+        except ErroDrive as e:
+            logger.warning(f'Erro HTTP ao consultar o arquivo {file_id} no Drive: {e.status}')
+            return None
+        except Exception as e:
+            logger.warning(f'Erro inesperado ao consultar o arquivo {file_id} no Drive: {e!r}')
+            return None
+
+    async def copy_file_to_folder(self, file_id, folder_id, drive_filename, metadados=None):
+        """
+        Cópia no servidor (files.copy) com a mesma transferência de propriedade.
+
+        Returns:
+            str: ID da cópia se sucesso, None se falha
+        """
+        try:
+            with tracing.span("drive.files.copy", arquivo=drive_filename, modo="async") as sp_copy:
+                try:
+                    _, file_obj = await self._chamar(
+                        "POST", f"drive/v3/files/{urllib.parse.quote(file_id)}/copy",
+                        {"fields": CAMPOS_ARQUIVO, "supportsAllDrives": "true"},
+                        {"name": drive_filename, "parents": [folder_id]}
+                    )
+                    sp_copy.definir(http_status=200)
+                except ErroDrive as e_copy:
+                    sp_copy.definir(http_status=e_copy.status)
+                    raise
+
+            novo_id = file_obj.get('id')
+            if metadados is not None:
+                metadados.update(file_obj)
+            if not novo_id:
+                return None
+            logger.log(logging_setup.nivel_por_arquivo(), "✓ Cópia no Drive: '%s' (ID: %s)", drive_filename, novo_id)
+            await self.transferir_propriedade(novo_id, drive_filename)
+            return novo_id
+
+        except ErroDrive as e:
+            logger.warning(f'Erro HTTP ao copiar "{drive_filename}" no Drive: {e.status}')
+            return None
+        except Exception as e:
+            logger.warning(f'Erro inesperado ao copiar "{drive_filename}" no Drive: {e!r}')
+            return None
+
+    def resumo(self):
+        return {"conexoes_abertas": self._pool.conexoes_abertas, "requisicoes": self._pool.requisicoes}
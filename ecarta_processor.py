@@ -1,13 +1,31 @@
 # ecarta_processor.py
 
-from ftplib import FTP
+from ftplib import FTP, error_perm
+from contextlib import contextmanager, nullcontext
 import zipfile
 import os
+import json
+import time
+import hashlib
 import shutil
 import tempfile
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
+import tracing
+import logging_setup
+import run_journal
+import staging
+import staging_store
+import zip_extractor
+import integridade
+import ftp_listing
+import banda
+import ftp_async
+import ftp_pool
+import transferencias_async
+import perfis
 
 load_dotenv()
 
@@ -16,23 +34,46 @@ logger = logging.getLogger(__name__)
 
 # ✅ CORREÇÃO: Usar diretório temporário compatível com Vercel
 def get_temp_base_dir():
-    """Retorna diretório base temporário compatível com Vercel"""
+    """Retorna diretório base temporário compatível com Vercel (um por perfil)"""
     temp_dir = tempfile.gettempdir()  # /tmp no Vercel
     base_dir = os.path.join(temp_dir, "ecarta_processing")
-    return base_dir
+    return perfis.atual().diretorio_trabalho(base_dir)
 
-# ✅ Configurações de FTP
-HOST_FTP = os.getenv('HOST')
-PORT_FTP = int(os.getenv('PORT', 21))
-USUARIO_FTP = os.getenv('USER_ECARTA')
-SENHA_FTP = os.getenv('PASSWORD')
-DIRETORIO_FTP = os.getenv('DIRECTORY')
+# ✅ CORREÇÃO: Usar caminhos temporários (do perfil da execução corrente)
+def get_downloads_folder():
+    return os.path.join(get_temp_base_dir(), 'downloads')
 
-# ✅ CORREÇÃO: Usar caminhos temporários
-BASE_TEMP_DIR = get_temp_base_dir()
-DOWNLOADS_FOLDER = os.path.join(BASE_TEMP_DIR, 'downloads')
-UNZIP_FILES_FOLDER = os.path.join(BASE_TEMP_DIR, 'unzip_files')
-TMP_FOLDER = os.path.join(BASE_TEMP_DIR, 'tmp')
+def get_unzip_files_folder():
+    return os.path.join(get_temp_base_dir(), 'unzip_files')
+
+def get_tmp_folder():
+    return os.path.join(get_temp_base_dir(), 'tmp')
+
+def get_state_dir():
+    """Diretório de estado persistente entre execuções (não é limpo a cada run), um por perfil"""
+    state_dir = os.getenv('STATE_DIR') or os.path.join(tempfile.gettempdir(), "ftp_to_drive_state")
+    return perfis.atual().subdiretorio(state_dir)
+
+def get_fingerprint_file_path():
+    return os.path.join(get_state_dir(), "fingerprint_ftp.json")
+
+def get_journal_file_path():
+    return os.path.join(get_state_dir(), "journal.jsonl")
+
+def get_content_index_file_path():
+    return os.path.join(get_state_dir(), "indice_conteudo.json")
+
+def get_autotune_file_path():
+    return os.path.join(get_state_dir(), "autotune.json")
+
+def get_folder_map_file_path():
+    return os.path.join(get_state_dir(), "pastas_drive.json")
+
+def get_drive_calls_file_path():
+    return os.path.join(get_state_dir(), "chamadas_drive.json")
+
+def get_records_db_path():
+    return os.path.join(get_state_dir(), "registros.sqlite3")
 
 def limpar_e_recriar_pasta(folder_path):
     """Limpa e recria uma pasta usando Path para melhor compatibilidade"""
@@ -55,18 +96,26 @@ def limpar_e_recriar_pasta(folder_path):
         logger.error(f"Erro crítico ao criar pasta '{folder_path}': {e}")
         raise
 
-def setup_working_directories():
-    """Configura todos os diretórios de trabalho"""
+def setup_working_directories(preservar=False):
+    """
+    Configura todos os diretórios de trabalho.
+    Com preservar=True (retomada) mantém downloads e PDFs já extraídos.
+    """
+    base_temp_dir = get_temp_base_dir()
     try:
-        logger.info(f"Configurando diretórios de trabalho em: {BASE_TEMP_DIR}")
+        logger.info(f"Configurando diretórios de trabalho em: {base_temp_dir}")
 
         # Criar diretório base
-        Path(BASE_TEMP_DIR).mkdir(parents=True, exist_ok=True)
+        Path(base_temp_dir).mkdir(parents=True, exist_ok=True)
 
         # Criar subdiretórios
-        limpar_e_recriar_pasta(DOWNLOADS_FOLDER)
-        limpar_e_recriar_pasta(UNZIP_FILES_FOLDER)
-        limpar_e_recriar_pasta(TMP_FOLDER)
+        if preservar:
+            Path(get_downloads_folder()).mkdir(parents=True, exist_ok=True)
+            Path(get_unzip_files_folder()).mkdir(parents=True, exist_ok=True)
+        else:
+            limpar_e_recriar_pasta(get_downloads_folder())
+            limpar_e_recriar_pasta(get_unzip_files_folder())
+        limpar_e_recriar_pasta(get_tmp_folder())
 
         logger.info("✓ Todos os diretórios de trabalho configurados")
         return True
@@ -75,32 +124,157 @@ def setup_working_directories():
         logger.error(f"Erro ao configurar diretórios: {e}")
         raise
 
-def download_files_from_ftp(host, port, usuario, senha, remote_directory, local_downloads_folder):
-    """Baixa arquivos do FTP"""
+@contextmanager
+def sessao_ftp(host, port, usuario, senha, remote_directory, pool=None):
+    """Sessão FTP já no diretório remoto: emprestada do pool ou conexão própria"""
+    if pool is not None:
+        with pool.sessao() as ftp:
+            yield ftp
+        return
+    with FTP() as ftp:
+        with tracing.span("ftp.connect", host=host, diretorio=remote_directory):
+            ftp.connect(host, port)
+            ftp.login(usuario, senha)
+            ftp.cwd(remote_directory)
+        yield ftp
+
+def download_files_from_ftp(host, port, usuario, senha, remote_directory, local_downloads_folder, journal=None, store=None, pool=None,
+                            filtro=None, autoajuste=None):
+    """
+    Baixa arquivos do FTP.
+    Com journal, registra cada arquivo listado/baixado e reaproveita os já
+    baixados (ou já extraídos) numa execução anterior.
+    Com store (StagingStore), arquivos pequenos ficam em memória e cada
+    download reserva espaço no orçamento; se o orçamento não liberar a
+    tempo, os arquivos restantes ficam no FTP para a próxima execução.
+    O MD5 de cada arquivo é calculado durante o próprio download ("md5").
+    Com pool (PoolFTP), a sessão usada volta ao pool para as exclusões.
+    A listagem (MLSD em streaming) passa pelos filtros e limites de lote de
+    'filtro' (FiltroListagem; padrão: variáveis de ambiente FTP_*).
+    Com ASYNC_TRANSFERS os RETR rodam em paralelo no event loop; com
+    autoajuste (autotuner.AutoAjuste) o número de sessões simultâneas é
+    ajustado durante o download.
+    """
+    filtro = filtro or ftp_listing.FiltroListagem.do_ambiente()
     # Garantir que o diretório existe
     Path(local_downloads_folder).mkdir(parents=True, exist_ok=True)
 
     arquivos_baixados_info = []
     try:
-        with FTP() as ftp:
-            ftp.connect(host, port)
-            ftp.login(usuario, senha)
-            ftp.cwd(remote_directory)
+        with sessao_ftp(host, port, usuario, senha, remote_directory, pool=pool) as ftp:
             logger.info(f"Conectado ao FTP: {host}, diretório: {remote_directory}")
 
-            files_in_remote_dir = ftp.nlst()
-            logger.info(f"Arquivos encontrados no FTP: {len(files_in_remote_dir)} arquivo(s)")
+            with tracing.span("ftp.listagem") as sp_lista:
+                selecionados = filtro.selecionar(ftp)
+                sp_lista.definir(**filtro.resumo())
+            files_in_remote_dir = [entrada["nome"] for entrada in selecionados]
+            tamanhos_listados = {entrada["nome"]: entrada["tamanho"] for entrada in selecionados}
+            resumo_lista = filtro.resumo()
+            logger.info(f"Arquivos no FTP: {resumo_lista['listados']} listado(s), {len(files_in_remote_dir)} selecionado(s) para esta execução")
+            if filtro.arquivos_remanescentes():
+                logger.info(f"{resumo_lista['recentes']} arquivo(s) recente(s) e {resumo_lista['adiados_lote']} além do lote ficam para a próxima execução")
+
+            if journal:
+                journal.registrar_varios([run_journal.chave_ftp(nome) for nome in files_in_remote_dir], run_journal.LISTADO)
+
+            nivel_arquivo = logging_setup.nivel_por_arquivo()
+            limitador_ftp = banda.limitador("ftp")
+            modo_async = transferencias_async.async_habilitado()
+            pendentes = []
+            with logging_setup.AgregadorEtapa("download_ftp", logger) as agregador:
+
+                def _concluir(file_name, local_file_path, chave, item, hash_fluxo):
+                    logger.log(nivel_arquivo, "✓ %s baixado com sucesso", file_name)
+                    agregador.registrar(hash_fluxo.tamanho)
+                    if journal:
+                        journal.registrar(chave, run_journal.BAIXADO, bytes=hash_fluxo.tamanho, md5=hash_fluxo.hexdigest())
+                    arquivos_baixados_info.append({"nome_ftp": file_name, "caminho_local": local_file_path, "item": item,
+                                                   "md5": hash_fluxo.hexdigest()})
+
+                def _falhar(file_name, item, e_dl):
+                    logger.error("Erro ao baixar '%s': %s", file_name, e_dl)
+                    agregador.registrar(erro=True)
+                    if item is not None:
+                        item.descartar()
+
+                for indice, file_name in enumerate(files_in_remote_dir):
+                    local_file_path = os.path.join(local_downloads_folder, file_name)
+                    chave = run_journal.chave_ftp(file_name)
+                    if journal and journal.atingiu(chave, run_journal.DELETADO):
+                        continue
+                    if journal and (journal.atingiu(chave, run_journal.EXTRAIDO) or
+                                    (journal.atingiu(chave, run_journal.BAIXADO) and os.path.exists(local_file_path))):
+                        logger.debug("%s já baixado em execução anterior", file_name)
+                        if store and os.path.exists(local_file_path):
+                            store.disco.consumir(os.path.getsize(local_file_path))
+                        arquivos_baixados_info.append({"nome_ftp": file_name, "caminho_local": local_file_path,
+                                                       "md5": journal.dados(chave).get("md5")})
+                        continue
+
+                    tamanho_previsto = None
+                    if store:
+                        tamanho_previsto = tamanhos_listados.get(file_name)
+                        if tamanho_previsto is None:
+                            try:
+                                tamanho_previsto = ftp.size(file_name)
+                            except Exception:
+                                tamanho_previsto = None
+
+                    if modo_async:
+                        # O RETR roda depois, em paralelo no event loop. A reserva no
+                        # orçamento e o arquivo de destino só são criados quando ele
+                        # obtiver sua sessão: o plano não segura descritores nem bytes
+                        pendentes.append((file_name, local_file_path, chave, tamanho_previsto))
+                        continue
 
-            for file_name in files_in_remote_dir:
-                local_file_path = os.path.join(local_downloads_folder, file_name)
-                try:
-                    with open(local_file_path, "wb") as local_file:
-                        logger.info(f"Baixando {file_name}...")
-                        ftp.retrbinary(f"RETR {file_name}", local_file.write)
-                    logger.info(f"✓ {file_name} baixado com sucesso")
-                    arquivos_baixados_info.append({"nome_ftp": file_name, "caminho_local": local_file_path})
-                except Exception as e_dl:
-                    logger.error(f"Erro ao baixar '{file_name}': {e_dl}")
+                    item = None
+                    if store:
+                        try:
+                            # Download serial: nada libera disco durante o laço, então esperar
+                            # STAGING_WAIT_TIMEOUT não adianta; sem espaço, adia na hora
+                            item = store.criar_item(file_name, local_file_path, tamanho_previsto, timeout=0)
+                        except staging_store.OrcamentoEsgotado as e_orc:
+                            adiados = len(files_in_remote_dir) - indice
+                            store.adiados += adiados
+                            logger.warning(f"{e_orc}. {adiados} arquivo(s) adiado(s) para a próxima execução")
+                            break
+                        except OSError as e_item:
+                            _falhar(file_name, None, e_item)
+                            continue
+
+                    try:
+                        with tracing.span("ftp.retr", arquivo=file_name) as sp_retr:
+                            destino = item if item is not None else open(local_file_path, "wb")
+                            hash_fluxo = integridade.HashEmFluxo(destino)
+
+                            def _receber(bloco):
+                                # Limite de banda de entrada (FTP) aplicado no próprio callback
+                                limitador_ftp.consumir(len(bloco))
+                                hash_fluxo.write(bloco)
+                            try:
+                                logger.debug("Baixando %s...", file_name)
+                                ftp.retrbinary(f"RETR {file_name}", _receber)
+                            finally:
+                                if item is not None:
+                                    item.fechar_escrita()
+                                else:
+                                    destino.close()
+                            sp_retr.definir(bytes=hash_fluxo.tamanho, em_memoria=bool(item and item.em_memoria))
+                        _concluir(file_name, local_file_path, chave, item, hash_fluxo)
+                    except Exception as e_dl:
+                        _falhar(file_name, item, e_dl)
+
+                if pendentes:
+                    controlador = autoajuste.controlador("ftp", ftp_pool.get_tamanho_pool()) if autoajuste else None
+                    resumo_async = transferencias_async.executar(
+                        _baixar_pendentes_async, host, port, usuario, senha, remote_directory,
+                        pendentes, limitador_ftp, _concluir, _falhar, controlador, store
+                    )
+                    logger.info("Downloads assíncronos: %d arquivo(s), %d sessão(ões) FTP aberta(s)",
+                                len(pendentes), resumo_async["conexoes_abertas"])
+                    # Concluídos fora de ordem: manter a ordem da listagem
+                    ordem = {nome: i for i, nome in enumerate(files_in_remote_dir)}
+                    arquivos_baixados_info.sort(key=lambda info: ordem.get(info["nome_ftp"], 0))
 
         logger.info(f"Download concluído: {len(arquivos_baixados_info)} arquivo(s) baixado(s)")
         return arquivos_baixados_info
@@ -108,67 +282,252 @@ def download_files_from_ftp(host, port, usuario, senha, remote_directory, local_
         logger.error(f"Erro na operação FTP (download): {e}")
         return []
 
-def descompactar_zip(caminho_arquivo_zip, pasta_destino):
-    """Descompacta um arquivo ZIP"""
-    if not (os.path.exists(caminho_arquivo_zip) and zipfile.is_zipfile(caminho_arquivo_zip)):
-        logger.error(f"Arquivo ZIP inválido ou não encontrado: {caminho_arquivo_zip}")
+async def _baixar_pendentes_async(host, port, usuario, senha, remote_directory, pendentes, limitador_ftp, concluir, falhar,
+                                  controlador=None, store=None):
+    """
+    Baixa as entradas planejadas por download_files_from_ftp em paralelo
+    (RETR em corrotinas, até FTP_POOL_SIZE sessões do PoolFTPAsync; com
+    controlador, até o limite corrente do autotune).
+    Cada corrotina só reserva o orçamento de staging e abre o destino depois
+    de obter a sessão: descritores e bytes em uso acompanham as transferências
+    ativas, não o tamanho do lote. Esgotado o orçamento, os demais ficam para
+    a próxima execução (como no modo síncrono).
+    concluir/falhar são os mesmos registros do modo síncrono.
+    """
+    tamanho_pool = controlador.maximo if controlador else None
+    portao = controlador if controlador else nullcontext()
+    esgotado = []
+    async with ftp_async.PoolFTPAsync(host, port, usuario, senha, remote_directory, tamanho=tamanho_pool) as pool_async:
+
+        async def baixar(file_name, local_file_path, chave, tamanho_previsto):
+            item = None
+            try:
+                with tracing.span("ftp.retr", arquivo=file_name, modo="async") as sp_retr:
+                    logger.debug("Baixando %s...", file_name)
+                    async with portao, pool_async.sessao() as ftp:
+                        if esgotado:
+                            store.adiados += 1
+                            return
+                        try:
+                            if store:
+                                item = await asyncio.to_thread(store.criar_item, file_name, local_file_path, tamanho_previsto)
+                            destino = item if item is not None else await asyncio.to_thread(open, local_file_path, "wb")
+                        except staging_store.OrcamentoEsgotado as e_orc:
+                            if not esgotado:
+                                logger.warning(f"{e_orc}. Arquivos restantes adiados para a próxima execução")
+                            esgotado.append(file_name)
+                            store.adiados += 1
+                            return
+                        except OSError as e_local:
+                            # Falha local (ex.: EMFILE, ENOSPC): só este arquivo falha e a sessão FTP segue no pool
+                            falhar(file_name, item, e_local)
+                            return
+                        hash_fluxo = integridade.HashEmFluxo(destino)
+                        em_memoria = bool(item and item.em_memoria)
+
+                        async def _receber(bloco):
+                            await limitador_ftp.consumir_async(len(bloco))
+                            if em_memoria:
+                                hash_fluxo.write(bloco)
+                            else:
+                                # Escrita em disco fora do event loop
+                                await asyncio.to_thread(hash_fluxo.write, bloco)
+                        try:
+                            await ftp.retr(file_name, _receber)
+                        finally:
+                            # Fechamento (flush do que resta no buffer) também fora do loop
+                            await asyncio.to_thread(item.fechar_escrita if item is not None else destino.close)
+                    sp_retr.definir(bytes=hash_fluxo.tamanho, em_memoria=em_memoria)
+                if controlador:
+                    controlador.registrar(hash_fluxo.tamanho)
+                # Diário com fsync: fora do event loop
+                await asyncio.to_thread(concluir, file_name, local_file_path, chave, item, hash_fluxo)
+            except Exception as e_dl:
+                if controlador:
+                    controlador.registrar(erro=True, throttle=ftp_async.erro_de_sobrecarga(e_dl))
+                falhar(file_name, item, e_dl)
+
+        await asyncio.gather(*(baixar(*pendente) for pendente in pendentes))
+        return pool_async.resumo()
+
+def listar_diretorio_ftp(ftp):
+    """
+    Lista o diretório atual com um único comando de dados: MLSD (nome, tamanho,
+    data de modificação) ou, se o servidor não suportar, LIST bruto.
+    Retorna lista ordenada de tuplas (nome, tamanho, modificacao).
+    """
+    try:
+        entradas = [
+            (nome, fatos.get("size", ""), fatos.get("modify", ""))
+            for nome, fatos in ftp.mlsd(facts=["type", "size", "modify"])
+            if fatos.get("type", "file") == "file"
+        ]
+    except error_perm:
+        # Sem MLSD: a linha do LIST já carrega tamanho e data
+        linhas = []
+        ftp.retrlines("LIST", linhas.append)
+        entradas = [(linha, "", "") for linha in linhas if linha and not linha.startswith("total")]
+    return sorted(entradas)
+
+def calcular_fingerprint(entradas):
+    """Hash estável da listagem (nomes, tamanhos, datas)"""
+    digest = hashlib.sha256()
+    for nome, tamanho, modificacao in entradas:
+        digest.update(f"{nome}\0{tamanho}\0{modificacao}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+def obter_fingerprint_ftp(host, port, usuario, senha, remote_directory):
+    """Conecta uma vez, lista o diretório e retorna (fingerprint, quantidade de arquivos)"""
+    with FTP() as ftp:
+        with tracing.span("ftp.fingerprint", host=host, diretorio=remote_directory) as sp_fp:
+            ftp.connect(host, port)
+            ftp.login(usuario, senha)
+            ftp.cwd(remote_directory)
+            entradas = listar_diretorio_ftp(ftp)
+            sp_fp.definir(arquivos=len(entradas))
+    return calcular_fingerprint(entradas), len(entradas)
+
+def carregar_ultimo_fingerprint():
+    """Retorna o fingerprint da última execução concluída (ou None)"""
+    try:
+        with open(get_fingerprint_file_path(), "r", encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    except Exception as e:
+        logger.warning(f"Erro ao ler fingerprint anterior: {e}")
+        return None
+
+def salvar_fingerprint(fingerprint, quantidade_arquivos):
+    """Persiste o fingerprint da listagem processada com sucesso"""
+    try:
+        Path(get_state_dir()).mkdir(parents=True, exist_ok=True)
+        caminho = get_fingerprint_file_path()
+        caminho_tmp = caminho + ".tmp"
+        with open(caminho_tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "arquivos": quantidade_arquivos, "timestamp": time.time()}, f)
+        os.replace(caminho_tmp, caminho)
+    except Exception as e:
+        logger.warning(f"Erro ao salvar fingerprint do FTP: {e}")
+
+def descompactar_zip(caminho_arquivo_zip, pasta_destino, store=None, digests=None, pool=None):
+    """
+    Descompacta um arquivo ZIP (caminho em disco ou objeto binário em memória).
+    Com store, o tamanho descompactado (diretório central do ZIP) é reservado
+    no orçamento de disco antes de extrair; sem espaço levanta
+    OrcamentoEsgotado sem gravar nada. A extração roda sozinha (nada libera
+    disco enquanto ela espera), então a reserva não espera.
+    Com digests (dict), recebe o MD5 de cada membro calculado na extração.
+    pool (zip_extractor.PoolExtracao) é o pool de processos da execução.
+    """
+    em_memoria = not isinstance(caminho_arquivo_zip, (str, os.PathLike))
+    nome_zip = getattr(caminho_arquivo_zip, "name", "<memória>") if em_memoria else os.path.basename(caminho_arquivo_zip)
+    if not ((em_memoria or os.path.exists(caminho_arquivo_zip)) and zipfile.is_zipfile(caminho_arquivo_zip)):
+        logger.error(f"Arquivo ZIP inválido ou não encontrado: {nome_zip}")
         return False
 
     # Garantir que pasta destino existe
     Path(pasta_destino).mkdir(parents=True, exist_ok=True)
 
+    reservado = 0
     try:
-        with zipfile.ZipFile(caminho_arquivo_zip, 'r') as zip_ref:
-            zip_ref.extractall(pasta_destino)
-            logger.info(f"✓ Descompactado '{os.path.basename(caminho_arquivo_zip)}' em '{pasta_destino}'")
+        if store:
+            tamanho_extraido = zip_extractor.tamanho_descompactado(caminho_arquivo_zip)
+            store.reservar_disco(nome_zip, tamanho_extraido, timeout=0)
+            reservado = tamanho_extraido
+        tamanho_zip = caminho_arquivo_zip.getbuffer().nbytes if em_memoria else os.path.getsize(caminho_arquivo_zip)
+        with tracing.span("zip.extractall", arquivo=nome_zip, bytes=tamanho_zip, em_memoria=em_memoria) as sp_zip:
+            membros = zip_extractor.extrair(caminho_arquivo_zip, pasta_destino, digests=digests, pool=pool)
+            sp_zip.definir(membros=len(membros), reservado=reservado)
+            logger.info(f"✓ Descompactado '{nome_zip}' em '{pasta_destino}'")
             return True
+    except staging_store.OrcamentoEsgotado:
+        raise
     except Exception as e:
-        logger.error(f"Erro ao descompactar '{caminho_arquivo_zip}': {e}")
+        logger.error(f"Erro ao descompactar '{nome_zip}': {e}")
+        # Resíduos da extração parcial são apagados com a pasta TMP
+        if reservado:
+            store.disco.liberar(reservado)
         return False
 
-def excluir_arquivos_do_ftp(host, port, usuario, senha, remote_directory, lista_nomes_arquivos_para_excluir):
-    """Exclui arquivos do FTP"""
-    if not lista_nomes_arquivos_para_excluir:
-        logger.info("Nenhum arquivo especificado para exclusão no FTP")
-        return
-
-    logger.info(f"Iniciando exclusão de {len(lista_nomes_arquivos_para_excluir)} arquivos no FTP")
-    excluidos_com_sucesso = 0
-    erros_exclusao = 0
-
-    try:
-        with FTP() as ftp:
-            ftp.connect(host, port)
-            ftp.login(usuario, senha)
-            ftp.cwd(remote_directory)
-            logger.info("Conectado ao FTP para exclusão")
-
-            for nome_arquivo in lista_nomes_arquivos_para_excluir:
-                try:
-                    ftp.delete(nome_arquivo)
-                    logger.info(f"✓ Arquivo '{nome_arquivo}' excluído do FTP")
-                    excluidos_com_sucesso += 1
-                except Exception as e_del:
-                    logger.error(f"Erro ao excluir '{nome_arquivo}' do FTP: {e_del}")
-                    erros_exclusao += 1
-
-        logger.info(f"Exclusão concluída: {excluidos_com_sucesso} sucesso(s), {erros_exclusao} erro(s)")
-    except Exception as e:
-        logger.error(f"Erro durante operação de exclusão no FTP: {e}")
+def renomear_pdfs_devolucaoar(linhas_manifesto, pasta_origem, pasta_destino, estatisticas_staging=None):
+    """
+    Aplica o manifesto DevolucaoAR.txt: cada linha (campos separados por '|')
+    renomeia o PDF original (7º campo) para o código AR (4º campo) ao movê-lo
+    de pasta_origem para pasta_destino.
+    Retorna a lista de (nome_original, novo_nome, campos) efetivamente movidos.
+    """
+    renomeados = []
+    for linha_dados in linhas_manifesto:
+        try:
+            campos = linha_dados.split('|')
+            if len(campos) < 7: continue
+            nome_pdf_original = campos[6].strip()
+            novo_nome_pdf_base = campos[3].strip()
+            novo_nome_pdf = f"{novo_nome_pdf_base}.pdf" if not novo_nome_pdf_base.lower().endswith('.pdf') else novo_nome_pdf_base
+            pdf_orig_tmp = os.path.join(pasta_origem, nome_pdf_original)
+            pdf_dest_unzip = os.path.join(pasta_destino, novo_nome_pdf)
+
+            if os.path.exists(pdf_orig_tmp):
+                staging.mover(pdf_orig_tmp, pdf_dest_unzip, estatisticas_staging)
+                logger.debug("Renomeado '%s' -> '%s'", nome_pdf_original, novo_nome_pdf)
+                renomeados.append((nome_pdf_original, novo_nome_pdf, campos))
+            else:
+                logger.warning("PDF '%s' não encontrado em tmp", nome_pdf_original)
+        except Exception as e_linha:
+            logger.error("Erro ao processar linha DevolucaoAR: %s", e_linha)
+    return renomeados
 
-def processar_arquivos_ecarta_ftp():
+def limpar_residuos_tmp(pasta_tmp, preservar=()):
+    """
+    Esvazia pasta_tmp após o processamento de um ZIP, mantendo os ZIPs
+    listados em 'preservar' (ainda aguardando processamento), e recria a pasta.
+    """
+    preservar = set(preservar)
+    if os.path.exists(pasta_tmp):
+        for item_tmp in os.listdir(pasta_tmp):
+            if item_tmp.lower().endswith('.zip') and item_tmp in preservar:
+                continue
+            caminho_item_tmp_del = os.path.join(pasta_tmp, item_tmp)
+            try:
+                if os.path.isfile(caminho_item_tmp_del) or os.path.islink(caminho_item_tmp_del):
+                    os.unlink(caminho_item_tmp_del)
+                elif os.path.isdir(caminho_item_tmp_del):
+                    shutil.rmtree(caminho_item_tmp_del)
+            except Exception as e_clean:
+                logger.error(f"Erro ao limpar '{item_tmp}' de tmp: {e_clean}")
+        # Recriar pasta TMP vazia
+        Path(pasta_tmp).mkdir(parents=True, exist_ok=True)
+
+def processar_arquivos_ecarta_ftp(journal=None, retomar=False, estatisticas_staging=None, store_staging=None,
+                                  registro_integridade=None, pool_ftp=None, filtro_listagem=None, autoajuste=None,
+                                  indice_registros=None, pool_zip=None):
     """
     Função principal que processa arquivos eCarta do FTP
+    Com retomar=True (e um journal carregado) preserva o estado local e pula
+    os arquivos que já passaram por cada etapa.
+    estatisticas_staging (opcional) acumula bytes vinculados/renomeados/copiados.
+    store_staging (opcional) aplica o staging memória/disco com orçamento de bytes.
+    registro_integridade (opcional) recebe o MD5 esperado de cada arquivo final.
+    pool_ftp (opcional) fornece a sessão FTP do download (reaproveitada depois).
+    filtro_listagem (opcional) define quais arquivos do FTP entram nesta execução.
+    autoajuste (opcional) ajusta a concorrência dos downloads assíncronos.
+    indice_registros (opcional) guarda os campos de cada linha dos manifestos DevolucaoAR.
+    pool_zip (opcional) é o pool de processos de extração reaproveitado por todos os ZIPs.
     Retorna: (pasta_pdfs_finais, nomes_arquivos_ftp_para_excluir, caminhos_devolucaoAR_originais)
     """
     logger.info("Iniciando processo de tratamento de arquivos eCarta")
+    perfil = perfis.atual()
+    downloads_folder = get_downloads_folder()
+    unzip_files_folder = get_unzip_files_folder()
+    tmp_folder = get_tmp_folder()
     caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar = []
     nomes_todos_arquivos_baixados_ftp = []
 
     try:
         # ✅ CORREÇÃO: Configurar diretórios de trabalho
         logger.info("Configurando diretórios de trabalho temporários")
-        setup_working_directories()
+        setup_working_directories(preservar=retomar)
 
     except Exception as e_limpeza:
         logger.error(f"Erro crítico durante configuração inicial: {e_limpeza}")
@@ -176,19 +535,27 @@ def processar_arquivos_ecarta_ftp():
 
     # Etapa 1: Download de arquivos do FTP
     logger.info("--- Etapa 1: Download de arquivos do FTP ---")
-    info_arquivos_baixados = download_files_from_ftp(
-        HOST_FTP, PORT_FTP, USUARIO_FTP, SENHA_FTP, DIRETORIO_FTP, DOWNLOADS_FOLDER
-    )
+    with tracing.span("ecarta.download") as sp_download:
+        info_arquivos_baixados = download_files_from_ftp(
+            perfil.host_ftp, perfil.port_ftp, perfil.usuario_ftp, perfil.senha_ftp, perfil.diretorio_ftp, downloads_folder,
+            journal=journal, store=store_staging, pool=pool_ftp, filtro=filtro_listagem, autoajuste=autoajuste
+        )
+        sp_download.definir(arquivos=len(info_arquivos_baixados))
 
     if not info_arquivos_baixados:
         logger.warning("Nenhum arquivo baixado do FTP")
-        return UNZIP_FILES_FOLDER, [], []
+        return unzip_files_folder, [], []
 
     # Identificar arquivos DevolucaoAR e preparar lista de exclusão
     for info_arquivo in info_arquivos_baixados:
         nomes_todos_arquivos_baixados_ftp.append(info_arquivo["nome_ftp"])
         if "devolucaoar" in info_arquivo["nome_ftp"].lower():
+            # Originais vão para o arquivo no Drive: precisam existir em disco
+            if info_arquivo.get("item") is not None:
+                info_arquivo["item"].materializar()
             caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar.append(info_arquivo["caminho_local"])
+            if registro_integridade:
+                registro_integridade.esperar(info_arquivo["caminho_local"], info_arquivo.get("md5"), origem=info_arquivo["nome_ftp"])
 
     logger.info(f"Arquivos DevolucaoAR originais identificados: {len(caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar)}")
 
@@ -198,146 +565,185 @@ def processar_arquivos_ecarta_ftp():
 
     if not arquivos_zip_para_processar_info:
         logger.info("Nenhum arquivo .zip encontrado para processar")
-        return UNZIP_FILES_FOLDER, nomes_todos_arquivos_baixados_ftp, caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar
+        return unzip_files_folder, nomes_todos_arquivos_baixados_ftp, caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar
 
+    nomes_zips_pendentes = {info["nome_ftp"] for info in arquivos_zip_para_processar_info}
     for info_zip in arquivos_zip_para_processar_info:
         nome_arquivo_zip = info_zip["nome_ftp"]
         caminho_zip_original_em_downloads = info_zip["caminho_local"]
 
-        if not os.path.exists(caminho_zip_original_em_downloads):
+        if journal and journal.atingiu(run_journal.chave_ftp(nome_arquivo_zip), run_journal.EXTRAIDO):
+            logger.info(f"ZIP '{nome_arquivo_zip}' já processado em execução anterior. Pulando")
+            if registro_integridade:
+                for artefato, md5 in (journal.dados(run_journal.chave_ftp(nome_arquivo_zip)).get("md5") or {}).items():
+                    registro_integridade.esperar(os.path.join(unzip_files_folder, artefato), md5, origem=nome_arquivo_zip)
+            continue
+
+        item_zip = info_zip.get("item")
+        zip_em_memoria = item_zip is not None and item_zip.em_memoria
+
+        if not zip_em_memoria and not os.path.exists(caminho_zip_original_em_downloads):
             logger.warning(f"Arquivo ZIP '{nome_arquivo_zip}' não encontrado. Pulando")
             continue
 
-        caminho_zip_para_processar_em_tmp = os.path.join(TMP_FOLDER, nome_arquivo_zip)
+        caminho_zip_para_processar_em_tmp = os.path.join(tmp_folder, nome_arquivo_zip)
         logger.info(f">>> Processando arquivo ZIP: {nome_arquivo_zip} <<<")
 
-        try:
-            # Copiar DevolucaoAR, Mover os outros
-            if "devolucaoar" in nome_arquivo_zip.lower():
-                logger.info(f"Copiando '{nome_arquivo_zip}' (DevolucaoAR) para processamento")
-                shutil.copy2(caminho_zip_original_em_downloads, caminho_zip_para_processar_em_tmp)
-            else:
-                logger.info(f"Movendo '{nome_arquivo_zip}' para processamento")
-                shutil.move(caminho_zip_original_em_downloads, caminho_zip_para_processar_em_tmp)
+        with tracing.span("zip.processar", arquivo=nome_arquivo_zip) as sp_proc_zip:
+            artefatos = []
+            md5_artefatos = {}
+            digests_zip = {}
 
-            # Descompactar
-            if not descompactar_zip(caminho_zip_para_processar_em_tmp, TMP_FOLDER):
-                logger.error(f"Falha ao descompactar '{nome_arquivo_zip}'. Pulando")
-                if os.path.exists(caminho_zip_para_processar_em_tmp):
-                    os.remove(caminho_zip_para_processar_em_tmp)
-                continue
+            def _esperar_digest(artefato, nome_membro):
+                """Associa o MD5 do membro extraído ao arquivo final em UNZIP"""
+                md5 = digests_zip.get(nome_membro)
+                if md5:
+                    md5_artefatos[artefato] = md5
+                    if registro_integridade:
+                        registro_integridade.esperar(os.path.join(unzip_files_folder, artefato), md5,
+                                                     origem=f"{nome_arquivo_zip}:{nome_membro}")
 
-            # Procurar arquivo DevolucaoAR.txt
-            arquivo_devolucao_ar_txt_path = None
-            for item in os.listdir(TMP_FOLDER):
-                if "devolucaoar" in item.lower() and item.lower().endswith(".txt"):
-                    arquivo_devolucao_ar_txt_path = os.path.join(TMP_FOLDER, item)
-                    break
-
-            if arquivo_devolucao_ar_txt_path:
-                logger.info(f"Arquivo DevolucaoAR.txt encontrado: {os.path.basename(arquivo_devolucao_ar_txt_path)}")
-                # Processar arquivo DevolucaoAR.txt
-                linhas_do_arquivo_devolucao = []
+            try:
+                # Copiar DevolucaoAR, Mover os outros
+                if zip_em_memoria:
+                    # ZIP pequeno mantido em memória: descompacta direto do buffer
+                    origem_zip = item_zip.abrir_leitura()
+                    origem_zip.name = nome_arquivo_zip
+                elif "devolucaoar" in nome_arquivo_zip.lower():
+                    # Original fica em downloads para arquivamento: vincular em vez de copiar
+                    metodo = staging.vincular_ou_copiar(caminho_zip_original_em_downloads, caminho_zip_para_processar_em_tmp, estatisticas_staging)
+                    logger.info(f"'{nome_arquivo_zip}' (DevolucaoAR) disponibilizado para processamento via {metodo}")
+                    origem_zip = caminho_zip_para_processar_em_tmp
+                else:
+                    logger.info(f"Movendo '{nome_arquivo_zip}' para processamento")
+                    staging.mover(caminho_zip_original_em_downloads, caminho_zip_para_processar_em_tmp, estatisticas_staging)
+                    origem_zip = caminho_zip_para_processar_em_tmp
+
+                # Descompactar
                 try:
-                    with open(arquivo_devolucao_ar_txt_path, 'r', encoding='latin-1') as f_txt:
-                        linhas_do_arquivo_devolucao = [line.strip() for line in f_txt if line.strip()]
-                except UnicodeDecodeError:
+                    extraido = descompactar_zip(origem_zip, tmp_folder, store=store_staging, digests=digests_zip, pool=pool_zip)
+                except staging_store.OrcamentoEsgotado as e_orc:
+                    # Sem espaço para o conteúdo: o ZIP fica no FTP para a próxima execução
+                    logger.warning(f"⏸️  ZIP '{nome_arquivo_zip}' adiado: {e_orc}")
+                    store_staging.adiados += 1
+                    if os.path.exists(caminho_zip_para_processar_em_tmp):
+                        os.remove(caminho_zip_para_processar_em_tmp)
+                    continue
+                if not extraido:
+                    logger.error(f"Falha ao descompactar '{nome_arquivo_zip}'. Pulando")
+                    if os.path.exists(caminho_zip_para_processar_em_tmp):
+                        os.remove(caminho_zip_para_processar_em_tmp)
+                    continue
+
+                # Procurar arquivo DevolucaoAR.txt
+                arquivo_devolucao_ar_txt_path = None
+                for item in os.listdir(tmp_folder):
+                    if "devolucaoar" in item.lower() and item.lower().endswith(".txt"):
+                        arquivo_devolucao_ar_txt_path = os.path.join(tmp_folder, item)
+                        break
+
+                if arquivo_devolucao_ar_txt_path:
+                    logger.info(f"Arquivo DevolucaoAR.txt encontrado: {os.path.basename(arquivo_devolucao_ar_txt_path)}")
+                    # Processar arquivo DevolucaoAR.txt
+                    linhas_do_arquivo_devolucao = []
                     try:
-                         with open(arquivo_devolucao_ar_txt_path, 'r', encoding='utf-8') as f_txt:
-                             linhas_do_arquivo_devolucao = [line.strip() for line in f_txt if line.strip()]
-                    except Exception as e_decode:
-                        logger.error(f"Erro ao ler '{arquivo_devolucao_ar_txt_path}': {e_decode}")
-                        continue
+                        with open(arquivo_devolucao_ar_txt_path, 'r', encoding='latin-1') as f_txt:
+                            linhas_do_arquivo_devolucao = [line.strip() for line in f_txt if line.strip()]
+                    except UnicodeDecodeError:
+                        try:
+                             with open(arquivo_devolucao_ar_txt_path, 'r', encoding='utf-8') as f_txt:
+                                 linhas_do_arquivo_devolucao = [line.strip() for line in f_txt if line.strip()]
+                        except Exception as e_decode:
+                            logger.error(f"Erro ao ler '{arquivo_devolucao_ar_txt_path}': {e_decode}")
+                            continue
+
+                    # Garantir que pasta unzip existe
+                    Path(unzip_files_folder).mkdir(parents=True, exist_ok=True)
+
+                    renomeados = renomear_pdfs_devolucaoar(linhas_do_arquivo_devolucao, tmp_folder, unzip_files_folder, estatisticas_staging)
+                    for nome_pdf_original, novo_nome_pdf, _ in renomeados:
+                        artefatos.append(novo_nome_pdf)
+                        _esperar_digest(novo_nome_pdf, nome_pdf_original)
+                    pdfs_processados = len(renomeados)
+                    if indice_registros:
+                        try:
+                            indice_registros.registrar_manifesto(
+                                [(campos, novo_nome_pdf) for _, novo_nome_pdf, campos in renomeados],
+                                nome_arquivo_zip, run_id=journal.run_id if journal else None
+                            )
+                        except Exception as e_indice:
+                            logger.warning(f"Registros de '{nome_arquivo_zip}' fora do índice local: {e_indice}")
+
+                    logger.info(f"✓ {pdfs_processados} PDFs processados com base no DevolucaoAR.txt")
+                    sp_proc_zip.definir(pdfs_renomeados=pdfs_processados)
+                    os.remove(arquivo_devolucao_ar_txt_path)
+                else:
+                    logger.info(f"Nenhum 'DevolucaoAR.txt' encontrado. Movendo conteúdo para UNZIP")
+                    Path(unzip_files_folder).mkdir(parents=True, exist_ok=True)
+                    arquivos_movidos = 0
+                    for item_descompactado in os.listdir(tmp_folder):
+                        orig_item_tmp = os.path.join(tmp_folder, item_descompactado)
+                        if item_descompactado == nome_arquivo_zip: continue
+                        dest_item_unzip = os.path.join(unzip_files_folder, item_descompactado)
+                        try:
+                            if os.path.isfile(orig_item_tmp):
+                                staging.mover(orig_item_tmp, dest_item_unzip, estatisticas_staging)
+                                artefatos.append(item_descompactado)
+                                _esperar_digest(item_descompactado, item_descompactado)
+                                arquivos_movidos += 1
+                            elif os.path.isdir(orig_item_tmp):
+                                if os.path.isdir(dest_item_unzip):
+                                    for sub_item in os.listdir(orig_item_tmp):
+                                        staging.mover(os.path.join(orig_item_tmp, sub_item), os.path.join(dest_item_unzip, sub_item), estatisticas_staging)
+                                    shutil.rmtree(orig_item_tmp)
+                                else:
+                                    staging.mover(orig_item_tmp, dest_item_unzip, estatisticas_staging)
+                                artefatos.append(item_descompactado)
+                                for nome_membro in digests_zip:
+                                    if nome_membro.startswith(item_descompactado + "/"):
+                                        _esperar_digest(nome_membro, nome_membro)
+                                arquivos_movidos += 1
+                        except Exception as e_mv:
+                            logger.error(f"Erro ao mover {item_descompactado}: {e_mv}")
+                    logger.info(f"✓ {arquivos_movidos} itens movidos para UNZIP")
+
+                # Remover ZIP da pasta TMP
+                if os.path.exists(caminho_zip_para_processar_em_tmp):
+                    os.remove(caminho_zip_para_processar_em_tmp)
+                    logger.info(f"ZIP '{nome_arquivo_zip}' removido da pasta TMP")
 
-                pdfs_processados = 0
-                # Garantir que pasta unzip existe
-                Path(UNZIP_FILES_FOLDER).mkdir(parents=True, exist_ok=True)
+                if journal:
+                    journal.registrar(run_journal.chave_ftp(nome_arquivo_zip), run_journal.EXTRAIDO, artefatos=artefatos, md5=md5_artefatos)
 
-                for idx, linha_dados in enumerate(linhas_do_arquivo_devolucao):
-                    try:
-                        campos = linha_dados.split('|')
-                        if len(campos) < 7: continue
-                        nome_pdf_original = campos[6].strip()
-                        novo_nome_pdf_base = campos[3].strip()
-                        novo_nome_pdf = f"{novo_nome_pdf_base}.pdf" if not novo_nome_pdf_base.lower().endswith('.pdf') else novo_nome_pdf_base
-                        pdf_orig_tmp = os.path.join(TMP_FOLDER, nome_pdf_original)
-                        pdf_dest_unzip = os.path.join(UNZIP_FILES_FOLDER, novo_nome_pdf)
-
-                        if os.path.exists(pdf_orig_tmp):
-                            shutil.move(pdf_orig_tmp, pdf_dest_unzip)
-                            pdfs_processados += 1
-                        else:
-                            logger.warning(f"PDF '{nome_pdf_original}' não encontrado em tmp")
-                    except Exception as e_linha:
-                        logger.error(f"Erro ao processar linha DevolucaoAR: {e_linha}")
-
-                logger.info(f"✓ {pdfs_processados} PDFs processados com base no DevolucaoAR.txt")
-                os.remove(arquivo_devolucao_ar_txt_path)
-            else:
-                logger.info(f"Nenhum 'DevolucaoAR.txt' encontrado. Movendo conteúdo para UNZIP")
-                Path(UNZIP_FILES_FOLDER).mkdir(parents=True, exist_ok=True)
-                arquivos_movidos = 0
-                for item_descompactado in os.listdir(TMP_FOLDER):
-                    orig_item_tmp = os.path.join(TMP_FOLDER, item_descompactado)
-                    if item_descompactado == nome_arquivo_zip: continue
-                    dest_item_unzip = os.path.join(UNZIP_FILES_FOLDER, item_descompactado)
-                    try:
-                        if os.path.isfile(orig_item_tmp):
-                            shutil.move(orig_item_tmp, dest_item_unzip)
-                            arquivos_movidos += 1
-                        elif os.path.isdir(orig_item_tmp):
-                            if os.path.isdir(dest_item_unzip):
-                                for sub_item in os.listdir(orig_item_tmp):
-                                    shutil.move(os.path.join(orig_item_tmp, sub_item), dest_item_unzip)
-                                shutil.rmtree(orig_item_tmp)
-                            else:
-                                shutil.move(orig_item_tmp, UNZIP_FILES_FOLDER)
-                            arquivos_movidos += 1
-                    except Exception as e_mv:
-                        logger.error(f"Erro ao mover {item_descompactado}: {e_mv}")
-                logger.info(f"✓ {arquivos_movidos} itens movidos para UNZIP")
-
-            # Remover ZIP da pasta TMP
-            if os.path.exists(caminho_zip_para_processar_em_tmp):
-                os.remove(caminho_zip_para_processar_em_tmp)
-                logger.info(f"ZIP '{nome_arquivo_zip}' removido da pasta TMP")
-
-        except Exception as e_process_zip:
-            logger.error(f"ERRO CRÍTICO ao processar ZIP '{nome_arquivo_zip}': {e_process_zip}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            # Limpar resíduos da pasta TMP
-            logger.info(f"Limpando resíduos de '{nome_arquivo_zip}' da pasta TMP")
-            if os.path.exists(TMP_FOLDER):
-                for item_tmp in os.listdir(TMP_FOLDER):
-                    eh_outro_zip_aguardando = item_tmp.lower().endswith('.zip') and \
-                                              any(info_zip_pendente["nome_ftp"] == item_tmp for info_zip_pendente in arquivos_zip_para_processar_info if info_zip_pendente["nome_ftp"] != nome_arquivo_zip)
-                    if not eh_outro_zip_aguardando:
-                        caminho_item_tmp_del = os.path.join(TMP_FOLDER, item_tmp)
-                        try:
-                            if os.path.isfile(caminho_item_tmp_del) or os.path.islink(caminho_item_tmp_del):
-                                os.unlink(caminho_item_tmp_del)
-                            elif os.path.isdir(caminho_item_tmp_del):
-                                shutil.rmtree(caminho_item_tmp_del)
-                        except Exception as e_clean:
-                            logger.error(f"Erro ao limpar '{item_tmp}' de tmp: {e_clean}")
-                # Recriar pasta TMP vazia
-                Path(TMP_FOLDER).mkdir(parents=True, exist_ok=True)
+            except Exception as e_process_zip:
+                logger.error(f"ERRO CRÍTICO ao processar ZIP '{nome_arquivo_zip}': {e_process_zip}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                # Limpar resíduos da pasta TMP
+                logger.info(f"Limpando resíduos de '{nome_arquivo_zip}' da pasta TMP")
+                limpar_residuos_tmp(tmp_folder, preservar=nomes_zips_pendentes - {nome_arquivo_zip})
+
+                # ZIP já consumido: devolve sua reserva (originais DevolucaoAR continuam em disco)
+                if item_zip is not None and "devolucaoar" not in nome_arquivo_zip.lower():
+                    item_zip.descartar()
 
     logger.info("✓ Processamento de todos os arquivos eCarta concluído")
-    return UNZIP_FILES_FOLDER, nomes_todos_arquivos_baixados_ftp, caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar
+    return unzip_files_folder, nomes_todos_arquivos_baixados_ftp, caminhos_locais_arquivos_devolucaoAR_originais_para_arquivar
 
-def main():
-    """Função main para compatibilidade com a API"""
-    return processar_arquivos_ecarta_ftp()
+def main(config=None):
+    """Função main para compatibilidade com a API (config["profile"]: perfil da execução)"""
+    perfil = perfis.obter((config or {}).get("profile"))
+    with perfis.execucao(perfil):
+        return processar_arquivos_ecarta_ftp()
 
 def cleanup_temp_directories():
     """Limpa diretórios temporários após processamento"""
+    base_temp_dir = get_temp_base_dir()
     try:
-        if os.path.exists(BASE_TEMP_DIR):
-            shutil.rmtree(BASE_TEMP_DIR)
-            logger.info(f"✓ Diretórios temporários limpos: {BASE_TEMP_DIR}")
+        if os.path.exists(base_temp_dir):
+            shutil.rmtree(base_temp_dir)
+            logger.info(f"✓ Diretórios temporários limpos: {base_temp_dir}")
     except Exception as e:
         logger.warning(f"Erro ao limpar diretórios temporários: {e}")
 
@@ -0,0 +1,149 @@
+# exclusao_ftp.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import tracing
+import profiling
+import logging_setup
+import run_journal
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class RastreadorDependencias:
+    """
+    Relaciona cada arquivo do FTP aos uploads que dependem dele. Um arquivo
+    só fica liberado para exclusão quando todos os seus uploads forem
+    confirmados; uploads com falha o mantêm no FTP para a próxima execução.
+    """
+
+    def __init__(self, ao_liberar):
+        self.ao_liberar = ao_liberar  # callback(nome_ftp) chamado uma vez por arquivo liberado
+        self.pendentes = {}          # nome_ftp -> set(chaves de upload ainda não confirmadas)
+        self.por_chave = {}          # chave de upload -> set(nomes_ftp)
+        self.bloqueados = {}         # nome_ftp -> motivo
+        self._lock = threading.Lock()
+
+    def registrar(self, nome_ftp, chaves_upload, confirmadas=()):
+        """Registra as dependências de um arquivo; sem pendências, libera na hora"""
+        pendentes = set(chaves_upload) - set(confirmadas)
+        with self._lock:
+            self.pendentes[nome_ftp] = pendentes
+            for chave in pendentes:
+                self.por_chave.setdefault(chave, set()).add(nome_ftp)
+        if not pendentes:
+            self.ao_liberar(nome_ftp)
+
+    def bloquear(self, nome_ftp, motivo):
+        """Mantém o arquivo no FTP (ex.: falha ao processar o ZIP)"""
+        with self._lock:
+            self.bloqueados[nome_ftp] = motivo
+
+    def confirmar(self, chave_upload):
+        liberados = []
+        with self._lock:
+            for nome_ftp in self.por_chave.pop(chave_upload, ()):
+                pendentes = self.pendentes.get(nome_ftp)
+                if pendentes is None or nome_ftp in self.bloqueados:
+                    continue
+                pendentes.discard(chave_upload)
+                if not pendentes:
+                    liberados.append(nome_ftp)
+        for nome_ftp in liberados:
+            self.ao_liberar(nome_ftp)
+
+    def falhar(self, chave_upload, motivo):
+        with self._lock:
+            for nome_ftp in self.por_chave.get(chave_upload, ()):
+                self.bloqueados.setdefault(nome_ftp, motivo)
+
+    def nao_liberados(self):
+        """Arquivos mantidos no FTP e o motivo"""
+        with self._lock:
+            mantidos = dict(self.bloqueados)
+            for nome, pendentes in self.pendentes.items():
+                if pendentes and nome not in mantidos:
+                    mantidos[nome] = f"{len(pendentes)} upload(s) não confirmado(s)"
+            return mantidos
+
+class ExclusorFTP:
+    """
+    Estágio de exclusão em paralelo: cada arquivo liberado é excluído assim
+    que possível, em várias sessões do PoolFTP, com resultado por arquivo
+    e registro no diário.
+    """
+
+    def __init__(self, pool, journal=None, workers=None):
+        self.pool = pool
+        self.journal = journal
+        self.workers = workers or pool.tamanho
+        self.resultados = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ftp-dele",
+                                            initializer=profiling.inicializador_thread())
+        self._futuros = []
+        self._lock = threading.Lock()
+        self._nivel_arquivo = logging_setup.nivel_por_arquivo()
+
+    def agendar(self, nome_ftp):
+        with self._lock:
+            if nome_ftp in self.resultados:
+                return
+            self.resultados[nome_ftp] = "agendado"
+            self._futuros.append(self._executor.submit(tracing.propagar(self._excluir), nome_ftp))
+
+    def _excluir(self, nome_ftp):
+        try:
+            with tracing.span("ftp.dele", arquivo=nome_ftp), self.pool.sessao() as ftp:
+                ftp.delete(nome_ftp)
+            if self.journal:
+                self.journal.registrar(run_journal.chave_ftp(nome_ftp), run_journal.DELETADO)
+            logger.log(self._nivel_arquivo, "✓ Arquivo '%s' excluído do FTP", nome_ftp)
+            resultado = "excluido"
+        except Exception as e_del:
+            logger.error("Erro ao excluir '%s' do FTP: %s", nome_ftp, e_del)
+            resultado = f"erro: {e_del}"
+        with self._lock:
+            self.resultados[nome_ftp] = resultado
+
+    def aguardar(self):
+        """Espera as exclusões em andamento e encerra o estágio"""
+        with self._lock:
+            futuros = list(self._futuros)
+        for futuro in futuros:
+            futuro.result()
+        self._executor.shutdown(wait=True)
+
+    def resumo(self, nao_liberados=None):
+        with self._lock:
+            por_arquivo = dict(self.resultados)
+        for nome, motivo in (nao_liberados or {}).items():
+            por_arquivo.setdefault(nome, f"mantido: {motivo}")
+        excluidos = sum(1 for r in por_arquivo.values() if r == "excluido")
+        erros = sum(1 for r in por_arquivo.values() if r.startswith("erro"))
+        return {"excluidos": excluidos, "erros": erros,
+                "mantidos": len(por_arquivo) - excluidos - erros, "por_arquivo": por_arquivo}
+
+def chaves_upload_do_arquivo(journal, nome_ftp, pasta_unzip):
+    """
+    Deriva, a partir do diário, os uploads que dependem de um arquivo do FTP.
+    Retorna None se o arquivo não pode ser liberado (ZIP não processado).
+    """
+    chaves = []
+    eh_devolucao = "devolucaoar" in nome_ftp.lower()
+    if nome_ftp.lower().endswith(".zip"):
+        if not journal.atingiu(run_journal.chave_ftp(nome_ftp), run_journal.EXTRAIDO):
+            return None
+        for artefato in journal.dados(run_journal.chave_ftp(nome_ftp)).get("artefatos") or []:
+            caminho = os.path.join(pasta_unzip, artefato)
+            if os.path.isdir(caminho):
+                chaves.extend(
+                    run_journal.chave_upload("principal", os.path.relpath(os.path.join(raiz, nome), pasta_unzip))
+                    for raiz, _, nomes in os.walk(caminho) for nome in nomes
+                )
+            else:
+                chaves.append(run_journal.chave_upload("principal", artefato))
+    if eh_devolucao:
+        chaves.append(run_journal.chave_upload("devolucaoar", nome_ftp))
+    return chaves
@@ -0,0 +1,94 @@
+# fila_uploads.py
+
+import os
+import time
+import threading
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def get_prioridade_faixas():
+    """
+    Ordem das faixas de upload (UPLOAD_LANE_PRIORITY, da mais urgente para a
+    menos): padrão "principal,devolucaoar" (PDFs finais antes dos originais
+    arquivados). Faixas não listadas vão para o fim.
+    """
+    nomes = [n.strip() for n in os.getenv('UPLOAD_LANE_PRIORITY', 'principal,devolucaoar').split(",") if n.strip()]
+    return {nome: posicao for posicao, nome in enumerate(nomes)}
+
+def get_ordem():
+    """
+    'lpt' (maior arquivo primeiro, padrão) ou 'listagem' (ordem do os.walk).
+    O LPT só vale com mais de um trabalhador; em série a ordem é a da listagem.
+    """
+    ordem = os.getenv('UPLOAD_ORDER', 'lpt').strip().lower()
+    return ordem if ordem in ("lpt", "listagem") else "lpt"
+
+class FilaUploads:
+    """
+    Fila única dos uploads de todas as faixas de uma execução: por prioridade
+    da faixa e, dentro da faixa, maior arquivo primeiro (LPT). Com vários
+    trabalhadores puxando da mesma fila, os arquivos grandes começam cedo e
+    o fim de uma faixa é preenchido pela seguinte, o que encurta o tempo
+    total (makespan) sem atrasar a faixa prioritária. Com um só trabalhador
+    o LPT não encurta nada e a fila mantém a ordem da listagem.
+    Mede, por faixa, o tempo até o primeiro e o último arquivo concluído.
+    """
+
+    def __init__(self, prioridades=None, ordem=None):
+        self.prioridades = prioridades if prioridades is not None else get_prioridade_faixas()
+        self.ordem = ordem or get_ordem()
+        self.itens = []
+        self.faixas = {}
+        self._inicio = None
+        self._lock = threading.Lock()
+
+    def adicionar(self, faixa, caminho, chave):
+        tamanho = os.path.getsize(caminho)
+        self.itens.append((faixa, caminho, chave, tamanho))
+        estatistica = self.faixas.setdefault(faixa, {"arquivos": 0, "bytes": 0, "concluidos": 0, "falhas": 0,
+                                                      "primeiro": None, "ultimo": None})
+        estatistica["arquivos"] += 1
+        estatistica["bytes"] += tamanho
+
+    def ordenados(self, trabalhadores=1):
+        """Itens (faixa, caminho, chave, tamanho) na ordem de execução para 'trabalhadores' em paralelo"""
+        ultima = len(self.prioridades)
+        if self.ordem == "listagem" or trabalhadores <= 1:
+            chave_ordem = lambda item: self.prioridades.get(item[0], ultima)
+        else:
+            chave_ordem = lambda item: (self.prioridades.get(item[0], ultima), -item[3])
+        # sorted é estável: empates mantêm a ordem da listagem
+        return sorted(self.itens, key=chave_ordem)
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+
+    def concluir(self, faixa, sucesso):
+        """Marca o fim de um upload da faixa (sucesso ou falha); thread-safe"""
+        decorrido = time.perf_counter() - self._inicio
+        with self._lock:
+            estatistica = self.faixas[faixa]
+            if not sucesso:
+                estatistica["falhas"] += 1
+                return
+            estatistica["concluidos"] += 1
+            estatistica["primeiro"] = min(decorrido, estatistica["primeiro"] if estatistica["primeiro"] is not None else decorrido)
+            estatistica["ultimo"] = max(decorrido, estatistica["ultimo"] or 0)
+
+    def resumo(self):
+        """Por faixa: arquivos, bytes e segundos até o primeiro/último arquivo concluído"""
+        ultima = len(self.prioridades)
+        return {
+            faixa: {
+                "prioridade": self.prioridades.get(faixa, ultima),
+                "arquivos": e["arquivos"],
+                "bytes": e["bytes"],
+                "concluidos": e["concluidos"],
+                "falhas": e["falhas"],
+                "tempo_primeiro_arquivo_s": round(e["primeiro"], 3) if e["primeiro"] is not None else None,
+                "tempo_ultimo_arquivo_s": round(e["ultimo"], 3) if e["ultimo"] is not None else None,
+            }
+            for faixa, e in self.faixas.items()
+        }
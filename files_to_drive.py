@@ -5,7 +5,30 @@ import shutil
 from pathlib import Path
 from dotenv import load_dotenv
 import time
+import asyncio
+import contextlib
 import logging
+import tracing
+import logging_setup
+import run_journal
+import staging
+import staging_store
+import integridade
+import content_index
+import bundle_devolucaoar
+import ftp_pool
+import zip_extractor
+import exclusao_ftp
+import ftp_listing
+import banda
+import transferencias_async
+import drive_async
+import autotuner
+import fila_uploads
+import pastas_drive
+import cota_drive
+import indice_registros
+import perfis
 from upload_gdrive import clear_main_drive_folder, clear_devolucaoar_drive_folder
 
 try:
@@ -22,10 +45,10 @@ logger = logging.getLogger(__name__)
 
 # ✅ CORREÇÃO: Função para obter diretório de trabalho temporário
 def get_temp_work_dir():
-    """Retorna diretório de trabalho temporário compatível com Vercel"""
+    """Retorna diretório de trabalho temporário compatível com Vercel (um por perfil)"""
     temp_dir = tempfile.gettempdir()  # /tmp no Vercel
     work_dir = os.path.join(temp_dir, "files_to_drive_processing")
-    return work_dir
+    return perfis.atual().diretorio_trabalho(work_dir)
 
 def setup_work_environment():
     """Configura ambiente de trabalho temporário"""
@@ -52,35 +75,48 @@ def cleanup_work_environment(work_dir):
     except Exception as e:
         logger.warning(f"Erro ao limpar ambiente de trabalho: {e}")
 
-# --- CONFIGURAÇÕES DE PASTAS DO DRIVE ---
-TARGET_DRIVE_FOLDER_ID_PRINCIPAL = os.getenv('TARGET_FOLDER_ID')
-TARGET_DRIVE_FOLDER_ID_DEVOLUCAOAR_ARCHIVE = os.getenv('TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE')
+# --- CONFIGURAÇÕES DE FTP E PASTAS DO DRIVE ---
+# Vêm do perfil da execução (perfis.atual()): o padrão lê HOST, USER_ECARTA,
+# PASSWORD, DIRECTORY, TARGET_FOLDER_ID e TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE
 
-# --- CONFIGURAÇÕES DE FTP ---
-HOST_FTP = os.getenv('HOST')
-PORT_FTP = int(os.getenv('PORT', 21))
-USUARIO_FTP = os.getenv('USER_ECARTA')
-SENHA_FTP = os.getenv('PASSWORD')
-DIRETORIO_FTP = os.getenv('DIRECTORY')
+# ✅ Pré-verificação barata: encerra a execução se o diretório FTP não mudou
+FTP_FAST_PATH = os.getenv('FTP_FAST_PATH', 'true').strip().lower() in ("1", "true", "sim", "yes", "on")
 
-def validar_configuracoes():
-    """Valida se todas as configurações necessárias estão definidas"""
-    erros = []
-
-    if not TARGET_DRIVE_FOLDER_ID_PRINCIPAL:
-        erros.append("TARGET_FOLDER_ID (pasta principal do Drive) não definido no .env")
-
-    if not TARGET_DRIVE_FOLDER_ID_DEVOLUCAOAR_ARCHIVE:
-        erros.append("TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE (pasta de arquivo DevolucaoAR) não definido no .env")
+# ✅ Limpeza das pastas do Drive no início de cada execução (inclusive das subpastas
+# de DRIVE_SUBFOLDERS registradas no mapa). Com 'false' o conteúdo é mantido e, com
+# CONTENT_DEDUP=true, o índice de conteúdo evita reenviar arquivos repetidos
+DRIVE_CLEANUP = os.getenv('DRIVE_CLEANUP', 'true').strip().lower() in ("1", "true", "sim", "yes", "on")
 
-    if not HOST_FTP:
-        erros.append("HOST do FTP não definido no .env")
+def listar_arquivos_para_upload(pasta):
+    """Todos os arquivos sob 'pasta' (recursivo), na ordem do os.walk"""
+    return [
+        os.path.join(root, fn) for root, _, fns in os.walk(pasta)
+        for fn in fns if os.path.isfile(os.path.join(root, fn))
+    ]
 
-    if not USUARIO_FTP:
-        erros.append("USER_ECARTA não definido no .env")
-
-    if not SENHA_FTP:
-        erros.append("PASSWORD do FTP não definido no .env")
+def validar_configuracoes():
+    """Valida se todas as configurações necessárias do perfil da execução estão definidas"""
+    perfil = perfis.atual()
+
+    if perfil.padrao:
+        faltantes = [
+            (perfil.pasta_principal, "TARGET_FOLDER_ID (pasta principal do Drive) não definido no .env"),
+            (perfil.pasta_devolucaoar, "TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE (pasta de arquivo DevolucaoAR) não definido no .env"),
+            (perfil.host_ftp, "HOST do FTP não definido no .env"),
+            (perfil.usuario_ftp, "USER_ECARTA não definido no .env"),
+            (perfil.senha_ftp, "PASSWORD do FTP não definido no .env"),
+        ]
+    else:
+        faltantes = [
+            (perfil.pasta_principal, f"pasta_principal não definida no perfil '{perfil.nome}'"),
+            (perfil.pasta_devolucaoar, f"pasta_devolucaoar não definida no perfil '{perfil.nome}'"),
+            (perfil.host_ftp, f"host do FTP não definido no perfil '{perfil.nome}'"),
+            (perfil.usuario_ftp, f"usuario do FTP não definido no perfil '{perfil.nome}'"),
+            (perfil.senha_ftp, f"senha do FTP não definida no perfil '{perfil.nome}' (senha_env: {perfil.senha_env})"),
+            (perfil.credenciais(), f"credenciais do Drive não definidas no perfil '{perfil.nome}' "
+                                   f"(credenciais_env: {perfil.credenciais_env})"),
+        ]
+    erros = [mensagem for valor, mensagem in faltantes if not valor]
 
     if erros:
         for erro in erros:
@@ -89,14 +125,350 @@ def validar_configuracoes():
 
     return True
 
-def processar_files_to_drive():
+def enviar_indice_bundle(drive_service, indice, journal, envio, registro_integridade, pasta_id, orcamento=None):
+    """
+    Envia o índice do bundle como um JSON separado na mesma pasta, para
+    consultar o conteúdo sem baixar o .tar.gz. Falhas só geram aviso (o
+    índice também está dentro do bundle). Retorna o ID no Drive ou None.
+    """
+    nome = bundle_devolucaoar.nome_indice(journal.run_id)
+    chave = run_journal.chave_upload("devolucaoar", nome)
+    motivo = orcamento.admitir(orcamento.chamadas_arquivo(0)) if orcamento else None
+    if motivo:
+        logger.warning(f"⏸️  Índice do bundle '{nome}' não enviado: {motivo}")
+        return None
+
+    caminho_indice = os.path.join(ecarta_processor.get_temp_base_dir(), nome)
+    try:
+        with tracing.span("bundle_devolucaoar.indice"):
+            md5_indice = bundle_devolucaoar.gravar_indice(indice, caminho_indice)
+            registro_integridade.esperar(caminho_indice, md5_indice, origem="bundle")
+            metadados = {}
+            drive_file_id, acao = envio.enviar(drive_service, caminho_indice, pasta_id, md5_indice, metadados=metadados)
+        if not drive_file_id:
+            logger.warning(f"⚠️  Falha no upload do índice do bundle '{nome}' (o índice segue dentro do bundle)")
+            return None
+        if registro_integridade.verificar(caminho_indice, metadados.get("md5Checksum"), drive_file_id) is False:
+            journal.registrar(chave, run_journal.DIVERGENTE, drive_id=drive_file_id, md5=metadados.get("md5Checksum"), acao=acao)
+            return None
+        journal.registrar(chave, run_journal.ENVIADO, drive_id=drive_file_id, md5=metadados.get("md5Checksum"), acao=acao)
+        logger.info(f"✓ Índice do bundle enviado ({acao}): {nome}")
+        return drive_file_id
+    except Exception as e:
+        logger.warning(f"⚠️  Erro ao enviar o índice do bundle '{nome}': {e}")
+        return None
+    finally:
+        if os.path.exists(caminho_indice):
+            os.remove(caminho_indice)
+
+def enviar_bundle_devolucaoar(drive_service, caminhos, journal, envio, registro_integridade, rastreador,
+                              pasta_id=None, orcamento=None, indice_ar=None):
+    """
+    Empacota os originais DevolucaoAR da execução num único .tar.gz (com
+    índice) e o envia como um só objeto, seguido de uma cópia do índice em
+    JSON (enviar_indice_bundle). Nome estável por execução, então a
+    retomada reaproveita o envio já registrado no diário.
+    """
+    nome = bundle_devolucaoar.nome_bundle(journal.run_id)
+    chave = run_journal.chave_upload("devolucaoar", nome)
+    chave_indice = run_journal.chave_upload("devolucaoar", bundle_devolucaoar.nome_indice(journal.run_id))
+    chaves_originais = [run_journal.chave_upload("devolucaoar", os.path.basename(c)) for c in caminhos]
+    if journal.atingiu(chave, run_journal.ENVIADO):
+        # Originais já confirmados no diário (rastreador os tratou ao registrar dependências)
+        logger.info(f"Bundle '{nome}' já enviado em execução anterior")
+        return {"sucesso": len(caminhos), "falha": 0,
+                "bundle": {"nome": nome, "drive_id": journal.dados(chave).get("drive_id"),
+                           "indice_drive_id": journal.dados(chave_indice).get("drive_id")
+                           if journal.atingiu(chave_indice, run_journal.ENVIADO) else None}}
+
+    # Bundle ainda não existe: o tamanho dos originais aproxima o dele
+    tamanho_previsto = sum(os.path.getsize(c) for c in caminhos if os.path.exists(c))
+    motivo = orcamento.admitir(orcamento.chamadas_arquivo(tamanho_previsto)) if orcamento else None
+    if motivo:
+        logger.warning(f"⏸️  Bundle DevolucaoAR '{nome}' adiado: {motivo}")
+        orcamento.adiar()
+        for chave_original in chaves_originais:
+            rastreador.falhar(chave_original, f"adiado: {motivo}")
+        return {"sucesso": 0, "falha": len(caminhos), "bundle": {"nome": nome, "adiado": motivo}}
+
+    existentes = [c for c in caminhos if os.path.exists(c)]
+    for faltante in set(caminhos) - set(existentes):
+        logger.warning("Arquivo DevolucaoAR original '%s' não encontrado", faltante)
+
+    caminho_bundle = os.path.join(ecarta_processor.get_temp_base_dir(), nome)
+    try:
+        with tracing.span("bundle_devolucaoar", arquivos=len(existentes)) as sp_bundle:
+            indice, md5_bundle = bundle_devolucaoar.criar_bundle(existentes, caminho_bundle, run_id=journal.run_id)
+            registro_integridade.esperar(caminho_bundle, md5_bundle, origem="bundle")
+            sp_bundle.definir(bytes=os.path.getsize(caminho_bundle))
+
+            metadados = {}
+            drive_file_id, acao = envio.enviar(
+                drive_service, caminho_bundle, pasta_id or perfis.atual().pasta_devolucaoar, md5_bundle,
+                metadados=metadados
+            )
+        if not drive_file_id:
+            logger.error("✗ Falha no upload do bundle DevolucaoAR '%s'", nome)
+            for chave_original in chaves_originais:
+                rastreador.falhar(chave_original, "upload do bundle falhou")
+            return {"sucesso": 0, "falha": len(caminhos), "bundle": {"nome": nome}}
+
+        if registro_integridade.verificar(caminho_bundle, metadados.get("md5Checksum"), drive_file_id) is False:
+            # Cópia no Drive não confere: nada é confirmado e os originais ficam no FTP
+            journal.registrar(chave, run_journal.DIVERGENTE, drive_id=drive_file_id, md5=metadados.get("md5Checksum"), acao=acao)
+            for chave_original in chaves_originais:
+                rastreador.falhar(chave_original, "MD5 divergente no Drive")
+            return {"sucesso": 0, "falha": len(caminhos),
+                    "bundle": {"nome": nome, "drive_id": drive_file_id, "divergente": True}}
+        journal.registrar(chave, run_journal.ENVIADO, drive_id=drive_file_id, md5=metadados.get("md5Checksum"), acao=acao)
+        # Cada original fica confirmado pelo bundle
+        confirmadas = [k for c, k in zip(caminhos, chaves_originais) if c in existentes]
+        journal.registrar_varios(confirmadas, run_journal.ENVIADO)
+        for chave_original in confirmadas:
+            rastreador.confirmar(chave_original)
+        if indice_ar:
+            for caminho in existentes:
+                indice_ar.vincular_origem(os.path.basename(caminho), drive_file_id)
+        logger.info(f"✓ Bundle DevolucaoAR enviado ({acao}): {nome} com {len(existentes)} arquivo(s)")
+        indice_drive_id = enviar_indice_bundle(drive_service, indice, journal, envio, registro_integridade,
+                                               pasta_id or perfis.atual().pasta_devolucaoar, orcamento)
+        return {
+            "sucesso": len(existentes),
+            "falha": len(caminhos) - len(existentes),
+            "bundle": {"nome": nome, "drive_id": drive_file_id, "arquivos": len(indice["arquivos"]),
+                       "bytes": os.path.getsize(caminho_bundle), "indice_drive_id": indice_drive_id}
+        }
+    except Exception as e:
+        logger.error(f"Erro ao criar/enviar bundle DevolucaoAR: {e}")
+        for chave_original in chaves_originais:
+            rastreador.falhar(chave_original, "upload do bundle falhou")
+        return {"sucesso": 0, "falha": len(caminhos), "bundle": {"nome": nome, "erro": str(e)}}
+    finally:
+        if os.path.exists(caminho_bundle):
+            os.remove(caminho_bundle)
+
+# Etapa (agregador de logs) e rótulos de log de cada faixa de upload
+_ETAPAS_UPLOAD = {
+    "principal": ("upload_pdfs_finais", "Upload realizado", "Falha no upload"),
+    "devolucaoar": ("upload_devolucaoar", "Upload DevolucaoAR", "Falha upload DevolucaoAR"),
+}
+
+def pastas_configuradas():
+    """Pastas de destino configuradas, por faixa de upload"""
+    perfil = perfis.atual()
+    return {"principal": perfil.pasta_principal,
+            "devolucaoar": perfil.pasta_devolucaoar}
+
+def resolver_pastas_destino(drive_service, journal):
+    """
+    Pastas de destino da execução: com DRIVE_SUBFOLDERS, a subpasta do dia
+    (ou do lote) dentro de cada pasta configurada, criada sob demanda e com
+    o ID guardado no mapa persistente (sem buscas repetidas nas próximas
+    execuções). Sem a opção, ou se a subpasta não puder ser resolvida, as
+    próprias pastas configuradas.
+    Retorna ({"principal": id, "devolucaoar": id}, mapa ou None, resumo ou None).
+    """
+    destinos = pastas_configuradas()
+    modo = pastas_drive.get_modo_subpastas()
+    if not modo:
+        return destinos, None, None
+
+    nome = pastas_drive.nome_subpasta(modo, journal.run_id)
+    mapa = pastas_drive.MapaPastas(ecarta_processor.get_folder_map_file_path()).carregar()
+    with tracing.span("subpastas_drive", modo=modo, subpasta=nome):
+        for faixa, pasta_pai in list(destinos.items()):
+            try:
+                destinos[faixa] = mapa.obter(drive_service, pasta_pai, nome)
+            except Exception as e:
+                logger.warning(f"⚠️  Subpasta '{nome}' indisponível em {pasta_pai}; usando a pasta raiz: {e}")
+    mapa.salvar()
+    logger.info(f"📁 Uploads na subpasta '{nome}' ({modo}): {mapa.resumo()}")
+    return destinos, mapa, {"modo": modo, "subpasta": nome, "pastas": dict(destinos), **mapa.resumo()}
+
+def enviar_faixas(drive_service, drive_credentials, faixas, journal, envio, registro_integridade, rastreador,
+                  autoajuste=None, orcamento=None, indice_ar=None):
+    """
+    Envia os arquivos de uma ou mais faixas ("principal" e "devolucaoar"),
+    cada uma {"faixa", "caminhos", "pasta_id", "pasta_base"}, numa fila única
+    (fila_uploads.FilaUploads: prioridade da faixa, maior arquivo primeiro).
+    Cada envio é registrado no diário, na verificação de integridade e nas
+    dependências de exclusão do FTP; arquivos já enviados segundo o diário
+    contam como sucesso. Com ASYNC_TRANSFERS os uploads rodam em paralelo no
+    event loop (drive_async) e, com autoajuste, o número de uploads
+    simultâneos é ajustado durante a fase. Com orcamento (cota_drive), cada
+    arquivo é admitido antes do envio; se o orçamento de chamadas não o
+    comporta, ele é adiado (conta como falha e fica no FTP para a próxima
+    execução). Com indice_ar (indice_registros), o ID de cada PDF (ou do
+    ZIP original arquivado) é ligado aos registros do manifesto.
+    Retorna ({faixa: (sucesso, falha)}, resumo da fila por faixa).
+    """
+    nivel_arquivo = logging_setup.nivel_por_arquivo()
+    fila = fila_uploads.FilaUploads()
+    sucesso = {f["faixa"]: 0 for f in faixas}
+    pastas = {f["faixa"]: f["pasta_id"] for f in faixas}
+    with tracing.span("upload", arquivos=sum(len(f["caminhos"]) for f in faixas),
+                      faixas=",".join(sucesso), ordem=fila.ordem), contextlib.ExitStack() as pilha:
+        agregadores = {faixa: pilha.enter_context(logging_setup.AgregadorEtapa(_ETAPAS_UPLOAD[faixa][0], logger))
+                       for faixa in sucesso}
+
+        def _registrar(faixa, caminho, chave, drive_file_id, acao, metadados):
+            """Registra o resultado de um envio; True se o arquivo está no Drive"""
+            _, rotulo_ok, rotulo_falha = _ETAPAS_UPLOAD[faixa]
+            if not drive_file_id:
+                fila.concluir(faixa, False)
+                rastreador.falhar(chave, "upload falhou")
+                logger.error("✗ %s: %s", rotulo_falha, os.path.basename(caminho))
+                agregadores[faixa].registrar(erro=True)
+                return False
+            if registro_integridade.verificar(caminho, metadados.get("md5Checksum"), drive_file_id) is False:
+                # Não conta como enviado: o original fica no FTP e é reenviado na próxima execução
+                fila.concluir(faixa, False)
+                journal.registrar(chave, run_journal.DIVERGENTE, drive_id=drive_file_id, md5=metadados.get("md5Checksum"), acao=acao)
+                rastreador.falhar(chave, "MD5 divergente no Drive")
+                logger.error("✗ %s (MD5 divergente): %s", rotulo_falha, os.path.basename(caminho))
+                agregadores[faixa].registrar(erro=True)
+                return False
+            fila.concluir(faixa, True)
+            journal.registrar(chave, run_journal.ENVIADO, drive_id=drive_file_id, md5=metadados.get("md5Checksum"), acao=acao)
+            rastreador.confirmar(chave)
+            _vincular(faixa, caminho, drive_file_id, metadados.get("md5Checksum"))
+            logger.log(nivel_arquivo, "✓ %s (%s): %s", rotulo_ok, acao, os.path.basename(caminho))
+            agregadores[faixa].registrar(os.path.getsize(caminho) if acao == "enviado" else 0)
+            return True
+
+        def _vincular(faixa, caminho, drive_file_id, md5=None):
+            if not indice_ar or not drive_file_id:
+                return
+            if faixa == "principal":
+                indice_ar.vincular(os.path.basename(caminho), drive_file_id, md5)
+            elif faixa == "devolucaoar":
+                indice_ar.vincular_origem(os.path.basename(caminho), drive_file_id)
+
+        adiados = []
+
+        def _adiar(faixa, caminho, chave, motivo):
+            logger.log(nivel_arquivo, "⏸️  Upload adiado (%s): %s", motivo, os.path.basename(caminho))
+            adiados.append(motivo)
+            orcamento.adiar()
+            fila.concluir(faixa, False)
+            rastreador.falhar(chave, f"adiado: {motivo}")
+
+        def _erro(faixa, caminho, chave, e):
+            logger.error("Erro no upload de %s: %s", caminho, e)
+            fila.concluir(faixa, False)
+            rastreador.falhar(chave, "upload falhou")
+            agregadores[faixa].registrar(erro=True)
+
+        for f in faixas:
+            for caminho in f["caminhos"]:
+                chave = run_journal.chave_upload(f["faixa"], os.path.relpath(caminho, f["pasta_base"]) if f.get("pasta_base")
+                                                 else os.path.basename(caminho))
+                if journal.atingiu(chave, run_journal.ENVIADO):
+                    sucesso[f["faixa"]] += 1
+                    enviado = journal.dados(chave)
+                    _vincular(f["faixa"], caminho, enviado.get("drive_id"), enviado.get("md5"))
+                elif not os.path.exists(caminho):
+                    logger.warning("Arquivo não encontrado: %s", caminho)
+                    rastreador.falhar(chave, "upload falhou")
+                    agregadores[f["faixa"]].registrar(erro=True)
+                else:
+                    fila.adicionar(f["faixa"], caminho, chave)
+
+        # ✅ LPT só com envios em paralelo (async); o envio síncrono é em série
+        async_ativo = transferencias_async.async_habilitado()
+        pendentes = fila.ordenados(transferencias_async.get_concorrencia_drive() if async_ativo else 1)
+        fila.iniciar()
+        if pendentes and async_ativo:
+            controlador = None
+            if autoajuste:
+                controlador = autoajuste.controlador("drive", transferencias_async.get_concorrencia_drive())
+            enviados = transferencias_async.executar(
+                _enviar_pendentes_async, drive_credentials, pendentes, pastas, envio, registro_integridade,
+                _registrar, _erro, controlador, orcamento, _adiar
+            )
+            for faixa, quantidade in enviados.items():
+                sucesso[faixa] += quantidade
+        else:
+            for faixa, caminho, chave, tamanho in pendentes:
+                motivo = orcamento.admitir(orcamento.chamadas_arquivo(tamanho)) if orcamento else None
+                if motivo:
+                    _adiar(faixa, caminho, chave, motivo)
+                    continue
+                try:
+                    metadados = {}
+                    drive_file_id, acao = envio.enviar(
+                        drive_service, caminho, pastas[faixa], registro_integridade.md5_esperado(caminho), metadados=metadados
+                    )
+                    sucesso[faixa] += _registrar(faixa, caminho, chave, drive_file_id, acao, metadados)
+                except Exception as e:
+                    _erro(faixa, caminho, chave, e)
+
+        if adiados:
+            logger.warning(f"⏸️  {len(adiados)} upload(s) adiado(s) para a próxima execução: {adiados[-1]}")
+
+    resultados = {f["faixa"]: (sucesso[f["faixa"]], len(f["caminhos"]) - sucesso[f["faixa"]]) for f in faixas}
+    return resultados, fila.resumo()
+
+async def _enviar_pendentes_async(drive_credentials, pendentes, pastas, envio, registro_integridade, registrar, erro,
+                                  controlador=None, orcamento=None, adiar=None):
+    """
+    Uploads em paralelo no event loop: DRIVE_ASYNC_CONCURRENCY corrotinas
+    consomem a fila já ordenada, limitadas também pelo semáforo "drive" do
+    loop (compartilhado entre execuções). Com controlador (autotune) sobem
+    até o teto AUTOTUNE_MAX_DRIVE e o limite corrente é o do controlador.
+    Retorna {faixa: arquivos enviados}.
+    """
+    concorrencia = controlador.maximo if controlador else transferencias_async.get_concorrencia_drive()
+    limite = transferencias_async.semaforo("drive", concorrencia)
+    portao = controlador if controlador else contextlib.nullcontext()
+    fila = iter(pendentes)
+    enviados = {}
+
+    async with drive_async.ClienteDriveAsync(drive_credentials,
+                                             ao_responder=controlador.observar_status if controlador else None,
+                                             orcamento=orcamento) as cliente:
+
+        async def trabalhador():
+            for faixa, caminho, chave, tamanho in fila:
+                motivo = orcamento.admitir(orcamento.chamadas_arquivo(tamanho)) if orcamento else None
+                if motivo:
+                    adiar(faixa, caminho, chave, motivo)
+                    continue
+                try:
+                    async with portao, limite:
+                        metadados = {}
+                        drive_file_id, acao = await envio.enviar_async(
+                            cliente, caminho, pastas[faixa], registro_integridade.md5_esperado(caminho), metadados=metadados
+                        )
+                    if controlador:
+                        controlador.registrar(tamanho if acao == "enviado" else 0, erro=not drive_file_id)
+                    # Diário com fsync e confirmação de exclusão: fora do event loop
+                    if await asyncio.to_thread(registrar, faixa, caminho, chave, drive_file_id, acao, metadados):
+                        enviados[faixa] = enviados.get(faixa, 0) + 1
+                except Exception as e:
+                    if controlador:
+                        controlador.registrar(erro=True)
+                    erro(faixa, caminho, chave, e)
+
+        await asyncio.gather(*(trabalhador() for _ in range(min(concorrencia, len(pendentes)))))
+        logger.debug("Uploads assíncronos: %s", cliente.resumo())
+    return enviados
+
+def processar_files_to_drive(retomar=False):
     """
     Função principal que processa arquivos do FTP para o Drive
+    Com retomar=True continua a última execução interrompida a partir do diário
+    (sem limpar o Drive nem o estado local)
     Retorna um dicionário com o resultado do processamento
     """
     logger.info("--- Iniciando fluxo: Processamento eCarta, Uploads para Google Drive, Limpeza FTP ---")
     start_time_total = time.perf_counter()
+    marcas_banda = banda.marcar()
     work_dir = None
+    perfil = perfis.atual()
+    journal = run_journal.RunJournal(ecarta_processor.get_journal_file_path())
+    # Estado da execução: criado só depois da pré-verificação do FTP
+    pool = exclusor = rastreador = indice_conteudo = autoajuste = orcamento = indice_ar = None
 
     resultado = {
         "sucesso": False,
@@ -110,7 +482,7 @@ def processar_files_to_drive():
             "upload_arquivos_devolucaoAR": False,
             "exclusao_ftp": False
         },
-        "detalhes": {},
+        "detalhes": {"perfil": perfil.nome},
         "tempo_total": 0,
         "mensagem": ""
     }
@@ -121,6 +493,54 @@ def processar_files_to_drive():
         resultado["etapas"]["validacao"] = True
         logger.info("✓ Configurações validadas com sucesso")
 
+        # ✅ Retomada: só faz sentido se o diário tiver uma execução incompleta
+        if retomar and not journal.carregar().execucao_incompleta():
+            logger.info("Nenhuma execução incompleta no diário. Seguindo com execução completa")
+            retomar = False
+        resultado["detalhes"]["retomada"] = retomar
+
+        # ✅ Pré-verificação: uma listagem FTP decide se há algo novo
+        fingerprint_ftp = None
+        if FTP_FAST_PATH and not retomar:
+            try:
+                fingerprint_ftp, quantidade_ftp = ecarta_processor.obter_fingerprint_ftp(
+                    perfil.host_ftp, perfil.port_ftp, perfil.usuario_ftp, perfil.senha_ftp, perfil.diretorio_ftp
+                )
+                sem_novidades = quantidade_ftp == 0 or fingerprint_ftp == ecarta_processor.carregar_ultimo_fingerprint()
+                if sem_novidades:
+                    logger.info(f"✓ Nenhuma novidade no FTP ({quantidade_ftp} arquivo(s), listagem inalterada). Encerrando")
+                    resultado["sucesso"] = True
+                    resultado["mensagem"] = "Nenhuma novidade no FTP"
+                    resultado["detalhes"]["sem_novidades"] = True
+                    resultado["detalhes"]["arquivos_baixados_ftp"] = 0
+                    return resultado
+            except Exception as e:
+                logger.warning(f"Pré-verificação do FTP falhou, seguindo com execução completa: {e}")
+                fingerprint_ftp = None
+
+        # ✅ Estado da execução (sessões FTP, índices, orçamento do Drive): só existe
+        # quando há trabalho, então a pré-verificação sem novidades não toca em nada disso
+        pool = ftp_pool.PoolFTP(perfil.host_ftp, perfil.port_ftp, perfil.usuario_ftp, perfil.senha_ftp, perfil.diretorio_ftp)
+        exclusor = exclusao_ftp.ExclusorFTP(pool, journal)
+        rastreador = exclusao_ftp.RastreadorDependencias(exclusor.agendar)
+        if content_index.dedup_habilitado():
+            indice_conteudo = content_index.IndiceConteudo(ecarta_processor.get_content_index_file_path()).carregar()
+        if autotuner.autotune_habilitado():
+            if transferencias_async.async_habilitado():
+                autoajuste = autotuner.AutoAjuste(ecarta_processor.get_autotune_file_path()).carregar()
+            else:
+                logger.warning("AUTOTUNE requer ASYNC_TRANSFERS=true; concorrência fixa nesta execução")
+        orcamento = cota_drive.OrcamentoChamadas(ecarta_processor.get_drive_calls_file_path(),
+                                                 janela=cota_drive.janela(perfil.nome)).carregar()
+        if indice_registros.registros_habilitado():
+            try:
+                indice_ar = indice_registros.IndiceRegistros(ecarta_processor.get_records_db_path()).abrir()
+            except Exception as e:
+                logger.warning(f"Índice local de registros indisponível nesta execução: {e}")
+
+        # ✅ Diário da execução (durável, um registro por transição de arquivo)
+        journal.iniciar(retomar=retomar)
+
         # ✅ Configurar ambiente de trabalho
         work_dir = setup_work_environment()
         resultado["etapas"]["ambiente_trabalho"] = True
@@ -133,54 +553,101 @@ def processar_files_to_drive():
         if not drive_service or not drive_credentials:
             raise Exception("Falha ao obter o serviço do Google Drive ou credenciais")
 
+        # Todas as chamadas do serviço passam pela contabilidade/orçamento da execução
+        cota_drive.instrumentar(drive_service, orcamento)
         resultado["etapas"]["drive_service"] = True
         logger.info("✓ Serviço do Google Drive obtido com sucesso")
 
         # ✅ NOVA FASE 0: Limpeza das pastas do Google Drive
         logger.info("\n--- Fase 0: Limpeza das pastas do Google Drive ---")
         
-        try:
-            # Limpar pasta principal
-            logger.info("🧹 Limpando pasta principal do Drive...")
-            resultado_limpeza_principal = gdrive_uploader.clear_main_drive_folder(drive_service)
+        if retomar:
+            # Na retomada o Drive já contém os uploads da execução interrompida
+            logger.info("Retomada: limpeza do Drive ignorada")
+            resultado["etapas"]["limpeza_drive"] = True
+        elif not DRIVE_CLEANUP:
+            logger.info("DRIVE_CLEANUP desativado: conteúdo das pastas do Drive mantido")
+            resultado["etapas"]["limpeza_drive"] = True
+        else:
+            try:
+                with tracing.span("limpeza_drive"):
+                    # Com DRIVE_SUBFOLDERS, as subpastas do mapa (dias/lotes anteriores) também são esvaziadas
+                    subpastas = {}
+                    if pastas_drive.get_modo_subpastas():
+                        mapa_limpeza = pastas_drive.MapaPastas(ecarta_processor.get_folder_map_file_path()).carregar()
+                        subpastas = {pasta: mapa_limpeza.subpastas(pasta)
+                                     for pasta in (perfil.pasta_principal, perfil.pasta_devolucaoar)}
+                        logger.info(f"🧹 Limpeza inclui {sum(len(v) for v in subpastas.values())} subpasta(s) do mapa")
+
+                    # Limpar pasta principal
+                    logger.info("🧹 Limpando pasta principal do Drive...")
+                    subpastas_principal = subpastas.get(perfil.pasta_principal, {})
+                    resultado_limpeza_principal = gdrive_uploader.clear_main_drive_folder(drive_service, subpastas_principal)
+                    if indice_conteudo:
+                        for pasta in [perfil.pasta_principal, *subpastas_principal]:
+                            indice_conteudo.esquecer_pasta(pasta)
             
-            if resultado_limpeza_principal.get("erro"):
-                logger.warning(f"Aviso na limpeza da pasta principal: {resultado_limpeza_principal['erro']}")
-            else:
-                logger.info(f"✓ Pasta principal: {resultado_limpeza_principal.get('arquivos_removidos', 0)} arquivo(s) removido(s)")
+                    if resultado_limpeza_principal.get("erro"):
+                        logger.warning(f"Aviso na limpeza da pasta principal: {resultado_limpeza_principal['erro']}")
+                    else:
+                        logger.info(f"✓ Pasta principal: {resultado_limpeza_principal.get('arquivos_removidos', 0)} arquivo(s) removido(s)")
             
-            # Limpar pasta DevolucaoAR
-            logger.info("🧹 Limpando pasta DevolucaoAR do Drive...")
-            resultado_limpeza_devolucao = gdrive_uploader.clear_devolucaoar_drive_folder(drive_service)
+                    # Limpar pasta DevolucaoAR
+                    logger.info("🧹 Limpando pasta DevolucaoAR do Drive...")
+                    subpastas_devolucao = subpastas.get(perfil.pasta_devolucaoar, {})
+                    resultado_limpeza_devolucao = gdrive_uploader.clear_devolucaoar_drive_folder(drive_service, subpastas_devolucao)
+                    if indice_conteudo:
+                        for pasta in [perfil.pasta_devolucaoar, *subpastas_devolucao]:
+                            indice_conteudo.esquecer_pasta(pasta)
             
-            if resultado_limpeza_devolucao.get("erro"):
-                logger.warning(f"Aviso na limpeza da pasta DevolucaoAR: {resultado_limpeza_devolucao['erro']}")
-            else:
-                logger.info(f"✓ Pasta DevolucaoAR: {resultado_limpeza_devolucao.get('arquivos_removidos', 0)} arquivo(s) removido(s)")
-
-            # Adicionar resultados da limpeza ao resultado final
-            resultado["detalhes"]["limpeza_drive"] = {
-                "pasta_principal": resultado_limpeza_principal,
-                "pasta_devolucaoar": resultado_limpeza_devolucao,
-                "total_removidos": (
-                    resultado_limpeza_principal.get('arquivos_removidos', 0) + 
-                    resultado_limpeza_devolucao.get('arquivos_removidos', 0)
-                )
-            }
+                    if resultado_limpeza_devolucao.get("erro"):
+                        logger.warning(f"Aviso na limpeza da pasta DevolucaoAR: {resultado_limpeza_devolucao['erro']}")
+                    else:
+                        logger.info(f"✓ Pasta DevolucaoAR: {resultado_limpeza_devolucao.get('arquivos_removidos', 0)} arquivo(s) removido(s)")
 
-            resultado["etapas"]["limpeza_drive"] = True
-            logger.info("✓ Limpeza das pastas do Drive concluída")
+                # Adicionar resultados da limpeza ao resultado final
+                resultado["detalhes"]["limpeza_drive"] = {
+                    "pasta_principal": resultado_limpeza_principal,
+                    "pasta_devolucaoar": resultado_limpeza_devolucao,
+                    "total_removidos": (
+                        resultado_limpeza_principal.get('arquivos_removidos', 0) + 
+                        resultado_limpeza_devolucao.get('arquivos_removidos', 0)
+                    )
+                }
 
-        except Exception as e:
-            logger.error(f"Erro durante limpeza do Drive: {e}")
-            resultado["detalhes"]["erro_limpeza_drive"] = str(e)
-            # Não falhar completamente por causa da limpeza
-            resultado["etapas"]["limpeza_drive"] = False
-            logger.warning("⚠️  Continuando processamento mesmo com erro na limpeza")
+                resultado["etapas"]["limpeza_drive"] = True
+                logger.info("✓ Limpeza das pastas do Drive concluída")
+
+            except Exception as e:
+                logger.error(f"Erro durante limpeza do Drive: {e}")
+                resultado["detalhes"]["erro_limpeza_drive"] = str(e)
+                # Não falhar completamente por causa da limpeza
+                resultado["etapas"]["limpeza_drive"] = False
+                logger.warning("⚠️  Continuando processamento mesmo com erro na limpeza")
+
+        # ✅ Subpastas de destino (por dia ou por lote), resolvidas uma vez por execução
+        destinos, mapa_pastas, resumo_subpastas = resolver_pastas_destino(drive_service, journal)
+        if resumo_subpastas:
+            resultado["detalhes"]["subpastas_drive"] = resumo_subpastas
 
         # ✅ FASE 1: Processar arquivos eCarta
         logger.info("\n--- Fase 1: Processamento de arquivos eCarta ---")
-        resultado_proc = ecarta_processor.processar_arquivos_ecarta_ftp()
+        estatisticas_staging = staging.EstatisticasStaging()
+        store_staging = staging_store.StagingStore(ecarta_processor.get_temp_base_dir())
+        registro_integridade = integridade.RegistroIntegridade()
+        filtro_listagem = ftp_listing.FiltroListagem.do_ambiente()
+        envio = content_index.EnvioDeduplicado(indice_conteudo, gdrive_uploader)
+        # Um pool de processos de extração para todos os ZIPs da execução
+        with tracing.span("processamento_local"), zip_extractor.PoolExtracao() as pool_zip:
+            resultado_proc = ecarta_processor.processar_arquivos_ecarta_ftp(
+                journal=journal, retomar=retomar, estatisticas_staging=estatisticas_staging,
+                store_staging=store_staging, registro_integridade=registro_integridade, pool_ftp=pool,
+                filtro_listagem=filtro_listagem, autoajuste=autoajuste, indice_registros=indice_ar,
+                pool_zip=pool_zip
+            )
+        resultado["detalhes"]["staging"] = estatisticas_staging.resumo()
+        resultado["detalhes"]["orcamento_staging"] = store_staging.resumo()
+        resultado["detalhes"]["listagem_ftp"] = filtro_listagem.resumo()
 
         if resultado_proc is None or resultado_proc[0] is None:
             raise Exception("Processamento eCarta falhou ou não retornou pasta de arquivos")
@@ -198,39 +665,73 @@ def processar_files_to_drive():
         resultado["detalhes"]["arquivos_baixados_ftp"] = len(nomes_todos_arquivos_baixados_ftp) if nomes_todos_arquivos_baixados_ftp else 0
         logger.info("✓ Processamento local dos arquivos concluído")
 
-        # ✅ FASE 2.1: Upload dos PDFs FINAIS para a pasta principal do Drive
+        # ✅ Dependências FTP -> uploads: cada arquivo é excluído do FTP assim que
+        # seus próprios uploads forem confirmados (exclusão em paralelo às fases 2.x)
+        pasta_unzip = pasta_pdfs_finais or ecarta_processor.get_unzip_files_folder()
+        for nome_ftp in nomes_todos_arquivos_baixados_ftp or []:
+            if journal.atingiu(run_journal.chave_ftp(nome_ftp), run_journal.DELETADO):
+                continue
+            chaves = exclusao_ftp.chaves_upload_do_arquivo(journal, nome_ftp, pasta_unzip)
+            if chaves is None:
+                rastreador.bloquear(nome_ftp, "ZIP não processado")
+                continue
+            rastreador.registrar(nome_ftp, chaves, [c for c in chaves if journal.atingiu(c, run_journal.ENVIADO)])
+
+        # ✅ FASE 2: Uploads numa fila única: PDFs finais (2.1) e originais DevolucaoAR (2.2) por prioridade
         arquivos_para_upload_principal = []
         
         if pasta_pdfs_finais and os.path.isdir(pasta_pdfs_finais):
             try:
-                arquivos_para_upload_principal = [
-                    os.path.join(root, fn) for root, _, fns in os.walk(pasta_pdfs_finais)
-                    for fn in fns if os.path.isfile(os.path.join(root, fn))
-                ]
+                arquivos_para_upload_principal = listar_arquivos_para_upload(pasta_pdfs_finais)
             except Exception as e:
                 logger.error(f"Erro ao listar arquivos em {pasta_pdfs_finais}: {e}")
 
+        usar_bundle = bool(caminhos_locais_devolucaoAR_originais) and bundle_devolucaoar.bundle_habilitado()
+        faixas = []
         if arquivos_para_upload_principal:
             logger.info(f"\n--- Fase 2.1: Upload de {len(arquivos_para_upload_principal)} PDFs FINAIS para Drive ---")
-            sucesso = 0
-            falha = 0
-
-            for arq_path in arquivos_para_upload_principal:
-                try:
-                    if os.path.exists(arq_path):
-                        if gdrive_uploader.upload_file_to_folder(drive_service, arq_path, TARGET_DRIVE_FOLDER_ID_PRINCIPAL):
-                            sucesso += 1
-                            logger.info(f"✓ Upload realizado: {os.path.basename(arq_path)}")
-                        else:
-                            falha += 1
-                            logger.error(f"✗ Falha no upload: {os.path.basename(arq_path)}")
-                    else:
-                        logger.warning(f"Arquivo não encontrado: {arq_path}")
-                        falha += 1
-                except Exception as e:
-                    logger.error(f"Erro no upload de {arq_path}: {e}")
-                    falha += 1
+            faixas.append({"faixa": "principal", "caminhos": arquivos_para_upload_principal,
+                           "pasta_id": destinos["principal"], "pasta_base": pasta_pdfs_finais})
+        if caminhos_locais_devolucaoAR_originais and not usar_bundle:
+            logger.info(f"\n--- Fase 2.2: Upload de {len(caminhos_locais_devolucaoAR_originais)} ARQUIVOS DEVOLUCAOAR ORIGINAIS ---")
+            faixas.append({"faixa": "devolucaoar", "caminhos": caminhos_locais_devolucaoAR_originais,
+                           "pasta_id": destinos["devolucaoar"]})
+
+        # ✅ Estimativa de chamadas ao Drive a partir dos arquivos locais, antes dos envios
+        # (uploads síncronos vão em blocos, um upload.bloco cada — pequenos só com DRIVE_RATE_LIMIT; o async envia num único PUT)
+        tamanhos = [os.path.getsize(c) for f in faixas for c in f["caminhos"] if os.path.exists(c)]
+        if usar_bundle:
+            # O bundle e, ao lado dele, o índice em JSON (pequeno)
+            tamanhos.append(sum(os.path.getsize(c) for c in caminhos_locais_devolucaoAR_originais if os.path.exists(c)))
+            tamanhos.append(0)
+        bloco = None if transferencias_async.async_habilitado() else gdrive_uploader.get_tamanho_bloco_upload()
+        estimativa = orcamento.estimar(tamanhos, dono=bool(perfil.novo_dono), bloco=bloco)
+        restante = orcamento.restante()
+        logger.info(f"📊 Chamadas ao Drive: {orcamento.usadas} até aqui, ~{estimativa['chamadas']} previstas para "
+                    f"{estimativa['arquivos']} envio(s)" + (f" (orçamento restante: {restante})" if restante is not None else ""))
+        if restante is not None and estimativa["chamadas"] > restante:
+            logger.warning(f"⚠️  Orçamento de chamadas ao Drive não comporta todos os envios: cerca de "
+                           f"{(estimativa['chamadas'] - restante) // estimativa['por_arquivo']} serão adiados")
+
+        resultados_faixas = {}
+        if faixas:
+            resultados_faixas, resumo_faixas = enviar_faixas(
+                drive_service, drive_credentials, faixas, journal, envio, registro_integridade, rastreador,
+                autoajuste=autoajuste, orcamento=orcamento, indice_ar=indice_ar
+            )
+            resultado["detalhes"]["faixas_upload"] = resumo_faixas
+            for faixa, r in resumo_faixas.items():
+                logger.info(f"Faixa '{faixa}': {r['concluidos']}/{r['arquivos']} enviado(s); primeiro em "
+                            f"{r['tempo_primeiro_arquivo_s']}s, último em {r['tempo_ultimo_arquivo_s']}s")
+            if mapa_pastas:
+                # Faixa inteira falhou: a subpasta em cache pode ter sido apagada no Drive
+                for faixa, (sucesso, falha) in resultados_faixas.items():
+                    if sucesso == 0 and falha > 0:
+                        mapa_pastas.conferir(drive_service, pastas_configuradas()[faixa], resumo_subpastas["subpasta"])
+                mapa_pastas.salvar()
 
+        if arquivos_para_upload_principal:
+            sucesso, falha = resultados_faixas["principal"]
             logger.info(f"Uploads de PDFs finais: {sucesso} sucesso(s), {falha} falha(s)")
             resultado["detalhes"]["upload_pdfs"] = {"sucesso": sucesso, "falha": falha}
 
@@ -246,28 +747,15 @@ def processar_files_to_drive():
             resultado["etapas"]["upload_pdfs_finais"] = True
             resultado["detalhes"]["upload_pdfs"] = {"sucesso": 0, "falha": 0}
 
-        # ✅ FASE 2.2: Upload dos ARQUIVOS DEVOLUCAOAR ORIGINAIS
-        if caminhos_locais_devolucaoAR_originais:
-            logger.info(f"\n--- Fase 2.2: Upload de {len(caminhos_locais_devolucaoAR_originais)} ARQUIVOS DEVOLUCAOAR ORIGINAIS ---")
-            sucesso_dev = 0
-            falha_dev = 0
-
-            for arq_dev_path in caminhos_locais_devolucaoAR_originais:
-                try:
-                    if os.path.exists(arq_dev_path):
-                        if gdrive_uploader.upload_file_to_folder(drive_service, arq_dev_path, TARGET_DRIVE_FOLDER_ID_DEVOLUCAOAR_ARCHIVE):
-                            sucesso_dev += 1
-                            logger.info(f"✓ Upload DevolucaoAR: {os.path.basename(arq_dev_path)}")
-                        else:
-                            falha_dev += 1
-                            logger.error(f"✗ Falha upload DevolucaoAR: {os.path.basename(arq_dev_path)}")
-                    else:
-                        logger.warning(f"Arquivo DevolucaoAR original '{arq_dev_path}' não encontrado")
-                        falha_dev += 1
-                except Exception as e:
-                    logger.error(f"Erro no upload DevolucaoAR {arq_dev_path}: {e}")
-                    falha_dev += 1
-
+        if usar_bundle:
+            logger.info(f"\n--- Fase 2.2: Bundle de {len(caminhos_locais_devolucaoAR_originais)} ARQUIVOS DEVOLUCAOAR ORIGINAIS ---")
+            resultado["detalhes"]["upload_devolucaoAR"] = enviar_bundle_devolucaoar(
+                drive_service, caminhos_locais_devolucaoAR_originais, journal, envio, registro_integridade, rastreador,
+                pasta_id=destinos["devolucaoar"], orcamento=orcamento, indice_ar=indice_ar
+            )
+            resultado["etapas"]["upload_arquivos_devolucaoAR"] = True
+        elif caminhos_locais_devolucaoAR_originais:
+            sucesso_dev, falha_dev = resultados_faixas["devolucaoar"]
             logger.info(f"Uploads de arquivos DevolucaoAR: {sucesso_dev} sucesso(s), {falha_dev} falha(s)")
             resultado["detalhes"]["upload_devolucaoAR"] = {"sucesso": sucesso_dev, "falha": falha_dev}
 
@@ -282,30 +770,42 @@ def processar_files_to_drive():
             resultado["etapas"]["upload_arquivos_devolucaoAR"] = True
             resultado["detalhes"]["upload_devolucaoAR"] = {"sucesso": 0, "falha": 0}
 
-        # ✅ FASE 3: Excluir arquivos do FTP se tudo deu certo
-        if nomes_todos_arquivos_baixados_ftp:
-            logger.info(f"\n--- Fase 3: Exclusão de {len(nomes_todos_arquivos_baixados_ftp)} arquivos do servidor FTP ---")
-            try:
-                ecarta_processor.excluir_arquivos_do_ftp(
-                    HOST_FTP, PORT_FTP, USUARIO_FTP, SENHA_FTP, DIRETORIO_FTP,
-                    nomes_todos_arquivos_baixados_ftp
-                )
-                resultado["etapas"]["exclusao_ftp"] = True
-                resultado["detalhes"]["arquivos_excluidos_ftp"] = len(nomes_todos_arquivos_baixados_ftp)
-                logger.info("✓ Exclusão de arquivos do FTP concluída")
-            except Exception as e:
-                logger.error(f"Erro na exclusão do FTP: {e}")
-                # Não falhar completamente por causa da exclusão
-                resultado["etapas"]["exclusao_ftp"] = False
-                resultado["detalhes"]["erro_exclusao_ftp"] = str(e)
-        else:
-            logger.warning("Lista de arquivos para excluir do FTP está vazia")
-            resultado["etapas"]["exclusao_ftp"] = True
+        resultado["detalhes"]["integridade"] = registro_integridade.resumo()
+        resultado["detalhes"]["dedup"] = envio.resumo()
+        if indice_conteudo:
+            indice_conteudo.salvar()
+        if registro_integridade.divergentes:
+            logger.warning(f"⚠️  {len(registro_integridade.divergentes)} arquivo(s) com MD5 divergente no Drive")
+
+        # ✅ FASE 3: Exclusões no FTP já em andamento desde os uploads; aguardar o término
+        logger.info("\n--- Fase 3: Conclusão da exclusão de arquivos no servidor FTP ---")
+        with tracing.span("exclusao_ftp"):
+            exclusor.aguardar()
+        resumo_exclusao = exclusor.resumo(rastreador.nao_liberados())
+        resultado["detalhes"]["exclusao_ftp"] = resumo_exclusao
+        resultado["detalhes"]["arquivos_excluidos_ftp"] = resumo_exclusao["excluidos"]
+        resultado["detalhes"]["pool_ftp"] = pool.resumo()
+        resultado["etapas"]["exclusao_ftp"] = resumo_exclusao["erros"] == 0
+        if resumo_exclusao["mantidos"] or resumo_exclusao["erros"]:
+            logger.warning(f"⚠️  {resumo_exclusao['mantidos']} arquivo(s) mantido(s) e {resumo_exclusao['erros']} erro(s) de exclusão no FTP")
+        logger.info(f"✓ {resumo_exclusao['excluidos']} arquivo(s) excluído(s) do FTP")
 
         # ✅ Sucesso geral
         resultado["sucesso"] = True
         resultado["mensagem"] = "Processamento concluído com sucesso"
 
+        # Arquivos que ficaram no FTP (falhas/adiados) precisam de nova execução:
+        # salvar o fingerprint faria a pré-verificação ignorá-los
+        ftp_drenado = not (resumo_exclusao["mantidos"] or resumo_exclusao["erros"] or store_staging.adiados
+                           or filtro_listagem.arquivos_remanescentes())
+        if fingerprint_ftp and ftp_drenado:
+            ecarta_processor.salvar_fingerprint(fingerprint_ftp, resultado["detalhes"].get("arquivos_baixados_ftp", 0))
+
+        # Só encerra o diário sem pendências: com falhas, a retomada tenta de novo
+        falhas_upload = resultado["detalhes"]["upload_pdfs"]["falha"] + resultado["detalhes"]["upload_devolucaoAR"]["falha"]
+        if falhas_upload == 0 and resultado["etapas"]["exclusao_ftp"] and not resumo_exclusao["mantidos"]:
+            journal.concluir()
+
         # ✅ Resumo final da limpeza
         if resultado["detalhes"].get("limpeza_drive"):
             total_removidos = resultado["detalhes"]["limpeza_drive"]["total_removidos"]
@@ -318,6 +818,27 @@ def processar_files_to_drive():
         resultado["sucesso"] = False
 
     finally:
+        if exclusor:
+            exclusor.aguardar()
+        if pool:
+            pool.fechar()
+        journal.fechar()
+        if indice_conteudo:
+            indice_conteudo.salvar()
+        resultado["detalhes"]["journal"] = journal.resumo()
+        resultado["detalhes"]["banda"] = banda.relatorio(marcas_banda)
+        if autoajuste:
+            autoajuste.salvar()
+            resultado["detalhes"]["autotune"] = autoajuste.resumo()
+        if orcamento:
+            orcamento.salvar()
+            resultado["detalhes"]["cota_drive"] = orcamento.resumo()
+            logger.info(f"📊 Chamadas ao Drive na execução: {orcamento.contador.total()} {orcamento.contador.resumo()}")
+        if indice_ar:
+            indice_ar.salvar()
+            resultado["detalhes"]["registros"] = indice_ar.resumo()
+            indice_ar.fechar()
+
         # ✅ Limpar ambiente de trabalho
         if work_dir:
             cleanup_work_environment(work_dir)
@@ -328,9 +849,16 @@ def processar_files_to_drive():
 
     return resultado
 
-def main():
-    """Função main para compatibilidade com a API e execução direta"""
-    return processar_files_to_drive()
+def main(config=None):
+    """
+    Função main para compatibilidade com a API e execução direta.
+    config["profile"] escolhe o perfil (origem, credenciais e destinos) da
+    execução; sem ele vale o perfil padrão das variáveis de ambiente.
+    """
+    config = config or {}
+    perfil = perfis.obter(config.get("profile"))
+    with perfis.execucao(perfil):
+        return processar_files_to_drive(retomar=bool(config.get("resume")))
 
 if __name__ == "__main__":
     resultado = main()
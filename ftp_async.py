@@ -0,0 +1,211 @@
+# ftp_async.py
+
+import os
+import re
+import time
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import tracing
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 64 * 1024
+
+class ErroFTP(Exception):
+    """Resposta de erro do servidor FTP (código 4xx/5xx ou inesperado)"""
+
+    def __init__(self, resposta):
+        super().__init__(resposta)
+        self.resposta = resposta
+        self.codigo = resposta[:3]
+
+class ErroPermanenteFTP(ErroFTP):
+    """Resposta 5xx: a sessão continua íntegra (equivale ao error_perm do ftplib)"""
+
+def erro_de_sobrecarga(e):
+    """Erro que indica servidor saturado (421/4xx, conexão recusada ou derrubada)"""
+    if isinstance(e, ErroFTP):
+        return not isinstance(e, ErroPermanenteFTP)
+    return isinstance(e, (ConnectionRefusedError, ConnectionResetError, EOFError))
+
+def _timeout():
+    return float(os.getenv('FTP_ASYNC_TIMEOUT', 60))
+
+class ClienteFTPAsync:
+    """
+    Cliente FTP mínimo sobre asyncio streams: login, CWD, RETR em modo
+    passivo, DELE e NOOP. Uma transferência por vez por sessão, como no FTP.
+    """
+
+    def __init__(self, host, port=21, encoding="utf-8"):
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        self._leitor = None
+        self._escritor = None
+        self._tipo = None
+
+    async def conectar(self, usuario, senha, diretorio=None):
+        self._leitor, self._escritor = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), _timeout()
+        )
+        await self._resposta("2")
+        resposta = await self.comando(f"USER {usuario}", esperado="23")
+        if resposta.startswith("3"):
+            await self.comando(f"PASS {senha}", esperado="2")
+        if diretorio:
+            await self.comando(f"CWD {diretorio}", esperado="2")
+        return self
+
+    async def _linha(self):
+        linha = await asyncio.wait_for(self._leitor.readline(), _timeout())
+        if not linha:
+            raise EOFError("Conexão de controle encerrada pelo servidor")
+        return linha.decode(self.encoding, "replace").rstrip("\r\n")
+
+    async def _resposta(self, esperado=None):
+        """Lê uma resposta (inclusive multilinha 'NNN-...NNN ') e valida o 1º dígito"""
+        linha = await self._linha()
+        resposta = linha
+        if linha[3:4] == "-":
+            codigo = linha[:3]
+            while True:
+                linha = await self._linha()
+                resposta += "\n" + linha
+                if linha[:3] == codigo and linha[3:4] != "-":
+                    break
+        if resposta[:1] in ("4", "5") or (esperado and resposta[:1] not in esperado):
+            raise (ErroPermanenteFTP if resposta[:1] == "5" else ErroFTP)(resposta)
+        return resposta
+
+    async def comando(self, texto, esperado="2"):
+        self._escritor.write((texto + "\r\n").encode(self.encoding))
+        await self._escritor.drain()
+        return await self._resposta(esperado)
+
+    async def _conexao_dados(self):
+        """Abre a conexão de dados em modo passivo (PASV; EPSV em IPv6)"""
+        ipv6 = ":" in self.host
+        if ipv6:
+            resposta = await self.comando("EPSV")
+            porta = int(re.search(r"\(\|\|\|(\d+)\|\)", resposta).group(1))
+        else:
+            resposta = await self.comando("PASV")
+            numeros = [int(n) for n in re.search(r"(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)", resposta).groups()]
+            porta = (numeros[4] << 8) + numeros[5]
+        # Como o ftplib: o endereço anunciado no PASV é ignorado (NAT), usa-se o host de controle
+        return await asyncio.wait_for(asyncio.open_connection(self.host, porta), _timeout())
+
+    async def retr(self, nome, ao_receber, tamanho_bloco=TAMANHO_BLOCO):
+        """Baixa 'nome' entregando cada bloco a ao_receber (corrotina). Retorna bytes recebidos"""
+        if self._tipo != "I":
+            await self.comando("TYPE I")
+            self._tipo = "I"
+        leitor_dados, escritor_dados = await self._conexao_dados()
+        recebidos = 0
+        try:
+            await self.comando(f"RETR {nome}", esperado="1")
+            while True:
+                bloco = await asyncio.wait_for(leitor_dados.read(tamanho_bloco), _timeout())
+                if not bloco:
+                    break
+                recebidos += len(bloco)
+                await ao_receber(bloco)
+        finally:
+            escritor_dados.close()
+            try:
+                await escritor_dados.wait_closed()
+            except OSError:
+                pass
+        await self._resposta("2")
+        return recebidos
+
+    async def dele(self, nome):
+        return await self.comando(f"DELE {nome}")
+
+    async def noop(self):
+        return await self.comando("NOOP")
+
+    async def encerrar(self):
+        if self._escritor is None:
+            return
+        try:
+            await asyncio.wait_for(self.comando("QUIT"), 5)
+        except Exception:
+            pass
+        self.fechar()
+
+    def fechar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+
+class PoolFTPAsync:
+    """
+    Equivalente assíncrono do PoolFTP: até 'tamanho' sessões autenticadas
+    (FTP_POOL_SIZE), reaproveitadas entre transferências. Sessões ociosas há
+    mais de FTP_POOL_IDLE_CHECK segundos são testadas com NOOP; sessões com
+    erro que não seja 5xx são descartadas.
+    """
+
+    def __init__(self, host, port, usuario, senha, diretorio, tamanho=None, ocioso_max=None):
+        import ftp_pool
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.senha = senha
+        self.diretorio = diretorio
+        self.tamanho = tamanho or ftp_pool.get_tamanho_pool()
+        self.ocioso_max = float(ocioso_max if ocioso_max is not None else os.getenv('FTP_POOL_IDLE_CHECK', 15))
+        self._livres = []
+        self._vagas = asyncio.BoundedSemaphore(self.tamanho)
+        self.conexoes_abertas = 0
+        self.reutilizacoes = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.fechar()
+
+    async def _obter(self):
+        while self._livres:
+            cliente, ultimo_uso = self._livres.pop()
+            if time.monotonic() - ultimo_uso < self.ocioso_max:
+                self.reutilizacoes += 1
+                return cliente
+            try:
+                await cliente.noop()
+                self.reutilizacoes += 1
+                return cliente
+            except Exception:
+                cliente.fechar()
+        with tracing.span("ftp.connect", host=self.host, diretorio=self.diretorio, modo="async"):
+            cliente = await ClienteFTPAsync(self.host, self.port).conectar(self.usuario, self.senha, self.diretorio)
+        self.conexoes_abertas += 1
+        logger.debug("Nova sessão FTP assíncrona aberta (%d no total)", self.conexoes_abertas)
+        return cliente
+
+    @asynccontextmanager
+    async def sessao(self):
+        async with self._vagas:
+            cliente = await self._obter()
+            try:
+                yield cliente
+            except BaseException as e:
+                if not isinstance(e, ErroPermanenteFTP):
+                    cliente.fechar()
+                    cliente = None
+                raise
+            finally:
+                if cliente is not None:
+                    self._livres.append((cliente, time.monotonic()))
+
+    async def fechar(self):
+        livres, self._livres = self._livres, []
+        await asyncio.gather(*(cliente.encerrar() for cliente, _ in livres), return_exceptions=True)
+
+    def resumo(self):
+        return {"conexoes_abertas": self.conexoes_abertas, "reutilizacoes": self.reutilizacoes}
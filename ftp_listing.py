@@ -0,0 +1,173 @@
+# ftp_listing.py
+
+import os
+import time
+import heapq
+import itertools
+import fnmatch
+import calendar
+from ftplib import error_perm
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def _lista_env(nome, padrao=""):
+    return [p.strip() for p in os.getenv(nome, padrao).split(",") if p.strip()]
+
+def _int_env(nome, padrao=0):
+    valor = os.getenv(nome)
+    return int(valor) if valor not in (None, "") else padrao
+
+def parse_modify(valor):
+    """Converte o fato 'modify' do MLSD (YYYYMMDDHHMMSS[.sss], UTC) em epoch"""
+    if not valor:
+        return None
+    try:
+        return calendar.timegm(time.strptime(valor[:14], "%Y%m%d%H%M%S"))
+    except ValueError:
+        return None
+
+def iterar_mlsd(ftp, facts=("type", "size", "modify")):
+    """
+    Lê a resposta do MLSD linha a linha direto da conexão de dados, sem
+    acumular a listagem inteira (ftplib.mlsd guarda todas as linhas antes).
+    Gera (nome, fatos).
+    """
+    if facts:
+        try:
+            ftp.sendcmd("OPTS MLST " + ";".join(facts) + ";")
+        except error_perm:
+            pass
+    ftp.sendcmd("TYPE A")
+    conn = ftp.transfercmd("MLSD")
+    try:
+        with conn, conn.makefile("r", encoding=ftp.encoding) as fp:
+            for linha in fp:
+                linha = linha.rstrip("\r\n")
+                if not linha:
+                    continue
+                fatos_txt, _, nome = linha.partition(" ")
+                fatos = {}
+                for fato in fatos_txt[:-1].split(";"):
+                    chave, _, valor = fato.partition("=")
+                    fatos[chave.lower()] = valor
+                yield nome, fatos
+    finally:
+        try:
+            ftp.voidresp()
+        except Exception as e:
+            logger.debug("Resposta final do MLSD: %s", e)
+
+class FiltroListagem:
+    """
+    Filtros e limites de lote aplicados à listagem do FTP:
+
+        FTP_INCLUDE_GLOBS      globs aceitos (padrão: "*")
+        FTP_EXCLUDE_GLOBS      globs ignorados
+        FTP_MIN_AGE_SECONDS    idade mínima (evita arquivos ainda em upload)
+        FTP_MIN_SIZE/MAX_SIZE  limites de tamanho em bytes (0 = sem limite)
+        FTP_MAX_FILES_PER_RUN  máximo de arquivos por execução (0 = sem limite)
+        FTP_MAX_BYTES_PER_RUN  máximo de bytes por execução (0 = sem limite)
+
+    A seleção é feita do mais antigo para o mais novo; o resumo da última
+    seleção fica em resumo().
+    """
+
+    def __init__(self, incluir=None, excluir=None, idade_minima=0, tamanho_minimo=0,
+                 tamanho_maximo=0, max_arquivos=0, max_bytes=0):
+        self.incluir = [g.lower() for g in (incluir or ["*"])]
+        self.excluir = [g.lower() for g in (excluir or [])]
+        self.idade_minima = idade_minima
+        self.tamanho_minimo = tamanho_minimo
+        self.tamanho_maximo = tamanho_maximo
+        self.max_arquivos = max_arquivos
+        self.max_bytes = max_bytes
+        self._contagem = {}
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(
+            incluir=_lista_env('FTP_INCLUDE_GLOBS', "*"),
+            excluir=_lista_env('FTP_EXCLUDE_GLOBS'),
+            idade_minima=_int_env('FTP_MIN_AGE_SECONDS'),
+            tamanho_minimo=_int_env('FTP_MIN_SIZE'),
+            tamanho_maximo=_int_env('FTP_MAX_SIZE'),
+            max_arquivos=_int_env('FTP_MAX_FILES_PER_RUN'),
+            max_bytes=_int_env('FTP_MAX_BYTES_PER_RUN'),
+        )
+
+    def _motivo_rejeicao(self, nome, tamanho, modificacao, agora):
+        nome_min = nome.lower()
+        if not any(fnmatch.fnmatchcase(nome_min, g) for g in self.incluir) or \
+           any(fnmatch.fnmatchcase(nome_min, g) for g in self.excluir):
+            return "ignorados_glob"
+        if self.idade_minima and modificacao is not None and agora - modificacao < self.idade_minima:
+            return "recentes"
+        if tamanho is not None and (tamanho < self.tamanho_minimo or (self.tamanho_maximo and tamanho > self.tamanho_maximo)):
+            return "fora_do_tamanho"
+        return None
+
+    def selecionar(self, ftp):
+        """
+        Lista o diretório atual em streaming e retorna os arquivos do lote:
+        lista de dicts {nome, tamanho, modificacao}, mais antigos primeiro.
+        Sem MLSD, cai para NLST (só os globs e os limites de quantidade valem).
+        """
+        contagem = {"listados": 0, "ignorados_glob": 0, "recentes": 0, "fora_do_tamanho": 0,
+                    "selecionados": 0, "adiados_lote": 0, "bytes_selecionados": 0}
+        agora = time.time()
+        candidatos = []  # heap (-modificacao, ordem, entrada) limitado a max_arquivos
+        ordem = 0
+
+        fonte = (
+            (nome, int(fatos["size"]) if fatos.get("size", "").isdigit() else None, parse_modify(fatos.get("modify")))
+            for nome, fatos in iterar_mlsd(ftp) if fatos.get("type", "file") == "file"
+        )
+        try:
+            # O erro de MLSD não suportado só aparece na primeira leitura
+            primeiras = [next(fonte)]
+        except StopIteration:
+            primeiras = []
+        except error_perm:
+            logger.info("Servidor sem MLSD: usando NLST (sem filtros de idade/tamanho)")
+            primeiras, fonte = [], ((nome, None, None) for nome in ftp.nlst())
+
+        for nome, tamanho, modificacao in itertools.chain(primeiras, fonte):
+            contagem["listados"] += 1
+            motivo = self._motivo_rejeicao(nome, tamanho, modificacao, agora)
+            if motivo:
+                contagem[motivo] += 1
+                continue
+            ordem += 1
+            entrada = {"nome": nome, "tamanho": tamanho, "modificacao": modificacao}
+            chave = -(modificacao if modificacao is not None else float("inf"))
+            if self.max_arquivos and len(candidatos) >= self.max_arquivos:
+                # Mantém só os max_arquivos mais antigos
+                if chave > candidatos[0][0]:
+                    heapq.heapreplace(candidatos, (chave, ordem, entrada))
+                contagem["adiados_lote"] += 1
+            else:
+                heapq.heappush(candidatos, (chave, ordem, entrada))
+
+        ordenados = [e for _, _, e in sorted(candidatos, key=lambda c: (-c[0], c[1]))]
+        selecionados = []
+        for indice, entrada in enumerate(ordenados):
+            tamanho = entrada["tamanho"] or 0
+            # Sempre aceita ao menos um arquivo, mesmo maior que o limite
+            if self.max_bytes and selecionados and contagem["bytes_selecionados"] + tamanho > self.max_bytes:
+                contagem["adiados_lote"] += len(ordenados) - indice
+                break
+            selecionados.append(entrada)
+            contagem["bytes_selecionados"] += tamanho
+
+        contagem["selecionados"] = len(selecionados)
+        self._contagem = contagem
+        return selecionados
+
+    def resumo(self):
+        return dict(self._contagem)
+
+    def arquivos_remanescentes(self):
+        """Arquivos elegíveis que ficaram no FTP (recentes ou além do lote)"""
+        return self._contagem.get("recentes", 0) + self._contagem.get("adiados_lote", 0)
@@ -0,0 +1,109 @@
+# ftp_pool.py
+
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from ftplib import FTP, error_perm
+import logging
+import tracing
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def get_tamanho_pool():
+    """Máximo de conexões FTP simultâneas (FTP_POOL_SIZE)"""
+    return max(1, int(os.getenv('FTP_POOL_SIZE', 4)))
+
+class PoolFTP:
+    """
+    Pool de sessões FTP já autenticadas e posicionadas no diretório remoto.
+    Sessões ociosas são testadas com NOOP antes de reutilizar; sessões com
+    erro são descartadas e recriadas sob demanda.
+    """
+
+    def __init__(self, host, port, usuario, senha, diretorio, tamanho=None, ocioso_max=None):
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.senha = senha
+        self.diretorio = diretorio
+        self.tamanho = tamanho or get_tamanho_pool()
+        self.ocioso_max = float(ocioso_max if ocioso_max is not None else os.getenv('FTP_POOL_IDLE_CHECK', 15))
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(self.tamanho)
+        self._lock = threading.Lock()
+        self.conexoes_abertas = 0
+        self.reutilizacoes = 0
+        self._fechado = False
+
+    def _conectar(self):
+        with tracing.span("ftp.connect", host=self.host, diretorio=self.diretorio):
+            ftp = FTP()
+            ftp.connect(self.host, self.port)
+            ftp.login(self.usuario, self.senha)
+            ftp.cwd(self.diretorio)
+        with self._lock:
+            self.conexoes_abertas += 1
+        logger.debug("Nova sessão FTP aberta (%d no total)", self.conexoes_abertas)
+        return ftp
+
+    def _obter(self):
+        while True:
+            try:
+                ftp, ultimo_uso = self._livres.get_nowait()
+            except queue.Empty:
+                return self._conectar()
+            if time.monotonic() - ultimo_uso < self.ocioso_max:
+                break
+            try:
+                ftp.voidcmd("NOOP")
+                break
+            except Exception:
+                self._encerrar(ftp)
+        with self._lock:
+            self.reutilizacoes += 1
+        return ftp
+
+    @staticmethod
+    def _encerrar(ftp):
+        try:
+            ftp.quit()
+        except Exception:
+            ftp.close()
+
+    @contextmanager
+    def sessao(self):
+        """Empresta uma sessão; bloqueia se todas as FTP_POOL_SIZE estiverem em uso"""
+        self._vagas.acquire()
+        ftp = None
+        try:
+            ftp = self._obter()
+            yield ftp
+        except Exception as e:
+            # Resposta 5xx mantém a sessão íntegra; outros erros deixam o estado
+            # incerto e a sessão não volta ao pool
+            if ftp is not None and not isinstance(e, error_perm):
+                self._encerrar(ftp)
+                ftp = None
+            raise
+        finally:
+            if ftp is not None:
+                if self._fechado:
+                    self._encerrar(ftp)
+                else:
+                    self._livres.put((ftp, time.monotonic()))
+            self._vagas.release()
+
+    def fechar(self):
+        self._fechado = True
+        while True:
+            try:
+                ftp, _ = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            self._encerrar(ftp)
+
+    def resumo(self):
+        return {"conexoes_abertas": self.conexoes_abertas, "reutilizacoes": self.reutilizacoes}
@@ -0,0 +1,196 @@
+# indice_registros.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def registros_habilitado():
+    """Índice local dos registros DevolucaoAR (RECORDS_INDEX, padrão ligado)"""
+    return os.getenv('RECORDS_INDEX', 'true').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+def _fts5_disponivel(conexao):
+    try:
+        conexao.execute("CREATE VIRTUAL TABLE temp._teste_fts USING fts5(texto)")
+        conexao.execute("DROP TABLE temp._teste_fts")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def _consulta_fts(texto):
+    """Termos livres -> consulta FTS5 (cada termo entre aspas, prefixo no último)"""
+    termos = ['"' + t.replace('"', '""') + '"' for t in texto.split()]
+    termos[-1] += "*"
+    return " ".join(termos)
+
+class IndiceRegistros:
+    """
+    Registros das linhas dos manifestos DevolucaoAR.txt (todos os campos,
+    código AR no 4º e PDF original no 7º) num SQLite local com busca
+    textual (FTS5; sem ele, LIKE), ligados ao ID do PDF no Drive e ao do
+    ZIP original arquivado (ou do bundle). Consultas não tocam o Drive.
+
+    Tabela 'registros': um registro por (zip_ftp, arquivo), atualizado se o
+    mesmo ZIP for reprocessado. Os vínculos com o Drive ficam em memória
+    até salvar() (uma transação por execução).
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.fts = False
+        self.contagem = {"registrados": 0, "vinculados_drive": 0, "vinculados_origem": 0}
+        self._conexao = None
+        self._lock = threading.Lock()
+        self._vinculos = []
+        self._vinculos_origem = []
+
+    def abrir(self):
+        Path(os.path.dirname(self.caminho)).mkdir(parents=True, exist_ok=True)
+        self._conexao = sqlite3.connect(self.caminho, check_same_thread=False, timeout=30)
+        self._conexao.row_factory = sqlite3.Row
+        with self._lock, self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS registros (
+                    id INTEGER PRIMARY KEY,
+                    codigo_ar TEXT,
+                    arquivo TEXT NOT NULL,
+                    arquivo_original TEXT,
+                    campos TEXT NOT NULL,
+                    zip_ftp TEXT NOT NULL,
+                    run_id TEXT,
+                    drive_id TEXT,
+                    md5 TEXT,
+                    origem_drive_id TEXT,
+                    ts REAL,
+                    UNIQUE (zip_ftp, arquivo)
+                )""")
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS registros_codigo ON registros (codigo_ar)")
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS registros_arquivo ON registros (arquivo)")
+            self.fts = _fts5_disponivel(self._conexao)
+            if self.fts:
+                self._conexao.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS registros_fts USING fts5(campos, content='registros', content_rowid='id')")
+                # Índice textual mantido pelo SQLite a partir da tabela
+                self._conexao.executescript("""
+                    CREATE TRIGGER IF NOT EXISTS registros_ai AFTER INSERT ON registros BEGIN
+                        INSERT INTO registros_fts (rowid, campos) VALUES (new.id, new.campos);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS registros_ad AFTER DELETE ON registros BEGIN
+                        INSERT INTO registros_fts (registros_fts, rowid, campos) VALUES ('delete', old.id, old.campos);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS registros_au AFTER UPDATE OF campos ON registros BEGIN
+                        INSERT INTO registros_fts (registros_fts, rowid, campos) VALUES ('delete', old.id, old.campos);
+                        INSERT INTO registros_fts (rowid, campos) VALUES (new.id, new.campos);
+                    END;""")
+            else:
+                logger.warning("SQLite sem FTS5: busca de registros por LIKE")
+        return self
+
+    def fechar(self):
+        if self._conexao is not None:
+            self._conexao.close()
+            self._conexao = None
+
+    def registrar_manifesto(self, registros, zip_ftp, run_id=None):
+        """
+        Grava as linhas de um manifesto já aplicadas: 'registros' é uma lista
+        de (campos, arquivo) com os campos da linha e o nome final do PDF.
+        """
+        if not registros:
+            return
+        agora = time.time()
+        linhas = [
+            (campos[3].strip(), arquivo, campos[6].strip(), json.dumps([c.strip() for c in campos], ensure_ascii=False),
+             zip_ftp, run_id, agora)
+            for campos, arquivo in registros
+        ]
+        with self._lock, self._conexao:
+            self._conexao.executemany("""
+                INSERT INTO registros (codigo_ar, arquivo, arquivo_original, campos, zip_ftp, run_id, ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (zip_ftp, arquivo) DO UPDATE SET
+                    codigo_ar = excluded.codigo_ar, arquivo_original = excluded.arquivo_original,
+                    campos = excluded.campos, run_id = excluded.run_id, ts = excluded.ts""", linhas)
+        self.contagem["registrados"] += len(linhas)
+
+    def vincular(self, arquivo, drive_id, md5=None):
+        """PDF final 'arquivo' enviado ao Drive (aplicado em salvar(); thread-safe)"""
+        with self._lock:
+            self._vinculos.append((drive_id, md5, arquivo))
+
+    def vincular_origem(self, zip_ftp, drive_id):
+        """ZIP original (ou o bundle que o contém) arquivado no Drive"""
+        with self._lock:
+            self._vinculos_origem.append((drive_id, zip_ftp))
+
+    def salvar(self):
+        """Aplica os vínculos pendentes numa transação"""
+        with self._lock:
+            vinculos, self._vinculos = self._vinculos, []
+            vinculos_origem, self._vinculos_origem = self._vinculos_origem, []
+            if not (vinculos or vinculos_origem) or self._conexao is None:
+                return
+            try:
+                with self._conexao:
+                    # O mesmo nome de PDF pode vir em lotes diferentes: vale o registro mais recente
+                    self._conexao.executemany("""
+                        UPDATE registros SET drive_id = ?, md5 = ?
+                        WHERE id = (SELECT max(id) FROM registros WHERE arquivo = ?)""", vinculos)
+                    self._conexao.executemany(
+                        "UPDATE registros SET origem_drive_id = ? WHERE zip_ftp = ?", vinculos_origem)
+                self.contagem["vinculados_drive"] += len(vinculos)
+                self.contagem["vinculados_origem"] += len(vinculos_origem)
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao gravar vínculos do índice de registros: {e}")
+
+    def buscar(self, texto=None, codigo_ar=None, drive_id=None, limite=50):
+        """
+        Registros por código AR exato, ID do Drive ou texto livre em
+        qualquer campo (termos combinados com E, prefixo no último).
+        """
+        condicoes, parametros = [], []
+        juncao = ""
+        ordem = "r.id DESC"
+        if codigo_ar:
+            condicoes.append("r.codigo_ar = ?")
+            parametros.append(codigo_ar.strip())
+        if drive_id:
+            condicoes.append("(r.drive_id = ? OR r.origem_drive_id = ?)")
+            parametros += [drive_id, drive_id]
+        if texto and texto.strip():
+            if self.fts:
+                juncao = "JOIN registros_fts f ON f.rowid = r.id"
+                condicoes.append("registros_fts MATCH ?")
+                parametros.append(_consulta_fts(texto))
+                ordem = "f.rank, r.id DESC"
+            else:
+                for termo in texto.split():
+                    condicoes.append("r.campos LIKE ?")
+                    parametros.append(f"%{termo}%")
+        sql = (f"SELECT r.* FROM registros r {juncao}"
+               + (f" WHERE {' AND '.join(condicoes)}" if condicoes else "")
+               + f" ORDER BY {ordem} LIMIT ?")
+        parametros.append(max(1, min(int(limite), 1000)))
+        with self._lock:
+            linhas = self._conexao.execute(sql, parametros).fetchall()
+        return [self._como_dict(l) for l in linhas]
+
+    @staticmethod
+    def _como_dict(linha):
+        registro = dict(linha)
+        registro["campos"] = json.loads(registro["campos"])
+        return registro
+
+    def total(self):
+        with self._lock:
+            return self._conexao.execute("SELECT count(*) FROM registros").fetchone()[0]
+
+    def resumo(self):
+        return {**self.contagem, "fts": self.fts}
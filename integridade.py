@@ -0,0 +1,84 @@
+# integridade.py
+
+import os
+import hashlib
+import threading
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class HashEmFluxo:
+    """
+    Calcula o MD5 enquanto os blocos passam (callback do retrbinary ou
+    cópia de membro do ZIP), sem reler o arquivo depois.
+    """
+
+    def __init__(self, destino=None):
+        self.destino = destino
+        self._md5 = hashlib.md5()
+        self.tamanho = 0
+
+    def write(self, bloco):
+        self._md5.update(bloco)
+        self.tamanho += len(bloco)
+        if self.destino is not None:
+            self.destino.write(bloco)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+class RegistroIntegridade:
+    """
+    Guarda o MD5 esperado de cada arquivo local (calculado em fluxo) e o
+    compara com o md5Checksum devolvido pelo Drive no próprio upload.
+    """
+
+    def __init__(self):
+        self.esperados = {}
+        self.verificados = 0
+        self.sem_digest = 0
+        self.divergentes = []
+        self._lock = threading.Lock()
+
+    def esperar(self, caminho_local, md5, origem=None):
+        """Registra o MD5 esperado para um arquivo local"""
+        if md5:
+            with self._lock:
+                self.esperados[os.path.abspath(caminho_local)] = {"md5": md5, "origem": origem}
+
+    def md5_esperado(self, caminho_local):
+        with self._lock:
+            esperado = self.esperados.get(os.path.abspath(caminho_local))
+        return esperado["md5"] if esperado else None
+
+    def verificar(self, caminho_local, md5_drive, drive_id=None):
+        """
+        Compara o digest esperado com o do Drive. Retorna True (confere),
+        False (diverge) ou None (sem digest para comparar).
+        """
+        with self._lock:
+            esperado = self.esperados.get(os.path.abspath(caminho_local))
+            if not esperado or not md5_drive:
+                self.sem_digest += 1
+                return None
+            if esperado["md5"] == md5_drive:
+                self.verificados += 1
+                return True
+            self.divergentes.append({
+                "arquivo": os.path.basename(caminho_local),
+                "origem": esperado["origem"],
+                "md5_esperado": esperado["md5"],
+                "md5_drive": md5_drive,
+                "drive_id": drive_id
+            })
+        logger.error("✗ Integridade: '%s' no Drive difere do original (esperado %s, Drive %s)",
+                     os.path.basename(caminho_local), esperado["md5"], md5_drive)
+        return False
+
+    def resumo(self):
+        return {
+            "verificados": self.verificados,
+            "sem_digest": self.sem_digest,
+            "divergentes": list(self.divergentes)
+        }
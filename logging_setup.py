@@ -0,0 +1,114 @@
+# logging_setup.py
+
+import os
+import time
+import queue
+import atexit
+import threading
+import logging
+import logging.handlers
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+def _env_bool(nome, padrao=False):
+    valor = os.getenv(nome)
+    if valor is None:
+        return padrao
+    return valor.strip().lower() in ("1", "true", "sim", "yes", "on")
+
+def modo_agregado():
+    """Se True, os loops por arquivo emitem resumos periódicos em vez de uma linha por arquivo"""
+    return _env_bool('LOG_AGGREGATE', False)
+
+def nivel_por_arquivo():
+    """Nível usado nas mensagens por arquivo: DEBUG no modo agregado, INFO caso contrário"""
+    return logging.DEBUG if modo_agregado() else logging.INFO
+
+def configurar_logging():
+    """
+    Configura o logging da aplicação com QueueHandler: as threads de trabalho
+    apenas enfileiram o registro e uma thread de fundo formata e escreve.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    nivel = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+
+    handler_saida = logging.StreamHandler()
+    handler_saida.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    fila = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(fila))
+    root.setLevel(nivel)
+
+    _listener = logging.handlers.QueueListener(fila, handler_saida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(parar_logging)
+    return _listener
+
+def parar_logging():
+    """Esvazia a fila e encerra a thread de escrita dos logs"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class AgregadorEtapa:
+    """
+    Contabiliza arquivos, bytes e erros de uma etapa e emite um resumo a cada
+    LOG_ROLLUP_INTERVAL segundos (e um resumo final ao encerrar).
+    O detalhe por arquivo continua disponível em DEBUG.
+    """
+
+    def __init__(self, etapa, logger_destino=None, intervalo=None):
+        self.etapa = etapa
+        self.logger = logger_destino or logger
+        self.intervalo = float(intervalo if intervalo is not None else os.getenv('LOG_ROLLUP_INTERVAL', 10))
+        self.ativo = modo_agregado()
+        self.arquivos = 0
+        self.bytes = 0
+        self.erros = 0
+        self._inicio = time.perf_counter()
+        self._ultimo_resumo = self._inicio
+        self._lock = threading.Lock()
+
+    def registrar(self, bytes_arquivo=0, erro=False):
+        """Contabiliza um arquivo processado pela etapa"""
+        with self._lock:
+            self.arquivos += 1
+            self.bytes += bytes_arquivo or 0
+            if erro:
+                self.erros += 1
+            agora = time.perf_counter()
+            emitir = self.ativo and agora - self._ultimo_resumo >= self.intervalo
+            if emitir:
+                self._ultimo_resumo = agora
+        if emitir:
+            self._emitir_resumo("parcial")
+
+    def _emitir_resumo(self, tipo):
+        decorrido = time.perf_counter() - self._inicio
+        self.logger.info(
+            "[%s] resumo %s: %d arquivo(s), %d bytes, %d erro(s) em %.1fs",
+            self.etapa, tipo, self.arquivos, self.bytes, self.erros, decorrido
+        )
+
+    def resumo(self):
+        return {"arquivos": self.arquivos, "bytes": self.bytes, "erros": self.erros}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.ativo and self.arquivos:
+            self._emitir_resumo("final")
+        return False
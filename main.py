@@ -1,34 +1,114 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 import os
+import sys
 import time
+import uuid
 import asyncio
 import logging
 import traceback
-from typing import Optional
+from typing import Optional, Union
 from concurrent.futures import ThreadPoolExecutor
 import tempfile
 import shutil
+from functools import partial
+from contextlib import asynccontextmanager
 
-# Importe seus módulos existentes
-from files_to_drive import main as files_to_drive_main
-from ecarta_processor import main as ecarta_processor_main
+# ✅ .env só no desenvolvimento local: em produção (Vercel) as variáveis já vêm do ambiente
+if os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")):
+    from dotenv import load_dotenv
+    load_dotenv()
 
-app = FastAPI(title="FTP to Drive API", version="1.0.0")
+# Importe seus módulos existentes (só os leves: files_to_drive e ecarta_processor,
+# que trazem googleapiclient/google-auth, são carregados na primeira execução)
+import tracing
+import logging_setup
+import profiling
+import scheduler
+import banda
+import cota_drive
+import indice_registros
+import perfis
+import transferencias_async
 
-# ✅ Configurar logging mais detalhado
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+agendador = None
+tarefa_pre_aquecimento = None
+indices_consulta = {}  # conexões de leitura do índice de registros, por arquivo (abertas na primeira consulta)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Inicia o agendador interno (se habilitado) junto com a aplicação e, no
+    encerramento, para o loop das transferências assíncronas (ASYNC_TRANSFERS)
+    """
+    global agendador, tarefa_pre_aquecimento
+    if scheduler.scheduler_habilitado():
+        agendador = scheduler.AgendadorAdaptativo(disparo_agendado)
+        agendador.iniciar()
+    if pre_aquecimento_habilitado():
+        # Depois de a aplicação já responder: o cold start não espera por isso
+        tarefa_pre_aquecimento = asyncio.get_running_loop().run_in_executor(None, pre_aquecer)
+    yield
+    if agendador is not None:
+        await agendador.parar()
+    transferencias_async.encerrar()
+    for indice in indices_consulta.values():
+        indice.fechar()
+
+app = FastAPI(title="FTP to Drive API", version="1.0.0", lifespan=lifespan)
+
+# ✅ Configurar logging mais detalhado (escrita em thread de fundo via fila)
+logging_setup.configurar_logging()
 logger = logging.getLogger(__name__)
 
-# ✅ Executor para tarefas síncronas
-executor = ThreadPoolExecutor(max_workers=2)
+MODULOS_FLUXO = ("files_to_drive", "ecarta_processor")
+
+def pre_aquecimento_habilitado():
+    """Carrega os módulos do fluxo em segundo plano logo após a inicialização (PREWARM, padrão desligado)"""
+    return os.getenv('PREWARM', 'false').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+def fluxo_carregado():
+    return all(nome in sys.modules for nome in MODULOS_FLUXO)
+
+def pre_aquecer():
+    """Importa os módulos do fluxo (e as dependências do Google) antes da primeira execução"""
+    inicio = time.perf_counter()
+    try:
+        import files_to_drive  # noqa: F401
+        import ecarta_processor  # noqa: F401
+    except Exception as e:
+        logger.warning(f"Pré-aquecimento falhou (os módulos serão carregados na primeira execução): {e}")
+        return None
+    duracao = round(time.perf_counter() - inicio, 3)
+    logger.info(f"🔥 Pré-aquecimento concluído em {duracao}s")
+    return duracao
+
+def files_to_drive_main(config=None):
+    """files_to_drive.main, importado só quando uma execução começa"""
+    with tracing.span("carregar_modulos", carregados=fluxo_carregado()):
+        from files_to_drive import main
+    return main(config)
+
+def ecarta_processor_main(config=None):
+    """ecarta_processor.main, importado só quando uma execução começa"""
+    with tracing.span("carregar_modulos", carregados=fluxo_carregado()):
+        from ecarta_processor import main
+    return main(config)
+
+# ✅ Executor para tarefas síncronas (execuções de perfis diferentes rodam em paralelo)
+executor = ThreadPoolExecutor(max_workers=int(os.getenv('MAX_CONCURRENT_RUNS', 2)))
 
 class ProcessRequest(BaseModel):
     process_type: str  # "files_to_drive" ou "ecarta_processor"
-    config: Optional[dict] = None
+    config: Optional[dict] = None  # ex.: {"profiler": "cprofile" | "sampling", "resume": true, "profile": "cliente_a"}
+
+class BandwidthUpdate(BaseModel):
+    # bytes/s, aceita sufixos K/M/G (ex.: "5M"); 0 = sem limite
+    ftp: Optional[Union[int, str]] = None
+    drive: Optional[Union[int, str]] = None
+    ftp_burst: Optional[Union[int, str]] = None
+    drive_burst: Optional[Union[int, str]] = None
 
 class ProcessResponse(BaseModel):
     status: str
@@ -39,6 +119,11 @@ class ProcessResponse(BaseModel):
 # ✅ Variável global para armazenar status das tarefas
 task_status = {}
 
+def novo_task_id(process_type, perfil=None):
+    """ID da tarefa: tipo, perfil (fora o padrão), horário e sufixo aleatório (requisições no mesmo segundo não colidem)"""
+    sufixo_perfil = "" if perfil is None or perfil.padrao else f"_{perfil.nome}"
+    return f"{process_type}{sufixo_perfil}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
 @app.get("/")
 async def root():
     return {
@@ -69,7 +154,8 @@ async def health_check():
             "temp_dir": temp_dir,
             "temp_writable": temp_writable,
             "environment_vars": env_vars,
-            "active_tasks": len(task_status)
+            "active_tasks": len(task_status),
+            "fluxo_carregado": fluxo_carregado()
         }
     except Exception as e:
         logger.error(f"Erro no health check: {e}")
@@ -90,54 +176,124 @@ async def get_task_status(task_id: str):
         raise HTTPException(status_code=404, detail="Tarefa não encontrada")
     return {"task_id": task_id, "status": task_status[task_id]}
 
+@app.get("/tasks/{task_id}/trace")
+async def get_task_trace(task_id: str):
+    """Retorna a árvore de spans e o caminho crítico de uma tarefa"""
+    loop = asyncio.get_event_loop()
+    trace = await loop.run_in_executor(None, tracing.obter_trace, task_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace não encontrado para a tarefa")
+    return trace
+
+@app.get("/tasks/{task_id}/profile")
+async def get_task_profile(task_id: str, format: Optional[str] = None):
+    """Baixa o perfil de uma tarefa executada com config.profiler (pstats ou collapsed)"""
+    if task_id not in task_status:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+
+    info_perfil = task_status[task_id].get("profile")
+    if not info_perfil or not os.path.exists(info_perfil["arquivo"]):
+        raise HTTPException(status_code=404, detail="Perfil não disponível para a tarefa")
+
+    if format and format != info_perfil["formato"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Perfil da tarefa está no formato '{info_perfil['formato']}' (profiler '{info_perfil['modo']}')"
+        )
+
+    return FileResponse(
+        info_perfil["arquivo"],
+        media_type="application/octet-stream" if info_perfil["formato"] == "pstats" else "text/plain",
+        filename=os.path.basename(info_perfil["arquivo"])
+    )
+
 @app.post("/process", response_model=ProcessResponse)
 async def process_files(request: ProcessRequest, background_tasks: BackgroundTasks):
     """
     Processa arquivos do FTP para o Google Drive
     """
     try:
+        config = request.config or {}
+
+        # ✅ Perfil da execução (origem, credenciais e destinos); padrão = variáveis de ambiente
+        try:
+            perfil = perfis.obter(config.get("profile"))
+        except perfis.PerfilInvalido as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        modo_profiler = config.get("profiler")
+        if modo_profiler and modo_profiler not in profiling.MODOS_PROFILER:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Profiler inválido. Use {' ou '.join(profiling.MODOS_PROFILER)}"
+            )
+        if request.process_type not in MODULOS_FLUXO:
+            raise HTTPException(
+                status_code=400,
+                detail="Tipo de processo inválido. Use 'files_to_drive' ou 'ecarta_processor'"
+            )
+
+        # ✅ Reservar o perfil já na requisição (a tarefa em background a libera ao terminar):
+        # duas requisições seguidas não passam ambas pela checagem
+        try:
+            reserva = perfis.reservar(perfil)
+        except perfis.ExecucaoEmAndamento as e:
+            raise HTTPException(status_code=409, detail=str(e))
         # ✅ Gerar ID único para a tarefa
-        import time
-        task_id = f"{request.process_type}_{int(time.time())}"
-        
+        task_id = novo_task_id(request.process_type, perfil)
+
         # ✅ Inicializar status da tarefa
         task_status[task_id] = {
             "status": "started",
             "message": "Tarefa iniciada",
             "start_time": time.time(),
-            "process_type": request.process_type
+            "process_type": request.process_type,
+            "profile_name": perfil.nome
         }
         
         if request.process_type == "files_to_drive":
-            background_tasks.add_task(run_files_to_drive_safe, task_id)
+            background_tasks.add_task(run_files_to_drive_safe, task_id, config, reserva)
             return ProcessResponse(
                 status="started",
                 message="Processamento de arquivos iniciado",
                 task_id=task_id,
                 details={"process_type": "files_to_drive"}
             )
-        elif request.process_type == "ecarta_processor":
-            background_tasks.add_task(run_ecarta_processor_safe, task_id)
-            return ProcessResponse(
-                status="started",
-                message="Processamento de e-carta iniciado",
-                task_id=task_id,
-                details={"process_type": "ecarta_processor"}
-            )
-        else:
-            # ✅ Remover tarefa inválida do status
-            del task_status[task_id]
-            raise HTTPException(
-                status_code=400,
-                detail="Tipo de processo inválido. Use 'files_to_drive' ou 'ecarta_processor'"
-            )
+        background_tasks.add_task(run_ecarta_processor_safe, task_id, config, reserva)
+        return ProcessResponse(
+            status="started",
+            message="Processamento de e-carta iniciado",
+            task_id=task_id,
+            details={"process_type": "ecarta_processor"}
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Erro ao iniciar processamento: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def run_files_to_drive_safe(task_id: str):
+def executar_tarefa(task_id: str, nome: str, func, config: Optional[dict] = None, reserva=None):
+    """Executa a tarefa (na thread do executor) sob trace e, se pedido, sob profiler"""
+    if reserva is not None:
+        # A execução usa o perfil reservado na requisição em vez de disputá-lo de novo
+        with perfis.assumir(reserva):
+            return executar_tarefa(task_id, nome, func, config)
+    modo_profiler = (config or {}).get("profiler")
+    if not modo_profiler:
+        return tracing.executar_com_trace(task_id, nome, func)
+
+    # Registrar o perfil já no início: fica disponível mesmo se a tarefa falhar
+    task_status[task_id]["profile"] = {
+        "modo": modo_profiler,
+        "formato": "pstats" if modo_profiler == "cprofile" else "collapsed",
+        "arquivo": profiling.caminho_perfil(task_id, modo_profiler)
+    }
+    resultado, info_perfil = tracing.executar_com_trace(
+        task_id, nome, profiling.executar_com_profiler, modo_profiler, task_id, func
+    )
+    task_status[task_id]["profile"] = info_perfil
+    return resultado
+
+async def run_files_to_drive_safe(task_id: str, config: Optional[dict] = None, reserva=None):
     """Executa o processamento de arquivos em background com tratamento de erros"""
     try:
         logger.info(f"[{task_id}] Iniciando processamento files_to_drive")
@@ -150,7 +306,9 @@ async def run_files_to_drive_safe(task_id: str):
         
         # ✅ Executar função síncrona em thread separada
         loop = asyncio.get_event_loop()
-        resultado = await loop.run_in_executor(executor, files_to_drive_main)
+        resultado = await loop.run_in_executor(
+            executor, partial(executar_tarefa, task_id, "files_to_drive", partial(files_to_drive_main, config), config, reserva)
+        )
         
         # ✅ Atualizar status com resultado
         task_status[task_id].update({
@@ -177,8 +335,11 @@ async def run_files_to_drive_safe(task_id: str):
             "error": error_msg,
             "traceback": error_traceback
         })
+    finally:
+        if reserva is not None:
+            reserva.liberar()
 
-async def run_ecarta_processor_safe(task_id: str):
+async def run_ecarta_processor_safe(task_id: str, config: Optional[dict] = None, reserva=None):
     """Executa o processamento de e-carta em background com tratamento de erros"""
     try:
         logger.info(f"[{task_id}] Iniciando processamento ecarta_processor")
@@ -191,7 +352,9 @@ async def run_ecarta_processor_safe(task_id: str):
         
         # ✅ Executar função síncrona em thread separada
         loop = asyncio.get_event_loop()
-        resultado = await loop.run_in_executor(executor, ecarta_processor_main)
+        resultado = await loop.run_in_executor(
+            executor, partial(executar_tarefa, task_id, "ecarta_processor", partial(ecarta_processor_main, config), config, reserva)
+        )
         
         # ✅ Atualizar status com resultado
         task_status[task_id].update({
@@ -218,6 +381,97 @@ async def run_ecarta_processor_safe(task_id: str):
             "error": error_msg,
             "traceback": error_traceback
         })
+    finally:
+        if reserva is not None:
+            reserva.liberar()
+
+async def disparo_agendado():
+    """Executa um ciclo files_to_drive disparado pelo agendador interno"""
+    try:
+        reserva = perfis.reservar(perfis.perfil_padrao())
+    except perfis.ExecucaoEmAndamento:
+        # Execução manual do perfil padrão em andamento: pula o ciclo sem erro
+        # (um erro faria o agendador aplicar backoff)
+        logger.info("⏭️  Ciclo agendado pulado: o perfil padrão já está em execução")
+        return scheduler.CICLO_PULADO
+    task_id = novo_task_id("files_to_drive")
+    task_status[task_id] = {
+        "status": "started",
+        "message": "Tarefa iniciada pelo agendador",
+        "start_time": time.time(),
+        "process_type": "files_to_drive",
+        "profile_name": perfis.PERFIL_PADRAO,
+        "agendada": True
+    }
+    await run_files_to_drive_safe(task_id, None, reserva)
+    return task_status[task_id].get("result")
+
+@app.get("/scheduler")
+async def get_scheduler_status():
+    """Retorna o estado do agendador interno"""
+    if agendador is None:
+        return {"habilitado": scheduler.scheduler_habilitado(), "ativo": False}
+    return {"habilitado": True, **agendador.status()}
+
+@app.get("/admin/bandwidth")
+async def get_bandwidth():
+    """Limites de banda atuais (entrada FTP, saída Drive) e taxas obtidas"""
+    return banda.status()
+
+@app.put("/admin/bandwidth")
+async def update_bandwidth(request: BandwidthUpdate):
+    """Ajusta os limites de banda em tempo de execução (vale também para a execução em andamento)"""
+    ajustes = (("ftp", request.ftp, request.ftp_burst), ("drive", request.drive, request.drive_burst))
+    try:
+        for nome, taxa, rajada in ajustes:
+            if taxa is not None or rajada is not None:
+                banda.limitador(nome).ajustar(taxa, rajada)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Valor de banda inválido: {e}")
+    return banda.status()
+
+@app.get("/admin/drive-calls")
+async def get_drive_calls():
+    """Chamadas à API do Drive do processo por método e resultado, e uso da janela horária do orçamento"""
+    return cota_drive.status()
+
+def consultar_registros(q, codigo, drive_id, limite, perfil=None):
+    from ecarta_processor import get_records_db_path
+    with perfis.usar(perfis.obter(perfil)):
+        caminho = get_records_db_path()
+    if not os.path.exists(caminho):
+        return {"registros": [], "quantidade": 0, "ms": 0.0}
+    if caminho not in indices_consulta:
+        indices_consulta[caminho] = indice_registros.IndiceRegistros(caminho).abrir()
+    inicio = time.perf_counter()
+    registros = indices_consulta[caminho].buscar(texto=q, codigo_ar=codigo, drive_id=drive_id, limite=limite)
+    return {"registros": registros, "quantidade": len(registros),
+            "ms": round((time.perf_counter() - inicio) * 1000, 2)}
+
+@app.get("/profiles")
+async def get_profiles():
+    """Perfis disponíveis (sem segredos) e os que estão em execução"""
+    try:
+        return {"perfis": [perfis.obter(nome).resumo() for nome in perfis.listar()],
+                "em_execucao": perfis.em_execucao()}
+    except perfis.PerfilInvalido as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/records")
+async def get_records(q: Optional[str] = None, codigo: Optional[str] = None, drive_id: Optional[str] = None,
+                      limite: int = 50, profile: Optional[str] = None):
+    """
+    Busca nos registros DevolucaoAR já processados (índice local, sem chamadas ao Drive):
+    q = texto livre em qualquer campo do manifesto, codigo = código AR exato,
+    drive_id = ID do PDF ou do original arquivado no Drive, profile = perfil (padrão se omitido)
+    """
+    if not (q or codigo or drive_id):
+        raise HTTPException(status_code=400, detail="Informe q, codigo ou drive_id")
+    loop = asyncio.get_event_loop()
+    try:
+        return await loop.run_in_executor(None, consultar_registros, q, codigo, drive_id, limite, profile)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Consulta inválida: {e}")
 
 # ✅ Endpoint para limpeza manual de tarefas antigas
 @app.delete("/tasks/cleanup")
@@ -0,0 +1,198 @@
+# pastas_drive.py
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from googleapiclient.errors import HttpError
+import logging
+import tracing
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+PASTA_MIME = 'application/vnd.google-apps.folder'
+
+_MODOS = {"dia": "dia", "day": "dia", "lote": "lote", "batch": "lote"}
+
+def get_modo_subpastas():
+    """
+    DRIVE_SUBFOLDERS: "dia" (uma subpasta por dia), "lote" (uma por
+    execução) ou vazio (desligado: tudo direto na pasta de destino)
+    """
+    return _MODOS.get(os.getenv('DRIVE_SUBFOLDERS', '').strip().lower())
+
+def nome_subpasta(modo, run_id=None, agora=None):
+    """Nome da subpasta desta execução: data (DRIVE_SUBFOLDER_DATE_FORMAT) ou lote_<run_id>"""
+    if modo == "lote":
+        return f"lote_{run_id}"
+    formato = os.getenv('DRIVE_SUBFOLDER_DATE_FORMAT', '%Y-%m-%d')
+    return time.strftime(formato, time.localtime(agora if agora is not None else time.time()))
+
+def get_espera_confirmacao():
+    """Espera (s) antes de reconferir duplicatas após criar uma subpasta (DRIVE_SUBFOLDER_SETTLE)"""
+    try:
+        return max(0.0, float(os.getenv('DRIVE_SUBFOLDER_SETTLE', 0.5)))
+    except ValueError:
+        return 0.5
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace("'", "\\'")
+
+class MapaPastas:
+    """
+    Cache persistente (pasta pai, nome) -> ID das subpastas do Drive. Com o
+    ID em cache nenhuma chamada é feita; na falta dele a subpasta é
+    procurada pelo nome e, se não existir, criada.
+
+    Criação concorrente: dentro do processo um lock por subpasta serializa
+    a resolução; entre processos, depois de criar a pasta (e esperar
+    DRIVE_SUBFOLDER_SETTLE) a listagem é refeita e, havendo mais de uma com o mesmo nome, todos escolhem a mais
+    antiga (createdTime, depois ID) e quem perdeu apaga a sua (vazia).
+
+    Formato em disco (JSON):
+        {"pastas": {"<pai>/<nome>": {"id": ..., "ts": ...}}}
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.pastas = {}
+        self.contagem = {"cache": 0, "encontradas": 0, "criadas": 0, "duplicadas_removidas": 0}
+        self._alterado = False
+        self._lock = threading.Lock()
+        self._locks_pasta = {}
+
+    def carregar(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                self.pastas = json.load(f).get("pastas", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.pastas = {}
+        except Exception as e:
+            logger.warning(f"Erro ao ler mapa de subpastas do Drive: {e}")
+            self.pastas = {}
+        return self
+
+    def salvar(self):
+        """Grava o mapa de forma atômica (só se houve alteração)"""
+        with self._lock:
+            if not self._alterado:
+                return
+            try:
+                Path(os.path.dirname(self.caminho)).mkdir(parents=True, exist_ok=True)
+                caminho_tmp = self.caminho + ".tmp"
+                with open(caminho_tmp, "w", encoding="utf-8") as f:
+                    json.dump({"pastas": self.pastas}, f, ensure_ascii=False)
+                os.replace(caminho_tmp, self.caminho)
+                self._alterado = False
+            except Exception as e:
+                logger.warning(f"Erro ao salvar mapa de subpastas do Drive: {e}")
+
+    def subpastas(self, pasta_pai):
+        """{ID: nome} das subpastas de 'pasta_pai' no mapa (as criadas/usadas pelo fluxo)"""
+        with self._lock:
+            encontradas = {}
+            for chave, entrada in self.pastas.items():
+                pai, _, nome = chave.partition("/")
+                if pai == pasta_pai:
+                    encontradas[entrada["id"]] = nome
+            return encontradas
+
+    def esquecer(self, pasta_pai, nome):
+        """Remove do cache uma subpasta que não existe mais no Drive"""
+        with self._lock:
+            if self.pastas.pop(f"{pasta_pai}/{nome}", None) is not None:
+                self._alterado = True
+
+    def conferir(self, service, pasta_pai, nome):
+        """
+        Confere no Drive a subpasta em cache (usado quando todos os uploads
+        para ela falharam). Se ela sumiu ou foi para a lixeira, sai do mapa
+        e a próxima execução a recria. Retorna False nesse caso.
+        """
+        entrada = self.pastas.get(f"{pasta_pai}/{nome}")
+        if not entrada:
+            return True
+        try:
+            with tracing.span("drive.files.get", pasta=nome):
+                pasta = service.files().get(fileId=entrada["id"], fields="id, trashed", supportsAllDrives=True).execute()
+            if not pasta.get("trashed"):
+                return True
+        except HttpError as e:
+            if e.resp.status != 404:
+                logger.warning(f"Não foi possível conferir a subpasta '{nome}': {e.resp.status}")
+                return True
+        logger.warning(f"Subpasta '{nome}' ({entrada['id']}) não existe mais no Drive; removida do mapa")
+        self.esquecer(pasta_pai, nome)
+        return False
+
+    def _listar(self, service, pasta_pai, nome):
+        consulta = (f"'{_escapar(pasta_pai)}' in parents and name = '{_escapar(nome)}' "
+                    f"and mimeType = '{PASTA_MIME}' and trashed = false")
+        with tracing.span("drive.files.list", pasta=nome):
+            resposta = service.files().list(
+                q=consulta, fields="files(id, name, createdTime)", pageSize=10,
+                supportsAllDrives=True, includeItemsFromAllDrives=True
+            ).execute()
+        # Critério único entre processos: a mais antiga; empate pelo ID
+        return sorted(resposta.get("files", []), key=lambda p: (p.get("createdTime") or "", p["id"]))
+
+    def obter(self, service, pasta_pai, nome):
+        """ID da subpasta 'nome' dentro de 'pasta_pai', criando-a se preciso"""
+        chave = f"{pasta_pai}/{nome}"
+        with self._lock:
+            entrada = self.pastas.get(chave)
+            if entrada:
+                self.contagem["cache"] += 1
+                return entrada["id"]
+            lock_pasta = self._locks_pasta.setdefault(chave, threading.Lock())
+
+        with lock_pasta:
+            with self._lock:
+                entrada = self.pastas.get(chave)
+            if entrada:
+                return entrada["id"]
+
+            existentes = self._listar(service, pasta_pai, nome)
+            if existentes:
+                pasta_id = existentes[0]["id"]
+                self.contagem["encontradas"] += 1
+            else:
+                with tracing.span("drive.files.create", arquivo=nome, pasta=True):
+                    criada = service.files().create(
+                        body={"name": nome, "mimeType": PASTA_MIME, "parents": [pasta_pai]},
+                        fields="id", supportsAllDrives=True
+                    ).execute()
+                self.contagem["criadas"] += 1
+                pasta_id = self._resolver_corrida(service, pasta_pai, nome, criada["id"])
+                logger.info(f"📁 Subpasta '{nome}' criada no Drive (ID: {pasta_id})")
+
+            with self._lock:
+                self.pastas[chave] = {"id": pasta_id, "ts": time.time()}
+                self._alterado = True
+            return pasta_id
+
+    def _resolver_corrida(self, service, pasta_pai, nome, criada_id):
+        """Outro processo pode ter criado a mesma subpasta: fica a escolhida por todos"""
+        # Dá tempo de uma criação concorrente aparecer na listagem
+        time.sleep(get_espera_confirmacao())
+        try:
+            existentes = self._listar(service, pasta_pai, nome)
+        except HttpError as e:
+            logger.warning(f"Não foi possível conferir duplicatas da subpasta '{nome}': {e.resp.status}")
+            return criada_id
+        if not existentes or existentes[0]["id"] == criada_id:
+            return criada_id
+        vencedora = existentes[0]["id"]
+        try:
+            with tracing.span("drive.files.delete", arquivo=nome, pasta=True):
+                service.files().delete(fileId=criada_id, supportsAllDrives=True).execute()
+            self.contagem["duplicadas_removidas"] += 1
+            logger.info(f"Subpasta '{nome}' criada em paralelo por outro processo; usando {vencedora}")
+        except HttpError as e:
+            logger.warning(f"Não foi possível remover a subpasta duplicada '{nome}' ({criada_id}): {e.resp.status}")
+        return vencedora
+
+    def resumo(self):
+        return dict(self.contagem)
@@ -0,0 +1,232 @@
+# perfis.py
+
+import os
+import re
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+PERFIL_PADRAO = "padrao"
+
+_NOME_VALIDO = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class PerfilInvalido(ValueError):
+    """Perfil inexistente ou mal definido no arquivo de perfis"""
+
+class ExecucaoEmAndamento(RuntimeError):
+    """Já existe uma execução deste perfil no processo (o espaço de trabalho é do perfil)"""
+
+class Perfil:
+    """
+    Configuração de um cliente (tenant): origem no FTP, credenciais do Drive
+    e pastas de destino. Segredos não ficam no perfil: senha do FTP e
+    credenciais do Drive são referências a variáveis de ambiente.
+    O perfil padrão é o das variáveis de ambiente de sempre (HOST,
+    DIRECTORY, TARGET_FOLDER_ID, GOOGLE_CREDENTIALS...) e usa os mesmos
+    diretórios de trabalho e de estado; os demais trabalham em
+    <diretório>-<nome> (irmão: a limpeza do padrão não o alcança) e guardam
+    o estado em <STATE_DIR>/perfis/<nome>.
+    """
+
+    def __init__(self, nome, host_ftp=None, port_ftp=21, usuario_ftp=None, senha_env=None, diretorio_ftp=None,
+                 pasta_principal=None, pasta_devolucaoar=None, credenciais_env='GOOGLE_CREDENTIALS', novo_dono=None):
+        self.nome = nome
+        self.host_ftp = host_ftp
+        self.port_ftp = int(port_ftp or 21)
+        self.usuario_ftp = usuario_ftp
+        self.senha_env = senha_env
+        self.diretorio_ftp = diretorio_ftp
+        self.pasta_principal = pasta_principal
+        self.pasta_devolucaoar = pasta_devolucaoar
+        self.credenciais_env = credenciais_env or 'GOOGLE_CREDENTIALS'
+        self.novo_dono = novo_dono
+
+    @property
+    def padrao(self):
+        return self.nome == PERFIL_PADRAO
+
+    @property
+    def senha_ftp(self):
+        return os.getenv(self.senha_env) if self.senha_env else None
+
+    def credenciais(self):
+        """JSON da Service Account do perfil (lido da variável referenciada)"""
+        return os.getenv(self.credenciais_env)
+
+    def subdiretorio(self, base):
+        """Diretório de estado do perfil dentro de 'base' (o próprio 'base' no perfil padrão)"""
+        return base if self.padrao else os.path.join(base, "perfis", self.nome)
+
+    def diretorio_trabalho(self, base):
+        """Diretório de trabalho temporário do perfil, ao lado de 'base' (limpo a cada execução)"""
+        return base if self.padrao else f"{base}-{self.nome}"
+
+    def resumo(self):
+        """Configuração sem segredos (para status e logs)"""
+        return {
+            "nome": self.nome,
+            "host_ftp": self.host_ftp,
+            "diretorio_ftp": self.diretorio_ftp,
+            "pasta_principal": self.pasta_principal,
+            "pasta_devolucaoar": self.pasta_devolucaoar,
+            "credenciais_env": self.credenciais_env,
+            "novo_dono": self.novo_dono,
+        }
+
+def perfil_padrao():
+    """Perfil das variáveis de ambiente (lidas a cada chamada)"""
+    return Perfil(
+        PERFIL_PADRAO,
+        host_ftp=os.getenv('HOST'),
+        port_ftp=os.getenv('PORT', 21),
+        usuario_ftp=os.getenv('USER_ECARTA'),
+        senha_env='PASSWORD',
+        diretorio_ftp=os.getenv('DIRECTORY'),
+        pasta_principal=os.getenv('TARGET_FOLDER_ID'),
+        pasta_devolucaoar=os.getenv('TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE'),
+        novo_dono=os.getenv('NEW_OWNER_EMAIL_ENV_VAR_NAME'),
+    )
+
+def get_profiles_file_path():
+    """
+    Arquivo JSON com os perfis nomeados (PROFILES_FILE):
+        {"cliente_a": {"host": "...", "port": 21, "usuario": "...",
+                       "senha_env": "CLIENTE_A_FTP_PASSWORD", "diretorio": "...",
+                       "pasta_principal": "...", "pasta_devolucaoar": "...",
+                       "credenciais_env": "CLIENTE_A_GOOGLE_CREDENTIALS",
+                       "novo_dono": "..."}}
+    """
+    return os.getenv('PROFILES_FILE')
+
+def carregar_perfis():
+    """Definições dos perfis nomeados (dict nome -> campos); vazio sem PROFILES_FILE"""
+    caminho = get_profiles_file_path()
+    if not caminho:
+        return {}
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            definicoes = json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"Arquivo de perfis não encontrado: {caminho}")
+        return {}
+    except json.JSONDecodeError as e:
+        raise PerfilInvalido(f"Arquivo de perfis inválido ({caminho}): {e}")
+    if not isinstance(definicoes, dict):
+        raise PerfilInvalido(f"Arquivo de perfis inválido ({caminho}): esperado um objeto nome -> perfil")
+    return definicoes
+
+def obter(nome=None):
+    """Perfil 'nome' (o padrão se vazio); PerfilInvalido se não existir"""
+    if not nome or nome == PERFIL_PADRAO:
+        return perfil_padrao()
+    if not isinstance(nome, str) or not _NOME_VALIDO.match(nome):
+        raise PerfilInvalido(f"Nome de perfil inválido: {nome!r}")
+    definicao = carregar_perfis().get(nome)
+    if not isinstance(definicao, dict):
+        raise PerfilInvalido(f"Perfil '{nome}' não encontrado")
+    return Perfil(
+        nome,
+        host_ftp=definicao.get("host"),
+        port_ftp=definicao.get("port", 21),
+        usuario_ftp=definicao.get("usuario"),
+        senha_env=definicao.get("senha_env"),
+        diretorio_ftp=definicao.get("diretorio"),
+        pasta_principal=definicao.get("pasta_principal"),
+        pasta_devolucaoar=definicao.get("pasta_devolucaoar"),
+        credenciais_env=definicao.get("credenciais_env"),
+        novo_dono=definicao.get("novo_dono"),
+    )
+
+def listar():
+    """Nomes dos perfis disponíveis (o padrão primeiro)"""
+    return [PERFIL_PADRAO] + sorted(n for n in carregar_perfis() if n != PERFIL_PADRAO)
+
+# Perfil da execução corrente: contextvar, então cada thread do executor
+# tem o seu e as tarefas asyncio/asyncio.to_thread herdam o de quem as criou
+_perfil_atual = contextvars.ContextVar("perfil_atual", default=None)
+
+def atual():
+    """Perfil da execução corrente (o padrão fora de usar())"""
+    return _perfil_atual.get() or perfil_padrao()
+
+@contextmanager
+def usar(perfil):
+    """Define o perfil da execução no contexto corrente"""
+    token = _perfil_atual.set(perfil)
+    try:
+        yield perfil
+    finally:
+        _perfil_atual.reset(token)
+
+_em_execucao = set()
+_lock_execucao = threading.Lock()
+
+class Reserva:
+    """
+    Perfil reservado para uma execução antes de ela começar (ex.: na
+    requisição da API, antes da tarefa em background). A execução assume a
+    reserva com assumir() e quem reservou a libera com liberar().
+    """
+
+    def __init__(self, perfil):
+        self.perfil = perfil
+        self._liberada = False
+
+    def liberar(self):
+        with _lock_execucao:
+            if not self._liberada:
+                self._liberada = True
+                _em_execucao.discard(self.perfil.nome)
+
+def reservar(perfil):
+    """Reserva o perfil no processo; ExecucaoEmAndamento se ele já está reservado ou rodando"""
+    with _lock_execucao:
+        if perfil.nome in _em_execucao:
+            raise ExecucaoEmAndamento(f"Já existe uma execução em andamento para o perfil '{perfil.nome}'")
+        _em_execucao.add(perfil.nome)
+    return Reserva(perfil)
+
+# Reserva assumida pela execução corrente (ver assumir())
+_reserva_atual = contextvars.ContextVar("reserva_atual", default=None)
+
+def reserva_atual():
+    """Reserva assumida no contexto corrente (None fora de assumir())"""
+    return _reserva_atual.get()
+
+@contextmanager
+def assumir(reserva):
+    """Faz execucao() do perfil reservado usar esta reserva no contexto corrente"""
+    token = _reserva_atual.set(reserva)
+    try:
+        yield reserva
+    finally:
+        _reserva_atual.reset(token)
+
+@contextmanager
+def execucao(perfil):
+    """
+    Execução exclusiva do perfil no processo (perfis diferentes rodam em
+    paralelo) com o perfil ativo no contexto. ExecucaoEmAndamento se o
+    mesmo perfil já está rodando. Com uma reserva do perfil assumida no
+    contexto, usa a reserva (liberada por quem a criou).
+    """
+    reserva = _reserva_atual.get()
+    if reserva is not None and reserva.perfil.nome == perfil.nome:
+        with usar(perfil):
+            yield perfil
+        return
+    reserva = reservar(perfil)
+    try:
+        with usar(perfil):
+            yield perfil
+    finally:
+        reserva.liberar()
+
+def em_execucao():
+    with _lock_execucao:
+        return sorted(_em_execucao)
@@ -0,0 +1,326 @@
+# profiling.py
+
+import os
+import sys
+import time
+import cProfile
+import pstats
+import tempfile
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+import perfis
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+MODOS_PROFILER = ("cprofile", "sampling")
+
+def get_profiler_dir():
+    """Retorna diretório onde os perfis das tarefas são armazenados"""
+    profiler_dir = os.getenv('PROFILER_DIR')
+    if profiler_dir:
+        return profiler_dir
+    return os.path.join(tempfile.gettempdir(), "ftp_to_drive_profiles")
+
+def caminho_perfil(task_id, modo):
+    """Caminho do arquivo de perfil: .pstats (cprofile) ou .collapsed (sampling)"""
+    extensao = "pstats" if modo == "cprofile" else "collapsed"
+    return os.path.join(get_profiler_dir(), f"{task_id}.{extensao}")
+
+# Profiler da execução corrente: as threads que trabalham para ela se
+# registram nele (inicializador_thread / thread_da_execucao)
+_profiler_atual = contextvars.ContextVar("profiler_atual", default=None)
+
+def inicializador_thread():
+    """
+    initializer para um ThreadPoolExecutor criado pela execução: as threads
+    do pool entram no profiler dela (None fora de uma execução perfilada)
+    """
+    profiler = _profiler_atual.get()
+    return profiler.incluir_thread if profiler is not None else None
+
+@contextmanager
+def thread_da_execucao():
+    """
+    Inclui a thread corrente no profiler da execução só durante o bloco:
+    para threads compartilhadas entre execuções (loop de transferências)
+    """
+    profiler = _profiler_atual.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.thread_da_execucao():
+        yield
+
+class VigiaExecucoes:
+    """
+    Registra as outras execuções (perfis em execução além do perfilado)
+    vistas durante o perfil: threads compartilhadas e, a partir do 3.12, o
+    cProfile do interpretador inteiro também pegam trabalho delas.
+    """
+
+    def __init__(self, proprio, intervalo=0.25):
+        self.proprio = proprio
+        self.intervalo = intervalo
+        self.outras = set()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="vigia-execucoes", daemon=True)
+
+    def verificar(self):
+        self.outras.update(n for n in perfis.em_execucao() if n != self.proprio)
+
+    def _executar(self):
+        self.verificar()
+        while not self._parar.wait(self.intervalo):
+            self.verificar()
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+        self.verificar()
+
+class AmostradorPilhas:
+    """
+    Profiler por amostragem: uma thread de fundo lê a pilha das threads da
+    execução (sys._current_frames) a cada PROFILER_INTERVAL segundos e
+    acumula pilhas no formato collapsed (compatível com flamegraph.pl /
+    speedscope), cada uma prefixada pelo nome da thread. Entram a thread
+    que iniciou o perfil e as registradas pela execução; as de outras
+    execuções e do servidor ficam de fora.
+    Não instrumenta as threads, mas cada amostra disputa o GIL com elas:
+    intervalos muito curtos pesam na execução.
+    """
+
+    def __init__(self, intervalo=None):
+        self.intervalo = float(intervalo if intervalo is not None else os.getenv('PROFILER_INTERVAL', 0.005))
+        self.pilhas = Counter()
+        self.amostras = 0
+        self.threads = set()
+        self._incluidas = Counter()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="amostrador-pilhas", daemon=True)
+
+    def incluir_thread(self):
+        with self._lock:
+            self._incluidas[threading.get_ident()] += 1
+
+    @contextmanager
+    def thread_da_execucao(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._incluidas[ident] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._incluidas[ident] -= 1
+                if self._incluidas[ident] <= 0:
+                    del self._incluidas[ident]
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            with self._lock:
+                incluidas = set(self._incluidas)
+            nomes_threads = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in incluidas:
+                    continue
+                nome_thread = nomes_threads.get(thread_id, f"thread-{thread_id}")
+                nomes = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    nomes.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                nomes.append(nome_thread)
+                self.pilhas[";".join(reversed(nomes))] += 1
+                self.threads.add(nome_thread)
+            self.amostras += 1
+
+    def iniciar(self):
+        self.incluir_thread()
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def salvar(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            for pilha, contagem in self.pilhas.most_common():
+                f.write(f"{pilha} {contagem}\n")
+
+# Até o 3.11 o cProfile só vê a thread que o ativou; a partir do 3.12 ele
+# usa sys.monitoring, que vale para o interpretador inteiro
+_CPROFILE_TODAS_THREADS = sys.version_info >= (3, 12)
+
+# Threads com um cProfile de ProfilerThreads ativo agora (ident -> profiler):
+# o gancho de profile é um por thread, então só um perfil por vez em cada uma
+_threads_com_profiler = {}
+_lock_threads = threading.Lock()
+
+class ProfilerThreads:
+    """
+    cProfile da execução nas threads dela. Até o Python 3.11 cada thread
+    registrada pela execução (pool de exclusão, loop de transferências
+    enquanto atende a execução) ganha seu próprio cProfile.Profile, e no
+    fim as estatísticas são somadas às da thread que chamou; threads de
+    outras execuções não entram. Threads do pool que seguem vivas depois
+    ficam fora do arquivo. A partir do 3.12 o cProfile vale para todas as
+    threads do processo.
+    """
+
+    def __init__(self):
+        self.principal = cProfile.Profile()
+        self.por_thread = []
+        self.encerrados = []
+        self._ativos = {}
+        self._lock = threading.Lock()
+
+    def _ativar(self, ident):
+        """Liga um cProfile na thread corrente se ela ainda não tem um"""
+        with _lock_threads:
+            if ident in _threads_com_profiler:
+                return None
+            _threads_com_profiler[ident] = self
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def incluir_thread(self):
+        """Para threads dedicadas à execução (pools dela): o profiler vale até a thread acabar"""
+        if _CPROFILE_TODAS_THREADS:
+            return
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.por_thread.append((threading.current_thread(), profiler))
+        profiler.enable()
+
+    @contextmanager
+    def thread_da_execucao(self):
+        if _CPROFILE_TODAS_THREADS:
+            yield
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            ativo = self._ativos.get(ident)
+            if ativo is not None:
+                ativo[1] += 1
+        if ativo is None:
+            profiler = self._ativar(ident)
+            if profiler is None:
+                # Thread já perfilada (por outra execução ou por inteiro)
+                yield
+                return
+            with self._lock:
+                self._ativos[ident] = [profiler, 1]
+        try:
+            yield
+        finally:
+            with self._lock:
+                ativo = self._ativos[ident]
+                ativo[1] -= 1
+                encerrar = ativo[1] == 0
+                if encerrar:
+                    del self._ativos[ident]
+            if encerrar:
+                ativo[0].disable()
+                with _lock_threads:
+                    _threads_com_profiler.pop(ident, None)
+                with self._lock:
+                    self.encerrados.append((threading.current_thread(), ativo[0]))
+
+    def runcall(self, func, *args, **kwargs):
+        if _CPROFILE_TODAS_THREADS:
+            return self.principal.runcall(func, *args, **kwargs)
+        ident = threading.get_ident()
+        with _lock_threads:
+            _threads_com_profiler[ident] = self
+        try:
+            return self.principal.runcall(func, *args, **kwargs)
+        finally:
+            with _lock_threads:
+                _threads_com_profiler.pop(ident, None)
+
+    def _concluidos(self):
+        """Profilers das threads encerradas e dos blocos já concluídos"""
+        with self._lock:
+            return ([(t, p) for t, p in self.por_thread if not t.is_alive()] + list(self.encerrados))
+
+    def threads(self):
+        """Nomes das threads cujas estatísticas entram no arquivo"""
+        return sorted({threading.current_thread().name} | {t.name for t, _ in self._concluidos()})
+
+    def dump_stats(self, caminho):
+        estatisticas = pstats.Stats(self.principal)
+        for _, profiler in self._concluidos():
+            profiler.create_stats()
+            if profiler.stats:
+                estatisticas.add(profiler)
+        estatisticas.dump_stats(caminho)
+
+def executar_com_profiler(modo, task_id, func, *args, **kwargs):
+    """
+    Executa func sob o profiler escolhido e grava o perfil em disco.
+    Retorna (resultado, info_perfil); info_perfil["outras_execucoes"] lista
+    os perfis que rodaram em paralelo (perfil possivelmente contaminado).
+    """
+    if modo not in MODOS_PROFILER:
+        raise ValueError(f"Profiler inválido: {modo}. Use {' ou '.join(MODOS_PROFILER)}")
+
+    os.makedirs(get_profiler_dir(), exist_ok=True)
+    caminho = caminho_perfil(task_id, modo)
+    inicio = time.perf_counter()
+    logger.info(f"[{task_id}] Executando sob profiler '{modo}'")
+
+    # Perfil da execução: o reservado no contexto (API) ou o ativo
+    reserva = perfis.reserva_atual()
+    vigia = VigiaExecucoes(reserva.perfil.nome if reserva is not None else perfis.atual().nome)
+    vigia.iniciar()
+    if modo == "cprofile":
+        profiler = ProfilerThreads()
+        token = _profiler_atual.set(profiler)
+        try:
+            resultado = profiler.runcall(func, *args, **kwargs)
+        finally:
+            _profiler_atual.reset(token)
+            vigia.parar()
+            profiler.dump_stats(caminho)
+        amostras = None
+        threads = None if _CPROFILE_TODAS_THREADS else len(profiler.threads())
+    else:
+        amostrador = AmostradorPilhas()
+        token = _profiler_atual.set(amostrador)
+        amostrador.iniciar()
+        try:
+            resultado = func(*args, **kwargs)
+        finally:
+            _profiler_atual.reset(token)
+            amostrador.parar()
+            vigia.parar()
+            amostrador.salvar(caminho)
+        amostras = amostrador.amostras
+        threads = len(amostrador.threads)
+
+    outras = sorted(vigia.outras)
+    if outras:
+        logger.warning(f"[{task_id}] ⚠️  Perfil com outras execuções em paralelo ({', '.join(outras)}): "
+                       f"threads compartilhadas podem incluir trabalho delas")
+
+    info_perfil = {
+        "modo": modo,
+        "formato": "pstats" if modo == "cprofile" else "collapsed",
+        "arquivo": caminho,
+        "amostras": amostras,
+        "threads": threads,
+        "outras_execucoes": outras,
+        "duracao": round(time.perf_counter() - inicio, 2)
+    }
+    logger.info(f"[{task_id}] Perfil salvo em {caminho}")
+    return resultado, info_perfil
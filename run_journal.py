@@ -0,0 +1,157 @@
+# run_journal.py
+
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ✅ Estados de um arquivo ao longo da execução (ordem de progresso)
+LISTADO = "listado"
+BAIXADO = "baixado"
+EXTRAIDO = "extraido"
+ENVIADO = "enviado"
+DELETADO = "deletado"
+
+ORDEM_ESTADOS = {LISTADO: 0, BAIXADO: 1, EXTRAIDO: 2, ENVIADO: 3, DELETADO: 4}
+
+# ✅ Upload cujo MD5 no Drive diverge do original: fora da ordem de progresso,
+# então não conta como enviado (o arquivo é reenviado na próxima execução)
+DIVERGENTE = "divergente"
+
+class RunJournal:
+    """
+    Diário append-only (JSONL) do estado de cada arquivo da execução.
+    Cada transição é gravada com flush+fsync antes de seguir adiante, então
+    após uma queda o diário reflete exatamente o que já foi feito.
+
+    Chaves usadas:
+        ftp:<nome>                   arquivo do FTP (listado/baixado/extraido/deletado)
+        upload:<destino>:<nome>      upload para o Drive (enviado ou divergente, com drive_id)
+    """
+
+    def __init__(self, caminho, fsync=None):
+        self.caminho = caminho
+        self.fsync = fsync if fsync is not None else os.getenv('JOURNAL_FSYNC', 'true').strip().lower() in ("1", "true", "sim", "yes", "on")
+        self.run_id = None
+        self.estados = {}
+        self._concluido = True
+        self._arquivo = None
+        self._lock = threading.Lock()
+
+    # ---------- leitura ----------
+    def carregar(self):
+        """Reconstrói o último estado de cada chave a partir do diário em disco"""
+        self.estados = {}
+        self._concluido = True
+        self.run_id = None
+        if not os.path.exists(self.caminho):
+            return self
+
+        with open(self.caminho, "r", encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    # Última linha truncada pela queda: ignorar
+                    continue
+                if registro.get("tipo") == "run":
+                    self.run_id = registro.get("run_id")
+                    self._concluido = registro.get("estado") == "concluido"
+                    continue
+                chave = registro.get("chave")
+                if chave:
+                    self.estados[chave] = registro
+        return self
+
+    def execucao_incompleta(self):
+        """True se o diário tem uma execução iniciada e não concluída"""
+        return self.run_id is not None and not self._concluido
+
+    def estado(self, chave):
+        registro = self.estados.get(chave)
+        return registro.get("estado") if registro else None
+
+    def dados(self, chave):
+        return self.estados.get(chave) or {}
+
+    def atingiu(self, chave, estado):
+        """True se a chave já chegou (ou passou) do estado informado"""
+        atual = self.estado(chave)
+        return atual is not None and ORDEM_ESTADOS.get(atual, -1) >= ORDEM_ESTADOS[estado]
+
+    # ---------- escrita ----------
+    def iniciar(self, retomar=False):
+        """
+        Abre o diário para escrita. Com retomar=True mantém o histórico e
+        continua a execução anterior; caso contrário começa um diário novo.
+        """
+        Path(os.path.dirname(self.caminho)).mkdir(parents=True, exist_ok=True)
+        if retomar:
+            self.carregar()
+            modo = "a"
+            logger.info(f"Retomando execução '{self.run_id}' a partir do diário ({len(self.estados)} registro(s))")
+        else:
+            self.estados = {}
+            self.run_id = uuid.uuid4().hex[:12]
+            modo = "w"
+        self._arquivo = open(self.caminho, modo, encoding="utf-8")
+        self._concluido = False
+        self._gravar([{"tipo": "run", "run_id": self.run_id, "estado": "retomado" if retomar else "iniciado"}])
+        return self
+
+    def _gravar(self, registros):
+        with self._lock:
+            for registro in registros:
+                registro.setdefault("ts", time.time())
+                self._arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._arquivo.flush()
+            if self.fsync:
+                os.fsync(self._arquivo.fileno())
+
+    def registrar(self, chave, estado, **dados):
+        """Grava a transição de uma chave de forma durável"""
+        registro = {"chave": chave, "estado": estado, **dados}
+        self._gravar([registro])
+        self.estados[chave] = registro
+
+    def registrar_varios(self, chaves, estado):
+        """Grava a mesma transição para várias chaves com um único fsync"""
+        registros = [{"chave": chave, "estado": estado} for chave in chaves if not self.atingiu(chave, estado)]
+        if registros:
+            self._gravar(registros)
+            for registro in registros:
+                self.estados[registro["chave"]] = registro
+
+    def concluir(self):
+        """Marca a execução como concluída e fecha o diário"""
+        if self._arquivo is None:
+            return
+        self._gravar([{"tipo": "run", "run_id": self.run_id, "estado": "concluido"}])
+        self._concluido = True
+        self.fechar()
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def resumo(self):
+        contagem = {}
+        for registro in self.estados.values():
+            contagem[registro["estado"]] = contagem.get(registro["estado"], 0) + 1
+        return {"run_id": self.run_id, "estados": contagem}
+
+def chave_ftp(nome_arquivo):
+    return f"ftp:{nome_arquivo}"
+
+def chave_upload(destino, nome_arquivo):
+    return f"upload:{destino}:{nome_arquivo}"
@@ -0,0 +1,152 @@
+# scheduler.py
+
+import os
+import time
+import asyncio
+import tempfile
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def get_lock_file_path():
+    """Arquivo de lock que garante um único agendador entre os workers"""
+    return os.getenv('SCHEDULER_LOCK_FILE', os.path.join(tempfile.gettempdir(), "ftp_to_drive_scheduler.lock"))
+
+# Retorno de 'disparar' quando o ciclo não rodou (ex.: execução manual em
+# andamento): o intervalo e a taxa de chegada ficam como estavam
+CICLO_PULADO = object()
+
+def scheduler_habilitado():
+    return os.getenv('SCHEDULER_ENABLED', 'false').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+class AgendadorAdaptativo:
+    """
+    Dispara files_to_drive periodicamente, ajustando o intervalo à taxa de
+    chegada de arquivos no FTP: a taxa é estimada por média móvel exponencial
+    (arquivos/s) e, enquanto chegam arquivos, o intervalo encurta até mirar
+    SCHEDULER_TARGET_FILES arquivos por execução. Execuções vazias aplicam
+    backoff multiplicativo.
+    """
+
+    def __init__(self, disparar, intervalo_min=None, intervalo_max=None,
+                 intervalo_inicial=None, arquivos_alvo=None, fator_backoff=None, alfa=None):
+        self.disparar = disparar  # corrotina que executa um ciclo e retorna o resultado (ou CICLO_PULADO)
+        self.intervalo_min = float(intervalo_min or os.getenv('SCHEDULER_MIN_INTERVAL', 60))
+        self.intervalo_max = float(intervalo_max or os.getenv('SCHEDULER_MAX_INTERVAL', 3600))
+        self.intervalo = float(intervalo_inicial or os.getenv('SCHEDULER_INITIAL_INTERVAL', 300))
+        self.arquivos_alvo = float(arquivos_alvo or os.getenv('SCHEDULER_TARGET_FILES', 50))
+        self.fator_backoff = float(fator_backoff or os.getenv('SCHEDULER_BACKOFF_FACTOR', 2.0))
+        self.alfa = float(alfa or os.getenv('SCHEDULER_EWMA_ALPHA', 0.3))
+
+        self.taxa_chegada = None  # arquivos/s (EWMA)
+        self.execucoes = 0
+        self.ciclos_pulados = 0
+        self.ultima_execucao = None
+        self.ultimos_arquivos = None
+        self.proxima_execucao = None
+        self._lock_fd = None
+        self._tarefa = None
+
+    def _limitar(self, intervalo):
+        return max(self.intervalo_min, min(self.intervalo_max, intervalo))
+
+    def registrar_ciclo(self, arquivos_novos, janela):
+        """Atualiza a taxa estimada e calcula o próximo intervalo"""
+        janela = max(janela, 1e-6)
+        taxa_observada = arquivos_novos / janela
+        if self.taxa_chegada is None:
+            self.taxa_chegada = taxa_observada
+        else:
+            self.taxa_chegada = self.alfa * taxa_observada + (1 - self.alfa) * self.taxa_chegada
+
+        if arquivos_novos == 0:
+            self.intervalo = self._limitar(self.intervalo * self.fator_backoff)
+        elif self.taxa_chegada > 0:
+            # Com chegadas, o intervalo nunca cresce: só encurta até mirar o alvo
+            self.intervalo = self._limitar(min(self.intervalo, self.arquivos_alvo / self.taxa_chegada))
+
+        self.ultimos_arquivos = arquivos_novos
+        return self.intervalo
+
+    def adquirir_lock(self):
+        """Tenta o lock exclusivo do agendador; só um worker o obtém"""
+        if fcntl is None:
+            return True
+        fd = os.open(get_lock_file_path(), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def liberar_lock(self):
+        if self._lock_fd is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    async def _loop(self):
+        inicio_janela = time.time()
+        while True:
+            self.proxima_execucao = time.time() + self.intervalo
+            await asyncio.sleep(self.intervalo)
+
+            arquivos_novos = 0
+            try:
+                resultado = await self.disparar()
+                if resultado is CICLO_PULADO:
+                    # Sem ciclo não há medida: a janela da taxa segue aberta até o próximo
+                    self.ciclos_pulados += 1
+                    logger.info(f"⏭️  Agendador: ciclo pulado; próximo em {self.intervalo:.0f}s")
+                    continue
+                arquivos_novos = ((resultado or {}).get("detalhes") or {}).get("arquivos_baixados_ftp", 0) or 0
+            except Exception as e:
+                logger.error(f"Erro na execução agendada: {e}")
+
+            agora = time.time()
+            intervalo = self.registrar_ciclo(arquivos_novos, agora - inicio_janela)
+            inicio_janela = agora
+            self.execucoes += 1
+            self.ultima_execucao = agora
+            logger.info(f"⏱️  Agendador: {arquivos_novos} arquivo(s) novo(s); próximo ciclo em {intervalo:.0f}s")
+
+    def iniciar(self):
+        """Inicia o loop se este worker obtiver o lock. Retorna True se iniciou"""
+        if not self.adquirir_lock():
+            logger.info("Agendador já ativo em outro worker; não será iniciado aqui")
+            return False
+        self._tarefa = asyncio.get_event_loop().create_task(self._loop())
+        logger.info(f"✓ Agendador iniciado (intervalo inicial: {self.intervalo:.0f}s)")
+        return True
+
+    async def parar(self):
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        self.liberar_lock()
+
+    def status(self):
+        return {
+            "ativo": self._tarefa is not None,
+            "intervalo_atual": round(self.intervalo, 1),
+            "taxa_chegada_arquivos_s": self.taxa_chegada,
+            "execucoes": self.execucoes,
+            "ciclos_pulados": self.ciclos_pulados,
+            "ultimos_arquivos": self.ultimos_arquivos,
+            "ultima_execucao": self.ultima_execucao,
+            "proxima_execucao": self.proxima_execucao
+        }
@@ -0,0 +1,193 @@
+# staging_store.py
+
+import io
+import os
+import time
+import shutil
+import threading
+from pathlib import Path
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class OrcamentoEsgotado(Exception):
+    """O orçamento de bytes não liberou espaço dentro do tempo de espera"""
+
+class OrcamentoBytes:
+    """
+    Orçamento de bytes compartilhado entre threads. reservar() bloqueia
+    (backpressure) até haver espaço ou o timeout expirar.
+    """
+
+    def __init__(self, nome, capacidade):
+        self.nome = nome
+        self.capacidade = capacidade
+        self.em_uso = 0
+        self.pico = 0
+        self._cond = threading.Condition()
+
+    def reservar(self, quantidade, timeout=None):
+        """Reserva bytes, esperando liberações. Retorna False se não couber a tempo"""
+        if quantidade > self.capacidade:
+            return False
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.em_uso + quantidade > self.capacidade:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            self._consumir(quantidade)
+            return True
+
+    def consumir(self, quantidade):
+        """Contabiliza bytes já gravados, sem esperar (ex.: arquivos extraídos)"""
+        with self._cond:
+            self._consumir(quantidade)
+
+    def _consumir(self, quantidade):
+        self.em_uso += quantidade
+        self.pico = max(self.pico, self.em_uso)
+
+    def liberar(self, quantidade):
+        with self._cond:
+            self.em_uso = max(0, self.em_uso - quantidade)
+            self._cond.notify_all()
+
+class ItemStaging:
+    """Um arquivo em staging: buffer em memória ou arquivo em disco"""
+
+    def __init__(self, store, nome, caminho_disco, em_memoria, reservado):
+        self.store = store
+        self.nome = nome
+        self.caminho_disco = caminho_disco
+        self.em_memoria = em_memoria
+        self.reservado = reservado
+        self.tamanho = 0
+        self._buffer = io.BytesIO() if em_memoria else None
+        self._liberado = False
+        try:
+            self._arquivo = None if em_memoria else open(caminho_disco, "wb")
+        except OSError:
+            # Sem o arquivo o item não existe: devolve a reserva já feita
+            self._arquivo = None
+            self.descartar()
+            raise
+
+    def write(self, bloco):
+        self.tamanho += len(bloco)
+        if self.em_memoria:
+            self._buffer.write(bloco)
+        else:
+            self._arquivo.write(bloco)
+
+    def fechar_escrita(self):
+        """Finaliza a escrita e ajusta a reserva ao tamanho real"""
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        orcamento = self.store.memoria if self.em_memoria else self.store.disco
+        if self.tamanho > self.reservado:
+            orcamento.consumir(self.tamanho - self.reservado)
+        elif self.tamanho < self.reservado:
+            orcamento.liberar(self.reservado - self.tamanho)
+        self.reservado = self.tamanho
+
+    def abrir_leitura(self):
+        """Arquivo binário para leitura (BytesIO ou arquivo em disco)"""
+        if self.em_memoria:
+            return io.BytesIO(self._buffer.getbuffer())
+        return open(self.caminho_disco, "rb")
+
+    def materializar(self):
+        """Garante que o conteúdo exista em caminho_disco (move da memória para o disco)"""
+        if not self.em_memoria:
+            return self.caminho_disco
+        self.store.disco.consumir(self.tamanho)
+        with open(self.caminho_disco, "wb") as f:
+            f.write(self._buffer.getbuffer())
+        self.store.memoria.liberar(self.reservado)
+        self._buffer = None
+        self.em_memoria = False
+        return self.caminho_disco
+
+    def descartar(self):
+        """Libera a reserva (e o buffer). O arquivo em disco, se existir, é responsabilidade de quem o removeu"""
+        if self._liberado:
+            return
+        self._liberado = True
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        if self.em_memoria:
+            self._buffer = None
+            self.store.memoria.liberar(self.reservado)
+        else:
+            self.store.disco.liberar(self.reservado)
+
+class StagingStore:
+    """
+    Staging híbrido: arquivos pequenos ficam em buffers na memória e os
+    grandes vão para disco, sob orçamentos globais de memória e de disco.
+    Quando o orçamento de disco se esgota, novas reservas esperam até
+    STAGING_WAIT_TIMEOUT segundos em vez de falhar com ENOSPC.
+    """
+
+    def __init__(self, pasta_base, orcamento_memoria=None, orcamento_disco=None,
+                 max_arquivo_memoria=None, timeout_espera=None):
+        orcamento_memoria = int(orcamento_memoria if orcamento_memoria is not None else os.getenv('STAGING_MEMORY_BUDGET', 32 * MB))
+        self.max_arquivo_memoria = int(max_arquivo_memoria if max_arquivo_memoria is not None else os.getenv('STAGING_MEMORY_FILE_MAX', 2 * MB))
+        self.timeout_espera = float(timeout_espera if timeout_espera is not None else os.getenv('STAGING_WAIT_TIMEOUT', 30))
+
+        if orcamento_disco is None:
+            orcamento_disco = os.getenv('STAGING_DISK_BUDGET')
+        if orcamento_disco is None:
+            # Padrão: espaço livre no filesystem menos uma margem de segurança
+            Path(pasta_base).mkdir(parents=True, exist_ok=True)
+            margem = int(os.getenv('STAGING_DISK_RESERVE', 64 * MB))
+            orcamento_disco = max(0, shutil.disk_usage(pasta_base).free - margem)
+
+        self.memoria = OrcamentoBytes("memoria", orcamento_memoria)
+        self.disco = OrcamentoBytes("disco", int(orcamento_disco))
+        self.adiados = 0
+
+    def reservar_disco(self, nome, quantidade, timeout=None):
+        """
+        Reserva 'quantidade' bytes do orçamento de disco para 'nome', esperando
+        até timeout segundos (padrão: STAGING_WAIT_TIMEOUT). Esperar só faz
+        sentido quando outra tarefa pode liberar espaço nesse meio tempo; quem
+        roda sozinho passa timeout=0. Levanta OrcamentoEsgotado se não couber.
+        """
+        timeout = self.timeout_espera if timeout is None else timeout
+        if not self.disco.reservar(quantidade, timeout=timeout):
+            raise OrcamentoEsgotado(
+                f"Sem espaço no orçamento de disco para '{nome}' ({quantidade} bytes; "
+                f"em uso {self.disco.em_uso} de {self.disco.capacidade})"
+            )
+
+    def criar_item(self, nome, caminho_disco, tamanho_previsto=None, timeout=None):
+        """
+        Reserva espaço e devolve um ItemStaging para escrita. Arquivos até
+        max_arquivo_memoria vão para memória se houver orçamento livre; os
+        demais esperam espaço em disco (ver reservar_disco). Levanta
+        OrcamentoEsgotado no timeout.
+        """
+        tamanho = tamanho_previsto or 0
+        if tamanho_previsto is not None and tamanho <= self.max_arquivo_memoria:
+            if self.memoria.reservar(tamanho, timeout=0):
+                return ItemStaging(self, nome, caminho_disco, em_memoria=True, reservado=tamanho)
+
+        self.reservar_disco(nome, tamanho, timeout=timeout)
+        return ItemStaging(self, nome, caminho_disco, em_memoria=False, reservado=tamanho)
+
+    def resumo(self):
+        return {
+            "pico_memoria": self.memoria.pico,
+            "pico_disco": self.disco.pico,
+            "orcamento_memoria": self.memoria.capacidade,
+            "orcamento_disco": self.disco.capacidade,
+            "arquivos_adiados": self.adiados
+        }
@@ -0,0 +1,241 @@
+# tracing.py
+
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ✅ Span ativo na thread/tarefa atual (propaga para filhos via contextvars)
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+
+_lock_exportacao = threading.Lock()
+
+def get_traces_dir():
+    """Retorna diretório onde os spans são exportados (JSONL)"""
+    traces_dir = os.getenv('TRACES_DIR')
+    if traces_dir:
+        return traces_dir
+    return os.path.join(tempfile.gettempdir(), "ftp_to_drive_traces")
+
+_TRACE_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+def get_traces_file_path(trace_id):
+    """Caminho do arquivo JSONL dos spans de um trace (um por execução); None se o ID não é válido"""
+    if not trace_id or not _TRACE_ID_VALIDO.match(str(trace_id)):
+        return None
+    return os.path.join(get_traces_dir(), f"{trace_id}.jsonl")
+
+def get_max_traces():
+    """Quantos arquivos de trace manter (TRACES_MAX_FILES, padrão 200): os mais antigos são apagados"""
+    try:
+        return max(1, int(os.getenv('TRACES_MAX_FILES', 200)))
+    except ValueError:
+        return 200
+
+def remover_traces_antigos():
+    """Antes de um trace novo: mantém os TRACES_MAX_FILES - 1 arquivos de trace mais recentes"""
+    try:
+        with os.scandir(get_traces_dir()) as entradas:
+            arquivos = [(e.stat().st_mtime, e.path) for e in entradas if e.is_file() and e.name.endswith(".jsonl")]
+    except FileNotFoundError:
+        return
+    excedentes = len(arquivos) - (get_max_traces() - 1)
+    if excedentes <= 0:
+        return
+    for _, caminho in sorted(arquivos)[:excedentes]:
+        try:
+            os.remove(caminho)
+        except OSError as e:
+            logger.warning(f"Erro ao remover trace antigo {caminho}: {e}")
+
+class Span:
+    """Intervalo de tempo nomeado, com atributos, pertencente a um trace"""
+
+    def __init__(self, nome, trace_id, parent_id=None, atributos=None):
+        self.nome = nome
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.atributos = dict(atributos or {})
+        self.inicio = time.time()
+        self._inicio_perf = time.perf_counter()
+        self.fim = None
+        self.duracao = None
+        self.status = "ok"
+        self.erro = None
+
+    def definir(self, **atributos):
+        """Adiciona/atualiza atributos do span (bytes, arquivo, http_status...)"""
+        self.atributos.update(atributos)
+
+    def finalizar(self):
+        self.duracao = round(time.perf_counter() - self._inicio_perf, 6)
+        self.fim = self.inicio + self.duracao
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "nome": self.nome,
+            "inicio": self.inicio,
+            "fim": self.fim,
+            "duracao": self.duracao,
+            "status": self.status,
+            "erro": self.erro,
+            "atributos": self.atributos
+        }
+
+def exportar_span(span_obj):
+    """Anexa o span finalizado ao arquivo JSONL do seu trace"""
+    try:
+        caminho = get_traces_file_path(span_obj.trace_id)
+        if caminho is None:
+            logger.warning(f"Span '{span_obj.nome}' não exportado: trace_id inválido ({span_obj.trace_id!r})")
+            return
+        linha = json.dumps(span_obj.to_dict(), ensure_ascii=False, default=str)
+        with _lock_exportacao:
+            os.makedirs(get_traces_dir(), exist_ok=True)
+            with open(caminho, "a", encoding="utf-8") as f:
+                f.write(linha + "\n")
+    except Exception as e:
+        # Tracing nunca deve derrubar o processamento
+        logger.warning(f"Erro ao exportar span '{span_obj.nome}': {e}")
+
+def span_atual():
+    """Retorna o span ativo (ou None se não houver trace em andamento)"""
+    return _span_atual.get()
+
+@contextmanager
+def span(nome, **atributos):
+    """
+    Abre um span filho do span ativo. Sem trace ativo, não registra nada
+    (o bloco roda normalmente e recebe um span descartável).
+    """
+    pai = _span_atual.get()
+    if pai is None:
+        yield Span(nome, trace_id=None, atributos=atributos)
+        return
+
+    novo = Span(nome, trace_id=pai.trace_id, parent_id=pai.span_id, atributos=atributos)
+    token = _span_atual.set(novo)
+    try:
+        yield novo
+    except BaseException as e:
+        novo.status = "erro"
+        novo.erro = str(e)
+        raise
+    finally:
+        _span_atual.reset(token)
+        novo.finalizar()
+        exportar_span(novo)
+
+@contextmanager
+def trace(trace_id, nome, **atributos):
+    """Abre o span raiz de um trace (um por tarefa do /process, cada um no seu arquivo)"""
+    with _lock_exportacao:
+        remover_traces_antigos()
+    raiz = Span(nome, trace_id=trace_id, atributos=atributos)
+    token = _span_atual.set(raiz)
+    try:
+        yield raiz
+    except BaseException as e:
+        raiz.status = "erro"
+        raiz.erro = str(e)
+        raise
+    finally:
+        _span_atual.reset(token)
+        raiz.finalizar()
+        exportar_span(raiz)
+
+def executar_com_trace(trace_id, nome, func, *args, **kwargs):
+    """Executa func dentro de um span raiz (usado nas threads do executor)"""
+    with trace(trace_id, nome):
+        return func(*args, **kwargs)
+
+def propagar(func):
+    """
+    Envolve func para rodar em outra thread (pool) mantendo como pai o span
+    ativo no momento da chamada a propagar()
+    """
+    pai = _span_atual.get()
+
+    def executar(*args, **kwargs):
+        token = _span_atual.set(pai)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _span_atual.reset(token)
+    return executar
+
+def carregar_spans(trace_id):
+    """Lê todos os spans de um trace (só o arquivo dele)"""
+    caminho = get_traces_file_path(trace_id)
+    spans = []
+    if caminho is None or not os.path.exists(caminho):
+        return spans
+
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                continue
+            if registro.get("trace_id") == trace_id:
+                spans.append(registro)
+    return spans
+
+def montar_arvore(spans):
+    """Monta a árvore de spans (filhos ordenados por início)"""
+    por_id = {s["span_id"]: dict(s, filhos=[]) for s in spans}
+    raizes = []
+    for s in por_id.values():
+        pai = por_id.get(s.get("parent_id"))
+        if pai is not None:
+            pai["filhos"].append(s)
+        else:
+            raizes.append(s)
+
+    for s in por_id.values():
+        s["filhos"].sort(key=lambda f: f.get("inicio") or 0)
+    raizes.sort(key=lambda r: r.get("inicio") or 0)
+    return raizes
+
+def caminho_critico(raiz):
+    """
+    Segue, a partir da raiz, o filho que termina por último em cada nível:
+    é a cadeia de spans que determinou a duração total.
+    """
+    caminho = []
+    no = raiz
+    while no is not None:
+        caminho.append({"nome": no["nome"], "duracao": no.get("duracao"), "atributos": no.get("atributos", {})})
+        filhos = [f for f in no.get("filhos", []) if f.get("fim") is not None]
+        no = max(filhos, key=lambda f: f["fim"]) if filhos else None
+    return caminho
+
+def obter_trace(trace_id):
+    """Retorna árvore e caminho crítico de um trace, ou None se não existir"""
+    spans = carregar_spans(trace_id)
+    if not spans:
+        return None
+
+    raizes = montar_arvore(spans)
+    return {
+        "trace_id": trace_id,
+        "total_spans": len(spans),
+        "arvore": raizes,
+        "caminho_critico": caminho_critico(raizes[0]) if raizes else []
+    }
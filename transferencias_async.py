@@ -0,0 +1,139 @@
+# transferencias_async.py
+
+import os
+import asyncio
+import threading
+import weakref
+import logging
+import profiling
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def async_habilitado():
+    """Transferências FTP/Drive em corrotinas num event loop dedicado (ASYNC_TRANSFERS)"""
+    return os.getenv('ASYNC_TRANSFERS', 'false').strip().lower() in ("1", "true", "sim", "yes", "on")
+
+def get_concorrencia_drive():
+    """Uploads simultâneos ao Drive no modo assíncrono (DRIVE_ASYNC_CONCURRENCY)"""
+    try:
+        return max(1, int(os.getenv('DRIVE_ASYNC_CONCURRENCY', 8)))
+    except ValueError:
+        return 8
+
+_loop = None
+_thread_loop = None
+_semaforos = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def _loop_transferencias():
+    """
+    Event loop dedicado às transferências, numa thread própria, criado na
+    primeira execução e compartilhado por todas as execuções do processo.
+    Fica fora do loop do servidor (FastAPI): transferências grandes não
+    atrasam as respostas dos endpoints.
+    """
+    global _loop, _thread_loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            pronto = threading.Event()
+
+            def _rodar():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(pronto.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_rodar, name="transferencias-async", daemon=True)
+            thread.start()
+            pronto.wait()
+            _loop, _thread_loop = loop, thread
+        return _loop
+
+def encerrar():
+    """Para o loop das transferências (encerramento da aplicação)"""
+    global _loop, _thread_loop
+    with _lock:
+        loop, thread = _loop, _thread_loop
+        _loop = _thread_loop = None
+    if loop is None:
+        return
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    if not thread.is_alive():
+        loop.close()
+
+def executar(corrotina_func, *args, **kwargs):
+    """
+    Executa corrotina_func(*args, **kwargs) a partir de código síncrono (thread
+    do executor) no loop dedicado às transferências e devolve o resultado.
+    As execuções simultâneas compartilham o loop, e com ele semáforos e
+    limites. O contexto (span atual do tracing, perfil da execução)
+    acompanha a corrotina, e o loop entra no profiler da execução enquanto
+    ela roda.
+    """
+    loop = _loop_transferencias()
+    if threading.current_thread() is _thread_loop:
+        raise RuntimeError("executar() chamado de dentro do loop de transferências; use await diretamente")
+
+    async def _na_execucao():
+        with profiling.thread_da_execucao():
+            return await corrotina_func(*args, **kwargs)
+    return asyncio.run_coroutine_threadsafe(_na_execucao(), loop).result()
+
+class LimiteAjustavel:
+    """
+    Semáforo assíncrono cujo limite pode mudar com transferências em
+    andamento: quem já entrou continua contado e novas entradas esperam até
+    o uso ficar abaixo do limite corrente. Substituir o semáforo ao mudar o
+    limite deixaria as transferências do antigo fora da conta.
+    """
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.em_uso = 0
+        self._esperando = []
+
+    def ajustar(self, limite):
+        self.limite = limite
+        self._acordar()
+
+    def _acordar(self):
+        # Todos reavaliam a condição; os que não couberem voltam a esperar
+        esperando, self._esperando = self._esperando, []
+        for futuro in esperando:
+            if not futuro.done():
+                futuro.set_result(None)
+
+    async def __aenter__(self):
+        while self.em_uso >= self.limite:
+            futuro = asyncio.get_running_loop().create_future()
+            self._esperando.append(futuro)
+            try:
+                await futuro
+            finally:
+                if futuro in self._esperando:
+                    self._esperando.remove(futuro)
+        self.em_uso += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.em_uso -= 1
+        self._acordar()
+
+def semaforo(nome, limite):
+    """
+    Limite nomeado do loop corrente (LimiteAjustavel): conta as
+    transferências simultâneas de todas as execuções que compartilham o loop
+    de transferências. Um limite diferente (outra execução, autotune) é
+    aplicado ao mesmo contador.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        por_nome = _semaforos.setdefault(loop, {})
+        atual = por_nome.get(nome)
+        if atual is None:
+            atual = por_nome[nome] = LimiteAjustavel(limite)
+        elif atual.limite != limite:
+            atual.ajustar(limite)
+        return atual
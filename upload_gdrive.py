@@ -11,9 +11,14 @@ from google.oauth2.service_account import Credentials as ServiceAccountCredentia
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload, DEFAULT_CHUNK_SIZE
 from dotenv import load_dotenv
 import logging
+import tracing
+import logging_setup
+import banda
+import cota_drive
+import perfis
 
 load_dotenv()
 
@@ -29,6 +34,23 @@ NEW_OWNER_EMAIL = os.getenv('NEW_OWNER_EMAIL_ENV_VAR_NAME') # Use o nome exato d
 if not NEW_OWNER_EMAIL:
     logger.warning("Variável de ambiente para NEW_OWNER_EMAIL não está definida! A transferência de propriedade será pulada.")
 
+# Granularidade do upload resumable exigida pela API
+BLOCO_RESUMABLE = 256 * 1024
+
+def get_tamanho_bloco_upload():
+    """
+    Tamanho de cada PUT do upload resumable. Com o limitador de banda do
+    Drive ativo (DRIVE_RATE_LIMIT) usa blocos de DRIVE_UPLOAD_CHUNK bytes
+    (padrão 1 MiB, múltiplo de 256 KiB) para o limite se distribuir ao longo
+    do arquivo; sem limite mantém o bloco padrão do MediaIoBaseUpload
+    (100 MB), evitando chamadas extras. Cada bloco é um upload.bloco no
+    orçamento do Drive.
+    """
+    if not banda.limitador("drive").taxa:
+        return DEFAULT_CHUNK_SIZE
+    tamanho = int(os.getenv('DRIVE_UPLOAD_CHUNK', 1024 * 1024))
+    return max(1, tamanho // BLOCO_RESUMABLE) * BLOCO_RESUMABLE
+
 # ✅ CORREÇÃO: Usar diretórios temporários para Vercel
 def get_temp_credentials_dir():
     """Retorna diretório temporário para credenciais"""
@@ -51,8 +73,13 @@ def get_drive_service():
     Obtém o serviço do Google Drive usando OAuth ou Service Account
     Prioriza Service Account (para produção) e fallback para OAuth (desenvolvimento)
     """
-    # ✅ Tentar primeiro com Service Account (para produção/Vercel)
-    google_credentials_env = os.getenv('GOOGLE_CREDENTIALS')
+    with tracing.span("drive.token"):
+        return _get_drive_service()
+
+def _get_drive_service():
+    # ✅ Tentar primeiro com Service Account (para produção/Vercel), das credenciais do perfil da execução
+    perfil = perfis.atual()
+    google_credentials_env = perfil.credenciais()
     if google_credentials_env:
         try:
             logger.info("Tentando autenticação com Service Account (variável de ambiente)")
@@ -64,10 +91,15 @@ def get_drive_service():
             logger.info("✓ Serviço do Google Drive criado com Service Account")
             return drive_service_obj, creds
         except json.JSONDecodeError as e:
-            logger.error(f"Erro ao decodificar GOOGLE_CREDENTIALS JSON: {e}")
+            logger.error(f"Erro ao decodificar {perfil.credenciais_env} JSON: {e}")
         except Exception as e:
             logger.error(f"Erro ao criar Service Account: {e}")
 
+    # ✅ Perfis nomeados não usam o token OAuth local (seria a conta de outro cliente)
+    if not perfil.padrao:
+        logger.error(f"Credenciais do perfil '{perfil.nome}' indisponíveis ({perfil.credenciais_env})")
+        return None, None
+
     # ✅ Fallback para OAuth (desenvolvimento local)
     logger.info("Tentando autenticação OAuth (desenvolvimento local)")
     return get_drive_service_oauth()
@@ -159,7 +191,7 @@ def get_drive_service_oauth():
         logger.error(f'Erro inesperado ao construir serviço Drive: {e}')
         return None, None
 
-def clear_drive_folder(service, folder_id, folder_name="pasta"):
+def clear_drive_folder(service, folder_id, folder_name="pasta", subpastas=None):
     """
     Remove todos os arquivos de uma pasta específica no Google Drive
     
@@ -167,6 +199,8 @@ def clear_drive_folder(service, folder_id, folder_name="pasta"):
         service: Serviço do Google Drive
         folder_id: ID da pasta no Drive para limpar
         folder_name: Nome da pasta (para logs)
+        subpastas: {ID: nome} das subpastas gerenciadas (DRIVE_SUBFOLDERS) cujo
+            conteúdo também é removido; as demais subpastas são mantidas
         
     Returns:
         dict: Resultado da limpeza
@@ -192,12 +226,13 @@ def clear_drive_folder(service, folder_id, folder_name="pasta"):
             try:
                 # Buscar arquivos na pasta específica
                 query = f"'{folder_id}' in parents and trashed=false"
-                results = service.files().list(
-                    q=query,
-                    pageSize=100,  # Processar em lotes de 100
-                    fields="nextPageToken, files(id, name, mimeType)",
-                    pageToken=page_token
-                ).execute()
+                with tracing.span("drive.files.list", pasta=folder_name):
+                    results = service.files().list(
+                        q=query,
+                        pageSize=100,  # Processar em lotes de 100
+                        fields="nextPageToken, files(id, name, mimeType)",
+                        pageToken=page_token
+                    ).execute()
 
                 files = results.get('files', [])
                 total_arquivos += len(files)
@@ -210,22 +245,32 @@ def clear_drive_folder(service, folder_id, folder_name="pasta"):
                 logger.info(f"📁 Encontrados {len(files)} arquivo(s) na {folder_name} (página atual)")
 
                 # ✅ Remover cada arquivo
+                nivel_arquivo = logging_setup.nivel_por_arquivo()
                 for file_item in files:
                     file_id = file_item.get('id')
                     file_name = file_item.get('name', 'Nome desconhecido')
                     mime_type = file_item.get('mimeType', '')
 
                     try:
-                        # Verificar se é uma pasta (não remover subpastas)
+                        # Verificar se é uma pasta (não remover subpastas; as gerenciadas são esvaziadas)
                         if mime_type == 'application/vnd.google-apps.folder':
-                            logger.info(f"⏭️  Pulando subpasta: '{file_name}'")
+                            if subpastas and file_id in subpastas:
+                                resultado_subpasta = clear_drive_folder(service, file_id, f"{folder_name}/{file_name}")
+                                arquivos_removidos += resultado_subpasta.get("arquivos_removidos", 0)
+                                arquivos_com_erro += resultado_subpasta.get("arquivos_com_erro", 0)
+                                total_arquivos += resultado_subpasta.get("total_encontrado", 0)
+                            else:
+                                logger.debug("⏭️  Pulando subpasta: '%s'", file_name)
                             continue
 
                         # Remover arquivo
-                        service.files().delete(fileId=file_id).execute()
+                        with tracing.span("drive.files.delete", arquivo=file_name):
+                            service.files().delete(fileId=file_id).execute()
                         arquivos_removidos += 1
-                        logger.info(f"🗑️  Removido: '{file_name}' (ID: {file_id})")
+                        logger.log(nivel_arquivo, "🗑️  Removido: '%s' (ID: %s)", file_name, file_id)
 
+                    except cota_drive.OrcamentoEsgotado:
+                        raise
                     except HttpError as e:
                         logger.error(f"❌ Erro HTTP ao remover '{file_name}': {e.resp.status} - {e.content.decode()}")
                         arquivos_com_erro += 1
@@ -238,6 +283,9 @@ def clear_drive_folder(service, folder_id, folder_name="pasta"):
                 if not page_token:
                     break
 
+            except cota_drive.OrcamentoEsgotado as e:
+                logger.warning(f"⏸️  Limpeza da {folder_name} interrompida: {e}")
+                break
             except HttpError as e:
                 logger.error(f"❌ Erro HTTP ao listar arquivos da {folder_name}: {e.resp.status} - {e.content.decode()}")
                 break
@@ -265,42 +313,108 @@ def clear_drive_folder(service, folder_id, folder_name="pasta"):
             "erro": str(e)
         }
 
-def clear_main_drive_folder(drive_service):
+def clear_main_drive_folder(drive_service, subpastas=None):
     """
     Limpa a pasta principal do Google Drive
     
     Args:
         drive_service: Serviço do Google Drive
+        subpastas: {ID: nome} das subpastas gerenciadas a esvaziar também
         
     Returns:
         dict: Resultado da limpeza
     """
-    target_folder_id = os.getenv('TARGET_FOLDER_ID')
+    target_folder_id = perfis.atual().pasta_principal
     if not target_folder_id:
         logger.error("TARGET_FOLDER_ID não definido")
         return {"arquivos_removidos": 0, "erro": "TARGET_FOLDER_ID não definido"}
 
-    return clear_drive_folder(drive_service, target_folder_id, "pasta principal")
+    return clear_drive_folder(drive_service, target_folder_id, "pasta principal", subpastas)
 
-def clear_devolucaoar_drive_folder(drive_service):
+def clear_devolucaoar_drive_folder(drive_service, subpastas=None):
     """
     Limpa a pasta de arquivo DevolucaoAR do Google Drive
     
     Args:
         drive_service: Serviço do Google Drive
+        subpastas: {ID: nome} das subpastas gerenciadas a esvaziar também
         
     Returns:
         dict: Resultado da limpeza
     """
-    target_folder_id = os.getenv('TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE')
+    target_folder_id = perfis.atual().pasta_devolucaoar
     if not target_folder_id:
         logger.error("TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE não definido")
         return {"arquivos_removidos": 0, "erro": "TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE não definido"}
 
-    return clear_drive_folder(drive_service, target_folder_id, "pasta DevolucaoAR")
+    return clear_drive_folder(drive_service, target_folder_id, "pasta DevolucaoAR", subpastas)
+
+def transferir_propriedade(service, file_id, file_name_uploaded):
+    """
+    Transfere a propriedade do arquivo para o novo dono do perfil da execução
+    (NEW_OWNER_EMAIL_ENV_VAR_NAME no padrão) ou, se não for
+    possível, compartilha como editor. Falhas aqui não invalidam o upload.
+    """
+    nivel_arquivo = logging_setup.nivel_por_arquivo()
+    novo_dono = perfis.atual().novo_dono
+    # --- INÍCIO DA LÓGICA DE TRANSFERÊNCIA/COMPARTILHAMENTO ---
+    if novo_dono:
+        logger.debug("Tentando transferir propriedade do arquivo '%s' (ID: %s) para %s", file_name_uploaded, file_id, novo_dono)
+        try:
+            permission_body = {
+                'role': 'owner',
+                'type': 'user',
+                'emailAddress': novo_dono
+            }
+            with tracing.span("drive.permissions.create", arquivo=file_name_uploaded, role="owner") as sp_perm:
+                try:
+                    service.permissions().create(
+                        fileId=file_id,
+                        body=permission_body,
+                        transferOwnership=True,
+                        # sendNotificationEmail=False, # Opcional
+                        supportsAllDrives=True # Boa prática
+                    ).execute()
+                    sp_perm.definir(http_status=200)
+                except HttpError as e_perm:
+                    sp_perm.definir(http_status=e_perm.resp.status)
+                    raise
+            logger.log(nivel_arquivo, "✓ Propriedade do arquivo '%s' transferida para %s", file_name_uploaded, novo_dono)
+        
+        except HttpError as e_owner:
+            logger.log(nivel_arquivo, "Falha ao transferir propriedade para %s. Erro: %s - %s", novo_dono, e_owner.resp.status, e_owner.content.decode())
+            logger.debug("Tentando compartilhar '%s' (ID: %s) com %s como editor (writer)...", file_name_uploaded, file_id, novo_dono)
+            try:
+                editor_permission_body = {
+                    'role': 'writer', # Papel de editor
+                    'type': 'user',
+                    'emailAddress': novo_dono
+                }
+                with tracing.span("drive.permissions.create", arquivo=file_name_uploaded, role="writer") as sp_perm:
+                    try:
+                        service.permissions().create(
+                            fileId=file_id,
+                            body=editor_permission_body,
+                            # sendNotificationEmail=False, # Opcional
+                            supportsAllDrives=True
+                        ).execute()
+                        sp_perm.definir(http_status=200)
+                    except HttpError as e_perm:
+                        sp_perm.definir(http_status=e_perm.resp.status)
+                        raise
+                logger.log(nivel_arquivo, "✓ Arquivo '%s' compartilhado com %s como editor.", file_name_uploaded, novo_dono)
+            except HttpError as e_writer:
+                logger.error(f"Falha ao compartilhar como editor com {novo_dono}. Erro: {e_writer.resp.status} - {e_writer.content.decode()}")
+                # Mesmo se o compartilhamento falhar, o upload foi um sucesso, então retorne o file_id
+            except Exception as e_writer_generic:
+                logger.error(f"Erro inesperado ao compartilhar como editor com {novo_dono}: {e_writer_generic}")
+        except Exception as e_owner_generic:
+            logger.error(f"Erro inesperado ao tentar transferir propriedade para {novo_dono}: {e_owner_generic}")
+    else:
+        logger.debug("NEW_OWNER_EMAIL não definido. Propriedade não será transferida.")
+    # --- FIM DA LÓGICA DE TRANSFERÊNCIA/COMPARTILHAMENTO ---
 
-def upload_file_to_folder(service, local_file_path, folder_id, drive_filename=None):
-    logger.info(f"NEW_OWNER_EMAIL: {NEW_OWNER_EMAIL}")
+def upload_file_to_folder(service, local_file_path, folder_id, drive_filename=None, metadados=None):
     """
     Faz upload de um arquivo para uma pasta específica no Google Drive
     e tenta transferir a propriedade ou compartilhar como editor.
@@ -310,10 +424,12 @@ def upload_file_to_folder(service, local_file_path, folder_id, drive_filename=No
         local_file_path: Caminho do arquivo local
         folder_id: ID da pasta no Drive
         drive_filename: Nome do arquivo no Drive (opcional)
+        metadados: dict (opcional) preenchido com id, name e md5Checksum devolvidos pelo Drive
 
     Returns:
         str: ID do arquivo no Drive se sucesso, None se falha
     """
+    logger.debug("NEW_OWNER_EMAIL: %s", perfis.atual().novo_dono)
     if not service:
         logger.error("Serviço Drive não fornecido para upload")
         return None
@@ -337,68 +453,40 @@ def upload_file_to_folder(service, local_file_path, folder_id, drive_filename=No
     file_id = None # Inicializa file_id aqui para o bloco finally
 
     try:
-        logger.info(f"Iniciando upload: '{os.path.basename(local_file_path)}' -> '{drive_filename}'")
-        media = MediaFileUpload(local_file_path, mimetype=mimetype, resumable=True)
-        
-        file_obj = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id, name' # Pedir id e name de volta
-        ).execute()
+        logger.debug("Iniciando upload: '%s' -> '%s'", os.path.basename(local_file_path), drive_filename)
+        with open(local_file_path, "rb") as arquivo_local:
+            # Corpo do upload passa pelo limitador de banda de saída (Drive), em
+            # blocos pequenos: com o bloco padrão (100 MB) o limitador dormiria o
+            # arquivo inteiro de uma vez e o envio sairia sem limite em seguida
+            media = MediaIoBaseUpload(banda.LeitorLimitado(arquivo_local, banda.limitador("drive")),
+                                      mimetype=mimetype, chunksize=get_tamanho_bloco_upload(), resumable=True)
+
+            with tracing.span("drive.files.create", arquivo=drive_filename,
+                              bytes=os.path.getsize(local_file_path)) as sp_upload:
+                try:
+                    file_obj = service.files().create(
+                        body=file_metadata,
+                        media_body=media,
+                        fields='id, name, md5Checksum' # Pedir id, name e MD5 de volta (sem chamada extra)
+                    ).execute()
+                    sp_upload.definir(http_status=200)
+                except HttpError as e_upload:
+                    sp_upload.definir(http_status=e_upload.resp.status)
+                    raise
 
         file_id = file_obj.get('id')
+        if metadados is not None:
+            metadados.update(file_obj)
         file_name_uploaded = file_obj.get('name') # Nome como foi salvo no Drive
 
         if not file_id:
             logger.error(f"Falha ao obter ID do arquivo '{file_name_uploaded}' após upload.")
             return None
             
-        logger.info(f"✓ Upload concluído: '{file_name_uploaded}' (ID: {file_id})")
+        nivel_arquivo = logging_setup.nivel_por_arquivo()
+        logger.log(nivel_arquivo, "✓ Upload concluído: '%s' (ID: %s)", file_name_uploaded, file_id)
 
-        # --- INÍCIO DA LÓGICA DE TRANSFERÊNCIA/COMPARTILHAMENTO ---
-        if NEW_OWNER_EMAIL:
-            logger.info(f"Tentando transferir propriedade do arquivo '{file_name_uploaded}' (ID: {file_id}) para {NEW_OWNER_EMAIL}")
-            try:
-                permission_body = {
-                    'role': 'owner',
-                    'type': 'user',
-                    'emailAddress': NEW_OWNER_EMAIL
-                }
-                service.permissions().create(
-                    fileId=file_id,
-                    body=permission_body,
-                    transferOwnership=True,
-                    # sendNotificationEmail=False, # Opcional
-                    supportsAllDrives=True # Boa prática
-                ).execute()
-                logger.info(f"✓ Propriedade do arquivo '{file_name_uploaded}' transferida para {NEW_OWNER_EMAIL}")
-            
-            except HttpError as e_owner:
-                logger.warning(f"Falha ao transferir propriedade para {NEW_OWNER_EMAIL}. Erro: {e_owner.resp.status} - {e_owner.content.decode()}")
-                logger.info(f"Tentando compartilhar '{file_name_uploaded}' (ID: {file_id}) com {NEW_OWNER_EMAIL} como editor (writer)...")
-                try:
-                    editor_permission_body = {
-                        'role': 'writer', # Papel de editor
-                        'type': 'user',
-                        'emailAddress': NEW_OWNER_EMAIL
-                    }
-                    service.permissions().create(
-                        fileId=file_id,
-                        body=editor_permission_body,
-                        # sendNotificationEmail=False, # Opcional
-                        supportsAllDrives=True
-                    ).execute()
-                    logger.info(f"✓ Arquivo '{file_name_uploaded}' compartilhado com {NEW_OWNER_EMAIL} como editor.")
-                except HttpError as e_writer:
-                    logger.error(f"Falha ao compartilhar como editor com {NEW_OWNER_EMAIL}. Erro: {e_writer.resp.status} - {e_writer.content.decode()}")
-                    # Mesmo se o compartilhamento falhar, o upload foi um sucesso, então retorne o file_id
-                except Exception as e_writer_generic:
-                    logger.error(f"Erro inesperado ao compartilhar como editor com {NEW_OWNER_EMAIL}: {e_writer_generic}")
-            except Exception as e_owner_generic:
-                logger.error(f"Erro inesperado ao tentar transferir propriedade para {NEW_OWNER_EMAIL}: {e_owner_generic}")
-        else:
-            logger.warning("NEW_OWNER_EMAIL não definido. Propriedade não será transferida.")
-        # --- FIM DA LÓGICA DE TRANSFERÊNCIA/COMPARTILHAMENTO ---
+        transferir_propriedade(service, file_id, file_name_uploaded)
 
         return file_id
 
@@ -409,6 +497,73 @@ def upload_file_to_folder(service, local_file_path, folder_id, drive_filename=No
         logger.error(f'Erro inesperado no upload "{drive_filename}": {e}')
         return None
 
+def copy_file_to_folder(service, file_id, folder_id, drive_filename, metadados=None):
+    """
+    Copia no servidor um arquivo já existente no Drive (files().copy), sem
+    enviar o conteúdo novamente, e aplica a mesma transferência de propriedade.
+
+    Returns:
+        str: ID da cópia se sucesso, None se falha
+    """
+    try:
+        with tracing.span("drive.files.copy", arquivo=drive_filename) as sp_copy:
+            try:
+                file_obj = service.files().copy(
+                    fileId=file_id,
+                    body={'name': drive_filename, 'parents': [folder_id]},
+                    fields='id, name, md5Checksum',
+                    supportsAllDrives=True
+                ).execute()
+                sp_copy.definir(http_status=200)
+            except HttpError as e_copy:
+                sp_copy.definir(http_status=e_copy.resp.status)
+                raise
+
+        novo_id = file_obj.get('id')
+        if metadados is not None:
+            metadados.update(file_obj)
+        if not novo_id:
+            return None
+        logger.log(logging_setup.nivel_por_arquivo(), "✓ Cópia no Drive: '%s' (ID: %s)", drive_filename, novo_id)
+        transferir_propriedade(service, novo_id, drive_filename)
+        return novo_id
+
+    except HttpError as e:
+        logger.warning(f'Erro HTTP ao copiar "{drive_filename}" no Drive: {e.resp.status}')
+        return None
+    except Exception as e:
+        logger.warning(f'Erro inesperado ao copiar "{drive_filename}" no Drive: {e}')
+        return None
+
+def get_file_metadata(service, file_id):
+    """
+    Consulta um arquivo do Drive (files().get) para conferir se ele ainda
+    existe, se está na lixeira e qual o seu MD5.
+
+    Returns:
+        dict: id, trashed e md5Checksum se sucesso, None se falha (inclusive 404)
+    """
+    try:
+        with tracing.span("drive.files.get", arquivo_id=file_id) as sp_get:
+            try:
+                file_obj = service.files().get(
+                    fileId=file_id,
+                    fields='id, trashed, md5Checksum',
+                    supportsAllDrives=True
+                ).execute()
+                sp_get.definir(http_status=200)
+            except HttpError as e_get:
+                sp_get.definir(http_status=e_get.resp.status)
+                raise
+        return file_obj
+
+    except HttpError as e:
+        logger.warning(f'Erro HTTP ao consultar o arquivo {file_id} no Drive: {e.resp.status}')
+        return None
+    except Exception as e:
+        logger.warning(f'Erro inesperado ao consultar o arquivo {file_id} no Drive: {e}')
+        return None
+
 def test_drive_connection():
     """Testa a conexão com o Google Drive"""
     try:
@@ -439,7 +594,7 @@ def upload_files_to_drive(pasta_arquivos, drive_service):
     Returns:
         dict: Resultado do upload
     """
-    target_folder_id = os.getenv('TARGET_FOLDER_ID')
+    target_folder_id = perfis.atual().pasta_principal
     if not target_folder_id:
         logger.error("TARGET_FOLDER_ID não definido")
         return {"arquivos_enviados": 0, "erro": "TARGET_FOLDER_ID não definido"}
@@ -482,7 +637,7 @@ def upload_devolucaoar_files_to_drive(lista_arquivos, drive_service):
     Returns:
         dict: Resultado do upload
     """
-    target_folder_id = os.getenv('TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE')
+    target_folder_id = perfis.atual().pasta_devolucaoar
     if not target_folder_id:
         logger.error("TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE não definido")
         return {"arquivos_enviados": 0, "erro": "TARGET_FOLDER_ID_DEVOLUCAOAR_ARCHIVE não definido"}
@@ -0,0 +1,192 @@
+# zip_extractor.py
+
+import os
+import shutil
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import integridade
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 1024 * 1024
+
+class ZipInseguro(Exception):
+    """Membro do ZIP tentaria gravar fora da pasta de destino (zip-slip)"""
+
+def get_max_workers():
+    """Número de processos de extração (ZIP_WORKERS; padrão: núcleos disponíveis)"""
+    return max(1, int(os.getenv('ZIP_WORKERS', os.cpu_count() or 1)))
+
+def get_min_membros_paralelo():
+    """Abaixo deste número de membros a extração é feita no próprio processo"""
+    return int(os.getenv('ZIP_PARALLEL_MIN_MEMBERS', 64))
+
+def contexto_processos():
+    """
+    Contexto multiprocessing dos workers: forkserver (os workers nascem de um
+    processo limpo, sem herdar as threads e locks do servidor, como faria o
+    fork); spawn onde forkserver não existe
+    """
+    metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(metodo)
+
+class PoolExtracao:
+    """
+    Pool de processos de extração compartilhado pela execução: criado na
+    primeira extração paralela e reaproveitado pelos ZIPs seguintes (iniciar
+    workers com forkserver custa caro). Use como context manager; se um
+    worker morrer, o pool quebrado é descartado e recriado na próxima
+    extração.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or get_max_workers()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=contexto_processos())
+            return self._executor
+
+    def descartar(self, executor):
+        """Descarta um executor quebrado (BrokenProcessPool)"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def fechar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+def caminho_seguro(pasta_destino, nome_membro):
+    """
+    Resolve o caminho de destino de um membro, recusando caminhos absolutos,
+    letras de unidade e '..' que escapariam da pasta de destino.
+    """
+    nome = nome_membro.replace("\\", "/")
+    partes = [p for p in nome.split("/") if p not in ("", ".")]
+    if nome.startswith("/") or ".." in partes or (partes and ":" in partes[0]):
+        raise ZipInseguro(f"Caminho inseguro no ZIP: '{nome_membro}'")
+    base = os.path.abspath(pasta_destino)
+    destino = os.path.normpath(os.path.join(base, *partes))
+    if destino != base and not destino.startswith(base + os.sep):
+        raise ZipInseguro(f"Caminho inseguro no ZIP: '{nome_membro}'")
+    return destino
+
+def tamanho_descompactado(origem_zip):
+    """Soma dos tamanhos descompactados dos membros, lida do diretório central (sem extrair)"""
+    with zipfile.ZipFile(origem_zip, 'r') as zip_ref:
+        return sum(info.file_size for info in zip_ref.infolist())
+
+def _extrair_membros(zip_ref, membros, pasta_destino):
+    """
+    Extrai os membros informados (ZipInfo ou nomes). Ler cada membro até o
+    fim faz o zipfile conferir o CRC-32 (BadZipFile em caso de divergência);
+    o MD5 é calculado na mesma passada.
+    Retorna {nome_membro: md5} dos arquivos extraídos.
+    """
+    digests = {}
+    pastas_criadas = set()
+    for membro in membros:
+        info = membro if isinstance(membro, zipfile.ZipInfo) else zip_ref.getinfo(membro)
+        destino = caminho_seguro(pasta_destino, info.filename)
+        pasta = destino if info.is_dir() else os.path.dirname(destino)
+        if pasta not in pastas_criadas:
+            os.makedirs(pasta, exist_ok=True)
+            pastas_criadas.add(pasta)
+        if info.is_dir():
+            continue
+        with zip_ref.open(info) as origem, open(destino, "wb") as saida:
+            hash_fluxo = integridade.HashEmFluxo(saida)
+            shutil.copyfileobj(origem, hash_fluxo, TAMANHO_BLOCO)
+        digests[info.filename] = hash_fluxo.hexdigest()
+    return digests
+
+def _worker_extrair(caminho_zip, nomes, pasta_destino):
+    """Executado em cada processo: abre o próprio handle do ZIP"""
+    with zipfile.ZipFile(caminho_zip, 'r') as zip_ref:
+        return _extrair_membros(zip_ref, nomes, pasta_destino)
+
+def dividir_membros(membros, partes):
+    """
+    Divide os membros em 'partes' lotes de tamanho comprimido parecido
+    (maiores primeiro, sempre no lote mais leve)
+    """
+    lotes = [[] for _ in range(partes)]
+    pesos = [0] * partes
+    for info in sorted(membros, key=lambda i: i.compress_size, reverse=True):
+        indice = pesos.index(min(pesos))
+        lotes[indice].append(info.filename)
+        pesos[indice] += info.compress_size + 512  # custo fixo por arquivo
+    return [lote for lote in lotes if lote]
+
+def extrair(origem_zip, pasta_destino, max_workers=None, min_membros_paralelo=None, digests=None, pool=None):
+    """
+    Extrai um ZIP lendo o diretório central uma única vez e distribuindo os
+    membros entre um pool de processos, cada um com seu próprio ZipFile.
+    ZIPs pequenos, ou em memória (BytesIO), são extraídos no próprio processo.
+    Valida todos os caminhos (zip-slip) antes de gravar qualquer arquivo.
+    'pool' (PoolExtracao) é o pool da execução; sem ele, um pool temporário
+    é criado só para este ZIP.
+    Retorna a lista de ZipInfo dos membros extraídos; se 'digests' (dict) for
+    informado, recebe o MD5 de cada membro.
+    """
+    max_workers = pool.max_workers if pool else (max_workers or get_max_workers())
+    if min_membros_paralelo is None:
+        min_membros_paralelo = get_min_membros_paralelo()
+    em_memoria = not isinstance(origem_zip, (str, os.PathLike))
+
+    with zipfile.ZipFile(origem_zip, 'r') as zip_ref:
+        membros = zip_ref.infolist()
+        for info in membros:
+            caminho_seguro(pasta_destino, info.filename)
+
+        arquivos = [info for info in membros if not info.is_dir()]
+        workers = min(max_workers, len(arquivos) // max(1, min_membros_paralelo // 2) or 1)
+        if em_memoria or workers <= 1 or len(arquivos) < min_membros_paralelo:
+            resultado = _extrair_membros(zip_ref, membros, pasta_destino)
+            if digests is not None:
+                digests.update(resultado)
+            return membros
+
+    # Diretórios primeiro, no processo atual; arquivos divididos entre os workers
+    for info in membros:
+        if info.is_dir():
+            os.makedirs(caminho_seguro(pasta_destino, info.filename), exist_ok=True)
+
+    lotes = dividir_membros(arquivos, workers)
+    logger.debug("Extraindo %d membro(s) de '%s' com %d processo(s)", len(arquivos), origem_zip, len(lotes))
+    if pool is None:
+        with PoolExtracao(max_workers=len(lotes)) as pool_temporario:
+            _extrair_em_lotes(pool_temporario, origem_zip, lotes, pasta_destino, digests)
+    else:
+        _extrair_em_lotes(pool, origem_zip, lotes, pasta_destino, digests)
+    return membros
+
+def _extrair_em_lotes(pool, origem_zip, lotes, pasta_destino, digests):
+    executor = pool.executor()
+    try:
+        futuros = [executor.submit(_worker_extrair, os.fspath(origem_zip), lote, pasta_destino) for lote in lotes]
+        for futuro in futuros:
+            resultado = futuro.result()
+            if digests is not None:
+                digests.update(resultado)
+    except BrokenProcessPool:
+        pool.descartar(executor)
+        raise